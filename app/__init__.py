@@ -6,15 +6,16 @@ from flask_login import LoginManager
 from dotenv import load_dotenv
 from flask_migrate import Migrate
 from flask_mailman import Mail
-from datetime import timedelta
 
 # from flask_wtf import CSRFProtect
 import os
 
 load_dotenv()
 
+from .utils.database import RoutingSession
+
 # Initialize extensions (not yet bound to app)
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})  # replica routing, see utils/database.py
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 migrate = Migrate()
@@ -29,21 +30,125 @@ BASE_DIR = os.getcwd()
 UPLOAD_PATH = os.path.join(BASE_DIR, "uploads", "papers")
 ALLOWED_EXTENSIONS = [".pdf", ".docx"]
 
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__)
 
-    # Core settings
-    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev_secret_key")
-      
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///site.db")
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Core, database and session settings: a profile from config.py
+    from config import CONFIGS
+    config_name = config_name or os.getenv("APP_CONFIG", "default")
+    if config_name not in CONFIGS:
+        raise RuntimeError(f"Unknown APP_CONFIG {config_name!r} (choose from {', '.join(CONFIGS)})")
+    app.config.from_object(CONFIGS[config_name])
+    if not app.config["SECRET_KEY"]:
+        raise RuntimeError(f"SECRET_KEY must be set for the {config_name!r} profile")
 
     # Upload settings
     app.config["UPLOAD_PATH"] = UPLOAD_PATH
     app.config["UPLOAD_EXTENSIONS"] = ALLOWED_EXTENSIONS
-    app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10 MB
+    app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10 MB per request (form post or one chunk)
+    app.config["MAX_PAPER_SIZE"] = 200 * 1024 * 1024     # 200 MB via the chunked upload API
+    app.config["UPLOAD_CHUNK_SIZE"] = 5 * 1024 * 1024    # suggested chunk size for clients
+    app.config["UPLOAD_SESSION_TTL_HOURS"] = 24          # `flask storage clean-uploads` age limit
     os.makedirs(UPLOAD_PATH, exist_ok=True)
 
+    # Where stored files live (see utils/file_store.py): "local" (UPLOAD_PATH) or "s3"
+    app.config["FILE_STORE_BACKEND"] = os.getenv("FILE_STORE_BACKEND", "local")
+    app.config["FILE_STORE_S3_BUCKET"] = os.getenv("FILE_STORE_S3_BUCKET", "")
+    app.config["FILE_STORE_S3_PREFIX"] = os.getenv("FILE_STORE_S3_PREFIX", "papers/")
+    app.config["FILE_STORE_S3_ENDPOINT"] = os.getenv("FILE_STORE_S3_ENDPOINT", "")  # e.g. MinIO
+    app.config["FILE_STORE_S3_REGION"] = os.getenv("FILE_STORE_S3_REGION", "")
+    app.config["FILE_STORE_S3_URL_EXPIRES"] = 300  # seconds a presigned download link works
+
+    # File delivery: "x-accel" (nginx) / "x-sendfile" (Apache) hand the bytes to the web server
+    app.config["SENDFILE_MODE"] = os.getenv("SENDFILE_MODE", "")
+    app.config["X_ACCEL_PREFIX"] = os.getenv("X_ACCEL_PREFIX", "/protected-papers/")
+    app.config["USE_X_SENDFILE"] = app.config["SENDFILE_MODE"] == "x-sendfile"
+    app.config["PAPER_CACHE_MAX_AGE"] = 365 * 24 * 3600   # stored files never change
+
+    # Behind nginx/a load balancer: how many proxies in front of the app to trust for
+    # X-Forwarded-For/-Proto/-Host (0 = none). Without it request.remote_addr is the
+    # proxy's address and every client shares one rate-limit bucket.
+    app.config["PROXY_FIX_X_FOR"] = int(os.getenv("PROXY_FIX_X_FOR", "0"))
+    app.config["PROXY_FIX_X_PROTO"] = int(os.getenv("PROXY_FIX_X_PROTO", os.getenv("PROXY_FIX_X_FOR", "0")))
+    app.config["PROXY_FIX_X_HOST"] = int(os.getenv("PROXY_FIX_X_HOST", "0"))
+
+    # Search settings ("auto" picks FTS5 on SQLite, FULLTEXT on MySQL)
+    app.config["SEARCH_BACKEND"] = os.getenv("SEARCH_BACKEND", "auto")
+
+    # Job queue for slow side-effects (see utils/jobs.py)
+    app.config["JOBS_MODE"] = os.getenv("JOBS_MODE", "embedded")  # "external" / "inline"
+    app.config["JOB_WORKER_THREADS"] = 2
+    app.config["JOB_POLL_SECONDS"] = 1.0
+    app.config["JOB_MAX_ATTEMPTS"] = 5
+    app.config["JOB_BACKOFF_SECONDS"] = 10        # doubled per failed attempt...
+    app.config["JOB_BACKOFF_MAX_SECONDS"] = 3600  # ...up to this
+    app.config["JOB_LOCK_TIMEOUT_SECONDS"] = 900  # "running" longer than this = worker died
+    app.config["EXTRACTION_MAX_PAGES"] = 200
+
+    # Preview derivatives (first pages, downsampled images), keyed by content hash
+    app.config["DERIVATIVE_PATH"] = os.path.join(BASE_DIR, "uploads", "derived")
+    app.config["PREVIEW_PAGES"] = 3
+    app.config["PREVIEW_MAX_IMAGE_PX"] = 1200
+    app.config["PREVIEW_HTML_MAX_CHARS"] = 200_000  # DOCX previews are cut off after this
+
+    # Listing pagination: "keyset" (cursor, no OFFSET) or "offset" (page numbers)
+    app.config["PAGINATION_MODE"] = os.getenv("PAGINATION_MODE", "keyset")
+    app.config["PAGINATION_SHOW_TOTALS"] = True
+    app.config["PAGINATION_COUNT_CAP"] = 1000   # totals above this show as "1,000+"
+
+    # Subject/year filter dropdowns (see utils/facets.py)
+    app.config["FACET_MAX_OPTIONS"] = 200       # per dropdown
+    app.config["FACET_SEARCH_CAP"] = 1000       # search-narrowed counts cover this many hits
+
+    # Search box typeahead (see utils/suggest.py)
+    app.config["SUGGEST_REFRESH_SECONDS"] = 300  # background reload for other workers' uploads; 0 = never
+    app.config["SUGGEST_MAX_RESULTS"] = 10
+
+    # Response cache for anonymous public pages (see utils/response_cache.py)
+    app.config["RESPONSE_CACHE_ENABLED"] = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+    app.config["RESPONSE_CACHE_BACKEND"] = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # or "redis"
+    app.config["RESPONSE_CACHE_URL"] = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+    app.config["RESPONSE_CACHE_TTL"] = 300          # seconds; bounds staleness across workers
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"] = 512  # memory backend, per process
+
+    # Buffered download/view counters (see utils/counters.py); 0 = write immediately
+    app.config["COUNTER_FLUSH_SECONDS"] = float(os.getenv("COUNTER_FLUSH_SECONDS", "10"))
+    app.config["COUNTER_FLUSH_BATCH"] = 500   # papers per upsert statement
+
+    # JSON API (/api/v1, see app/api/routes.py)
+    app.config["API_MAX_PER_PAGE"] = 100
+    app.config["API_GZIP_MIN_BYTES"] = 1024     # smaller bodies aren't worth compressing
+
+    # SQL query budgets (see utils/query_budget.py); strict mode raises instead of logging
+    app.config["SQL_QUERY_BUDGETS"] = {}
+    app.config["SQL_QUERY_BUDGET_STRICT"] = os.getenv("SQL_QUERY_BUDGET_STRICT") == "1"
+
+    # Request/SQL metrics at /admin/metrics (see utils/metrics.py)
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "1") == "1"
+    app.config["METRICS_SLOW_QUERY_SECONDS"] = float(os.getenv("METRICS_SLOW_QUERY_SECONDS", "0.5"))  # logged with SQL
+    app.config["METRICS_LATENCY_BUCKETS"] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+
+    # Logged-in user cache (see utils/user_cache.py); 0 disables it
+    app.config["USER_CACHE_TTL"] = 60            # seconds a role/ban change may lag in other workers
+    app.config["USER_CACHE_MAX_ENTRIES"] = 10000
+
+    # Password hashing (see utils/passwords.py); login rehashes when the cost changes
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+    app.config["PASSWORD_HASH_THREADS"] = 2       # concurrent bcrypt calls per process
+    app.config["PASSWORD_HASH_MAX_PENDING"] = 32  # waiting beyond this answers 503
+    app.config["PASSWORD_HASH_TIMEOUT"] = 10      # seconds
+
+    # Rate limits (see utils/rate_limit.py): name -> {"ip"/"account": (capacity, seconds)}
+    app.config["RATE_LIMIT_ENABLED"] = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+    app.config["RATE_LIMIT_BACKEND"] = os.getenv("RATE_LIMIT_BACKEND", "memory")  # or "redis"
+    app.config["RATE_LIMIT_URL"] = os.getenv("RATE_LIMIT_URL", "redis://localhost:6379/1")
+    app.config["RATE_LIMIT_MAX_KEYS"] = 100_000   # memory backend, per process
+    app.config["RATE_LIMITS"] = {
+        "login": {"ip": (20, 60), "account": (5, 300)},        # bcrypt per attempt
+        "reset": {"ip": (5, 3600), "account": (3, 3600)},      # sends mail
+        "download": {"ip": (120, 60), "account": (60, 60)},    # bandwidth
+    }
+
     # Mail settings
     app.config["MAIL_SERVER"] = "smtp.gmail.com"
     app.config["MAIL_PORT"] = 587
@@ -51,17 +156,21 @@ def create_app():
     app.config["MAIL_USERNAME"] = os.environ.get("EMAIL_USER")
     app.config["MAIL_PASSWORD"] = os.environ.get("EMAIL_PASS")
     app.config["MAIL_BACKEND"] = "console"
-    
-    # Security & session settings
-    app.config["SESSION_COOKIE_HTTPONLY"] = True
-    app.config["SESSION_COOKIE_SECURE"] = True        # requires HTTPS
-    app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 
-    app.config["REMEMBER_COOKIE_HTTPONLY"] = True
-    app.config["REMEMBER_COOKIE_SECURE"] = True       # requires HTTPS
+    # Real client address/scheme from trusted proxies (PROXY_FIX_* above)
+    if app.config["PROXY_FIX_X_FOR"] or app.config["PROXY_FIX_X_PROTO"] or app.config["PROXY_FIX_X_HOST"]:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app,
+            x_for=app.config["PROXY_FIX_X_FOR"],
+            x_proto=app.config["PROXY_FIX_X_PROTO"],
+            x_host=app.config["PROXY_FIX_X_HOST"],
+        )
+
+    # Pool options and the replica bind, from the profile's DB_* settings
+    from .utils.database import configure_engines
+    configure_engines(app)
 
-    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=30)
-    
     # Initialize extensions
     db.init_app(app)
     bcrypt.init_app(app)
@@ -70,20 +179,60 @@ def create_app():
     mail.init_app(app)
     # csrf.init_app(app)
 
-    # User loader
+    # User loader (cached; see utils/user_cache.py)
     @login_manager.user_loader
     def load_user(user_id):
-        from .models import User
-        return User.query.get(int(user_id))
+        from .utils.user_cache import load_cached_user
+        return load_cached_user(user_id)
 
     # Register blueprints
     from .auth import auth as auth_blueprint
     from .main import main as main_blueprint
     from .admin import admin as admin_blueprint
+    from .api import api as api_blueprint
 
     app.register_blueprint(auth_blueprint)
     app.register_blueprint(main_blueprint)
     app.register_blueprint(admin_blueprint, url_prefix="/admin")
+    app.register_blueprint(api_blueprint, url_prefix="/api/v1")
+
+    # Browsers that just wrote read from the primary for a few seconds
+    from .utils.database import init_replica_routing
+    init_replica_routing(app)
+
+    # Per-request SQL statement accounting
+    from .utils.query_budget import init_query_budget
+    init_query_budget(app)
+
+    # Request latency, SQL timing and byte counters
+    from .utils.metrics import init_metrics
+    init_metrics(app)
+
+    # Job queue: hand committed jobs to the worker
+    from .utils.jobs import init_jobs
+    init_jobs(app)
+
+    # Response cache generation bumps after paper commits
+    from .utils.response_cache import init_response_cache
+    init_response_cache(app)
+
+    # Typeahead index, loaded and refreshed in the background once serving
+    from .utils.suggest import init_suggest
+    init_suggest(app)
+
+    # CLI commands
+    from .utils.search import search_cli
+    from .utils.storage import storage_cli
+    from .utils.facets import facets_cli
+    from .utils.jobs import jobs_cli
+    from .utils.importer import import_papers_command
+    from .utils.passwords import passwords_cli
+    app.cli.add_command(search_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(facets_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(import_papers_command)
+    app.cli.add_command(passwords_cli)
     
     # Custom error handler for CSRF errors
     from flask_wtf.csrf import CSRFError
@@ -93,4 +242,17 @@ def create_app():
         flash("Your session expired or the form was invalid. Please try again.", "danger")
         return render_template("errors/403.html"), 403
 
+    # Rate limit hit: 429 with Retry-After
+    from .utils.rate_limit import RateLimited, rate_limited_response
+    app.register_error_handler(RateLimited, rate_limited_response)
+
+    # Password hashing pool saturated (login bursts)
+    from .utils.passwords import PasswordHasherBusy
+    @app.errorhandler(PasswordHasherBusy)
+    def handle_hasher_busy(e):
+        from flask import render_template
+        response = app.make_response((render_template("errors/503.html"), 503))
+        response.headers["Retry-After"] = "5"
+        return response
+
     return app
@@ -1,24 +1,35 @@
 # app/admin/routes.py
-from flask import render_template, request, url_for, redirect, flash, abort, current_app # ✅ import current_app
+from flask import render_template, request, url_for, redirect, flash, abort, current_app, jsonify # ✅ import current_app
 from flask_login import login_required, current_user # ✅ import current_user
+from sqlalchemy.orm import joinedload # ✅ eager-load paper authors
 from .. import db # ✅ import db
-from ..models import User, Paper  # ✅ import User and Paper models
+from ..models import User, Paper, UploadSession  # ✅ import models
 from . import admin # admin Blueprint
 from ..utils.decorators import admin_required # ✅ import admin_required decorator
 from ..forms import ConfirmForm  # ✅ import ConfirmForm
+from ..utils.query_budget import query_budget # ✅ per-route SQL budget
+from ..utils.pagination import paginate_papers # ✅ keyset pagination for papers
+from ..utils.papers import remove_paper, remove_papers # ✅ file refs + search index bookkeeping
+from ..utils.jobs import enqueue # ✅ queue .part file removal
+from ..utils.user_cache import invalidate_user # ✅ drop cached login after role/ban changes
+from ..utils.response_cache import cache_stats # ✅ response cache hit/miss counters
+from ..utils.metrics import metrics_response # ✅ Prometheus metrics export
 
 # Admin dashboard: list users & papers (paginated)
 @admin.route("/dashboard")
 @login_required
 @admin_required
+@query_budget(6)
 def dashboard():
     # pagination params
     user_page = request.args.get("user_page", 1, type=int)
-    paper_page = request.args.get("paper_page", 1, type=int)
     per_page = 10
 
     users = User.query.order_by(User.id.asc()).paginate(page=user_page, per_page=per_page)
-    papers = Paper.query.order_by(Paper.uploaded_at.desc()).paginate(page=paper_page, per_page=per_page)
+    papers = paginate_papers(
+        Paper.query.options(joinedload(Paper.author)), per_page,
+        page_arg="paper_page", cursor_arg="paper_cursor"
+    )
 
     # single ConfirmForm instance used to render CSRF token for every row's form
     form = ConfirmForm()
@@ -43,6 +54,7 @@ def promote_user(user_id):
 
     user.role = "admin"
     db.session.commit()
+    invalidate_user(user.id)
     flash(f"{user.username} has been promoted to admin.", "success")
     return redirect(url_for("admin.dashboard"))
 
@@ -66,6 +78,7 @@ def demote_user(user_id):
 
     user.role = "user"
     db.session.commit()
+    invalidate_user(user.id)
     flash(f"{user.username} has been demoted to user.", "success")
     return redirect(url_for("admin.dashboard"))
 
@@ -81,6 +94,7 @@ def ban_user(user_id):
         return redirect(url_for("admin.dashboard"))
     user.is_banned = True
     db.session.commit()
+    invalidate_user(user.id)
     flash(f"User {user.username} has been banned.", "success")
     return redirect(url_for("admin.dashboard"))
 
@@ -94,6 +108,7 @@ def unban_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_banned = False
     db.session.commit()
+    invalidate_user(user.id)
     flash(f"User {user.username} has been unbanned.", "success")
     return redirect(url_for("admin.dashboard"))
 
@@ -112,19 +127,11 @@ def delete_user(user_id):
         flash("You cannot delete your own account.", "danger")
         return redirect(url_for("admin.dashboard"))
 
-    papers = Paper.query.filter_by(user_id=user.id).all()
-    for p in papers:
-        try:
-            import os
-            if p.file_path and os.path.exists(p.file_path):
-                os.remove(p.file_path)
-        except Exception:
-            pass
-        db.session.delete(p)
-
-    db.session.delete(user)
+    user_id, username = user.id, user.username
+    _delete_users([user_id])
     db.session.commit()
-    flash(f"User {user.username} and their papers have been deleted.", "success")
+    invalidate_user(user_id)
+    flash(f"User {username} and their papers have been deleted.", "success")
     return redirect(url_for("admin.dashboard"))
 
 
@@ -138,14 +145,103 @@ def delete_paper_admin(paper_id):
         return redirect(url_for("admin.dashboard"))
 
     paper = Paper.query.get_or_404(paper_id)
-    try:
-        import os
-        if paper.file_path and os.path.exists(paper.file_path):
-            os.remove(paper.file_path)
-    except Exception:
-        pass
-
-    db.session.delete(paper)
+    remove_paper(paper)
     db.session.commit()
     flash("Paper deleted successfully.", "success")
     return redirect(url_for("admin.dashboard"))
+
+
+# ------------------------------------------
+# Bulk actions: one UPDATE/DELETE ... WHERE id IN (...) per action
+# ------------------------------------------
+USER_ACTIONS = ("promote", "demote", "ban", "unban", "delete")
+
+
+def _delete_users(user_ids):
+    """Delete users with their papers and unfinished uploads; caller commits."""
+    paper_ids = [row.id for row in db.session.query(Paper.id).filter(Paper.user_id.in_(user_ids))]
+    papers = remove_papers(paper_ids) if paper_ids else 0
+
+    uploads = [row.id for row in db.session.query(UploadSession.id).filter(UploadSession.user_id.in_(user_ids))]
+    if uploads:
+        UploadSession.query.filter(UploadSession.id.in_(uploads)).delete(synchronize_session=False)
+        enqueue("remove_upload_parts", uploads)
+
+    users = User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    return users, papers
+
+
+@admin.route("/bulk/users", methods=["POST"])
+@login_required
+@admin_required
+def bulk_users():
+    form = ConfirmForm()
+    if not form.validate_on_submit():
+        flash("Invalid request (CSRF).", "danger")
+        return redirect(url_for("admin.dashboard"))
+
+    action = request.form.get("action")
+    user_ids = set(request.form.getlist("user_ids", type=int))
+    user_ids.discard(current_user.id)  # never act on your own account in bulk
+    if action not in USER_ACTIONS or not user_ids:
+        flash("Select at least one other user and an action.", "warning")
+        return redirect(url_for("admin.dashboard"))
+
+    selected = User.query.filter(User.id.in_(user_ids))
+    if action == "delete":
+        users, papers = _delete_users(user_ids)
+        message = f"Deleted {users} users and {papers} papers."
+    else:
+        if action == "promote":
+            count = selected.filter(User.role != "admin").update({User.role: "admin"}, synchronize_session=False)
+        elif action == "demote":
+            count = selected.filter(User.role == "admin").update({User.role: "user"}, synchronize_session=False)
+        elif action == "ban":  # admins can't be banned
+            count = selected.filter(User.role != "admin", User.is_banned.isnot(True)).update(
+                {User.is_banned: True}, synchronize_session=False
+            )
+        else:
+            count = selected.filter(User.is_banned.is_(True)).update({User.is_banned: False}, synchronize_session=False)
+        message = f"{action.capitalize()}: {count} of {len(user_ids)} selected users updated."
+
+    db.session.commit()
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    flash(message, "success")
+    return redirect(url_for("admin.dashboard"))
+
+
+@admin.route("/bulk/papers", methods=["POST"])
+@login_required
+@admin_required
+def bulk_papers():
+    form = ConfirmForm()
+    if not form.validate_on_submit():
+        flash("Invalid request (CSRF).", "danger")
+        return redirect(url_for("admin.dashboard"))
+
+    paper_ids = set(request.form.getlist("paper_ids", type=int))
+    if request.form.get("action") != "delete" or not paper_ids:
+        flash("Select at least one paper and an action.", "warning")
+        return redirect(url_for("admin.dashboard"))
+
+    count = remove_papers(paper_ids)
+    db.session.commit()
+    flash(f"Deleted {count} papers.", "success")
+    return redirect(url_for("admin.dashboard"))
+
+
+# Response cache counters for this worker (see utils/response_cache.py)
+@admin.route("/cache")
+@login_required
+@admin_required
+def response_cache_stats():
+    return jsonify(cache_stats())
+
+
+# Prometheus metrics for this worker (see utils/metrics.py)
+@admin.route("/metrics")
+@login_required
+@admin_required
+def metrics():
+    return metrics_response()
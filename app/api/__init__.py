@@ -0,0 +1,6 @@
+# app/api/__init__.py
+from flask import Blueprint
+
+api = Blueprint("api", __name__)
+
+from . import routes  # noqa: F401
@@ -0,0 +1,205 @@
+# app/api/routes.py
+"""
+Versioned JSON API (mounted at /api/v1) for the mobile client.
+
+    GET /api/v1/papers           same filters as main.papers: q, subject, year,
+                                 sort=popular, cursor / page, per_page, fields
+    GET /api/v1/papers/<id>      one paper (login required, like view_paper)
+
+`fields=title,year,...` limits both the JSON and the columns loaded.
+Every response carries a weak ETag over its body, so a client that sends
+If-None-Match for an unchanged page gets an empty 304. Bodies above
+API_GZIP_MIN_BYTES are gzipped for clients that accept it.
+"""
+import gzip
+
+from flask import current_app, jsonify, request, url_for
+from flask_login import login_required
+from sqlalchemy.orm import joinedload, load_only
+from werkzeug.exceptions import HTTPException
+
+from . import api
+from .. import login_manager
+from ..models import Paper
+from ..utils.counters import paginate_popular
+from ..utils.facets import filter_by_facets
+from ..utils.pagination import paginate_papers
+from ..utils.query_budget import query_budget
+from ..utils.search import get_search_backend
+
+# 401 JSON instead of a redirect to the login page
+login_manager.blueprint_login_views["api"] = None
+
+
+# -------------------------
+# Fields
+# -------------------------
+def _urls(paper):
+    return {
+        "view": url_for("main.view_paper", paper_id=paper.id),
+        "download": url_for("main.download", paper_id=paper.id),
+        "preview": url_for("main.preview", paper_id=paper.id),
+    }
+
+
+# field -> (serializer, columns it needs)
+FIELDS = {
+    "id": (lambda p: p.id, []),
+    "title": (lambda p: p.title, [Paper.title]),
+    "subject": (lambda p: p.subject, [Paper.subject]),
+    "year": (lambda p: p.year, [Paper.year]),
+    "uploaded_at": (lambda p: p.uploaded_at.isoformat(), []),
+    "author": (lambda p: p.author.username, [Paper.user_id]),
+    "filename": (lambda p: p.download_name(), [Paper.original_filename, Paper.file_path]),
+    "text_status": (lambda p: p.text_status, [Paper.text_status]),
+    "urls": (_urls, []),
+}
+DETAIL_FIELDS = dict(FIELDS, pages=(lambda p: p.pages.count() if p.text_status == "done" else 0, [Paper.text_status]))
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(available):
+    """Requested fields (all of them by default); `id` is always included."""
+    raw = request.args.get("fields")
+    if not raw:
+        return list(available)
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    return ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+
+
+def load_options(fields, available):
+    """Only load the columns (and author join) the chosen fields need."""
+    columns = [Paper.id, Paper.uploaded_at]  # keyset cursors need both
+    for name in fields:
+        columns.extend(available[name][1])
+    options = [load_only(*dict.fromkeys(columns))]
+    if "author" in fields:
+        options.append(joinedload(Paper.author))
+    return options
+
+
+def paper_json(paper, fields, available):
+    return {name: available[name][0](paper) for name in fields}
+
+
+# -------------------------
+# Responses
+# -------------------------
+def error(message, status):
+    return jsonify(error=message), status
+
+
+def conditional_json(payload):
+    """JSON with a weak ETag; 304 when the client already has this body."""
+    response = jsonify(payload)
+    response.add_etag(weak=True)  # weak: the gzipped and plain bodies share it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@api.after_request
+def compress(response):
+    response.vary.add("Accept-Encoding")
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+        or request.accept_encodings["gzip"] <= 0
+    ):
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config["API_GZIP_MIN_BYTES"]:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@api.errorhandler(HTTPException)
+def http_error(exc):
+    return error(exc.description, exc.code)
+
+
+# -------------------------
+# Endpoints
+# -------------------------
+@api.route("/papers")
+@query_budget(4)
+def list_papers():
+    """Paginated papers, filtered like main.papers"""
+    try:
+        fields = parse_fields(FIELDS)
+    except FieldError as exc:
+        return error(str(exc), 400)
+
+    per_page = request.args.get("per_page", 20, type=int)
+    per_page = max(1, min(per_page, current_app.config["API_MAX_PER_PAGE"]))
+    q = request.args.get("q")
+    subject = request.args.get("subject")
+    year = request.args.get("year")
+    sort = request.args.get("sort")
+    if sort not in (None, "", "popular"):
+        return error(f"Unknown sort: {sort}", 400)
+
+    query = filter_by_facets(Paper.query.options(*load_options(fields, FIELDS)), subject, year)
+    if q:
+        query = get_search_backend().search(query, q)
+    if sort == "popular":
+        results = paginate_popular(query, per_page)
+    else:
+        results = paginate_papers(query, per_page, ranked=bool(q))
+
+    filters = {
+        key: value for key, value in (("q", q), ("subject", subject), ("year", year), ("sort", sort)) if value
+    }
+    if request.args.get("fields"):
+        filters["fields"] = request.args["fields"]
+    filters["per_page"] = per_page
+
+    if getattr(results, "cursor_mode", False):
+        meta = {
+            "total": results.total,
+            "total_capped": results.total_capped,
+            "next_cursor": results.next_cursor,
+            "prev_cursor": results.prev_cursor,
+        }
+        links = {
+            "next": url_for("api.list_papers", cursor=results.next_cursor, **filters) if results.has_next else None,
+            "prev": url_for("api.list_papers", cursor=results.prev_cursor, **filters) if results.has_prev else None,
+        }
+    else:  # relevance-ranked search results and sort=popular use page numbers
+        meta = {"total": results.total, "page": results.page, "pages": results.pages}
+        links = {
+            "next": url_for("api.list_papers", page=results.next_num, **filters) if results.has_next else None,
+            "prev": url_for("api.list_papers", page=results.prev_num, **filters) if results.has_prev else None,
+        }
+
+    return conditional_json({
+        "data": [paper_json(paper, fields, FIELDS) for paper in results.items],
+        "meta": meta,
+        "links": links,
+    })
+
+
+@api.route("/papers/<int:paper_id>")
+@login_required
+@query_budget(3)
+def get_paper(paper_id):
+    """One paper, like main.view_paper"""
+    try:
+        fields = parse_fields(DETAIL_FIELDS)
+    except FieldError as exc:
+        return error(str(exc), 400)
+
+    paper = Paper.query.options(*load_options(fields, DETAIL_FIELDS)).filter_by(id=paper_id).first()
+    if paper is None:
+        return error("Paper not found.", 404)
+    return conditional_json({"data": paper_json(paper, fields, DETAIL_FIELDS)})
@@ -1,9 +1,10 @@
 # app/auth/routes.py
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from .. import db, bcrypt
+from .. import db
 from ..models import User
 from .forms import LoginForm, RegistrationForm
+from ..utils.rate_limit import form_email, rate_limit
 from . import auth
  
 # Create the blueprint for authentication
@@ -20,16 +21,13 @@ def register():
 
     form = RegistrationForm()
     if form.validate_on_submit():
-        # Hash the password
-        hashed_pw = bcrypt.generate_password_hash(form.password.data).decode("utf-8")
-
         # Create new user instance
         user = User(
             username=form.username.data,
             email=form.email.data,
-            password_hash=hashed_pw,
             role=form.role.data   # ✅ save role from form
         )
+        user.set_password(form.password.data)  # ✅ hashed on the bcrypt pool
 
         # Save user to database
         db.session.add(user)
@@ -47,6 +45,7 @@ def register():
 # 🔹 Login Route
 # ---------------------------
 @auth.route("/login", methods=["GET", "POST"])
+@rate_limit("login", account=form_email, methods=("POST",))  # ✅ per IP and per email
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("main.dashboard"))
@@ -56,8 +55,8 @@ def login():
         # Check if user exists
         user = User.query.filter_by(email=form.email.data).first()
 
-        # Verify password
-        if user and bcrypt.check_password_hash(user.password_hash, form.password.data):
+        # Verify password (rehashed if the bcrypt cost changed since it was stored)
+        if user and user.check_and_upgrade_password(form.password.data):
     
             # 🚨 Check if user is banned BEFORE login
             if user.is_banned:
@@ -65,6 +64,8 @@ def login():
                 return redirect(url_for("auth.login"))
 
             # ✅ Log user in only if not banned
+            if db.session.dirty:
+                db.session.commit()  # upgraded password hash
             login_user(user, remember=form.remember.data)
 
             # ✅ Flash success message after login
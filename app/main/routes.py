@@ -1,20 +1,35 @@
 # app/main/routes.py
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, send_from_directory, current_app
+    flash, current_app, abort, make_response, jsonify
 )
 from flask_login import login_required, current_user
-from flask_mailman import EmailMessage
 import os
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from . import main
 from .. import db
 from ..models import Paper
 from ..utils.decorators import admin_required
+from ..utils.search import get_search_backend
+from ..utils.query_budget import query_budget
+from ..utils.database import read_replica
+from ..utils.pagination import paginate_papers
+from ..utils.facets import facet_counts, filter_by_facets
+from ..utils.suggest import get_suggest_index
+from ..utils.response_cache import cached_response
+from ..utils.emails import queue_email
+from ..utils.storage import store_upload
+from ..utils.papers import add_paper, remove_paper
+from ..utils.delivery import send_paper, send_derivative
+from ..utils.user_cache import invalidate_user
+from ..utils.rate_limit import form_email, logged_in_user, rate_limit
+from ..utils.counters import count_download, count_view, paginate_popular, paper_counts
+from ..utils.derivatives import PREVIEW_HTML, PREVIEW_PDF, get_preview, preview_failed, preview_name
 from ..forms import PaperUploadForm, ConfirmForm  # ✅ import forms
 from app.forms import RequestResetForm, ResetPasswordForm
 from app.models import User
-from app import bcrypt, db, mail 
+from app import db, mail 
 
 # -------------------------
 # Helpers
@@ -29,36 +44,52 @@ def is_allowed(filename):
 # -------------------------
 
 @main.route("/")
+@cached_response()
 def home():
     """Public home page"""
     return render_template("home.html")
 
 @main.route("/dashboard")
 @login_required
+@query_budget(6)
+@read_replica
 def dashboard():
     """Student dashboard - shows all papers with search, filter, and pagination"""
 
-    page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 5, type=int)
     if per_page < 1:
         per_page = 5
+    per_page = min(per_page, 50)
 
-    query = Paper.query
+    # load authors in the same query - every card shows paper.author.username
+    query = Paper.query.options(joinedload(Paper.author))
 
     search = request.args.get("q")
     subject = request.args.get("subject")
     year = request.args.get("year")
 
+    # exact matches - the values come from the facet dropdowns
+    query = filter_by_facets(query, subject, year)
+
+    # Full-text search ranks by relevance (page numbers); plain listing is
+    # newest first with keyset cursors
     if search:
-        query = query.filter(Paper.title.ilike(f"%{search}%"))
-    if subject:
-        query = query.filter(Paper.subject.ilike(f"%{subject}%"))
-    if year:
-        query = query.filter(Paper.year == year)
+        query = get_search_backend().search(query, search)
+    papers = paginate_papers(query, per_page, ranked=bool(search))
+
+    # only the latest 5 of the user's uploads, not the whole relationship
+    recent_papers = (
+        Paper.query.filter_by(user_id=current_user.id)
+        .order_by(Paper.uploaded_at.desc())
+        .limit(5)
+        .all()
+    )
 
-    papers = query.order_by(Paper.uploaded_at.desc()).paginate(page=page, per_page=per_page)
+    facets = facet_counts(subject, year, search)
 
-    return render_template("dashboard.html", user=current_user, papers=papers)
+    return render_template(
+        "dashboard.html", user=current_user, papers=papers, recent_papers=recent_papers, facets=facets
+    )
 
 
 # -------------------------
@@ -77,23 +108,16 @@ def upload():
             flash("Invalid file type. Only PDF and DOCX are allowed.", "danger")
             return redirect(request.url)
 
-        upload_path = current_app.config["UPLOAD_PATH"]
-        os.makedirs(upload_path, exist_ok=True)
+        # Stream into content-addressed storage (identical files are stored once)
+        stored = store_upload(uploaded.stream, os.path.splitext(filename)[1])
 
-        filepath = os.path.join(upload_path, filename)
-        uploaded.save(filepath)
-
-        # Save only filename in DB, not full path
-        new_paper = Paper(
+        add_paper(
+            stored, filename,
             title=form.title.data,
             subject=form.subject.data,
-            year=form.year.data or None,
-            file_path=filename,  # ✅ store only filename
+            year=form.year.data,
             user_id=current_user.id
         )
-
-        db.session.add(new_paper)
-        db.session.commit()
         flash("Paper uploaded successfully!", "success")
         return redirect(url_for("main.dashboard"))
 
@@ -105,11 +129,14 @@ def upload():
 # -------------------------
 @main.route("/download/<int:paper_id>")
 @login_required
+@rate_limit("download", account=logged_in_user)
 def download(paper_id):
     """Download an uploaded paper"""
     paper = Paper.query.get_or_404(paper_id)
-    upload_path = current_app.config["UPLOAD_PATH"]
-    return send_from_directory(upload_path, paper.file_path, as_attachment=True)
+    response = send_paper(paper, as_attachment=True)
+    if response.status_code != 304:  # a revalidation isn't another download
+        count_download(paper.id)
+    return response
 
 
 # -------------------------
@@ -120,13 +147,46 @@ def download(paper_id):
 def preview(paper_id):
     """Preview an uploaded paper (PDFs/images inline, others download)"""
     paper = Paper.query.get_or_404(paper_id)
-    upload_path = current_app.config["UPLOAD_PATH"]
+    return send_paper(paper, as_attachment=False)
+
+
+@main.route("/preview/<int:paper_id>/pages")
+@login_required
+def preview_pages(paper_id):
+    """Lightweight first-pages preview; falls back to the full file until it's built"""
+    paper = Paper.query.get_or_404(paper_id)
+    path = get_preview(paper) if preview_name(paper) == PREVIEW_PDF else None
+    if path is None:
+        return redirect(url_for("main.preview", paper_id=paper.id))
+    etag = f"{paper.file_hash}-p{current_app.config['PREVIEW_PAGES']}"
+    return send_derivative(path, etag, "application/pdf")
 
-    return send_from_directory(
-        upload_path,
-        paper.file_path,
-        as_attachment=False
-    )
+
+# Rendered from the upload, so never let it load or run anything
+DOCUMENT_PREVIEW_CSP = "default-src 'none'; style-src 'unsafe-inline'; frame-ancestors 'self'"
+
+
+@main.route("/preview/<int:paper_id>/document")
+@login_required
+def preview_document(paper_id):
+    """Cached HTML rendering of a DOCX paper (built once per file, in the background)"""
+    paper = Paper.query.get_or_404(paper_id)
+    if preview_name(paper) != PREVIEW_HTML:
+        abort(404)
+
+    path = get_preview(paper)
+    if path is None:
+        if preview_failed(paper) or not paper.file_hash:
+            message, refresh = "A preview isn't available for this file - please download it.", False
+        else:
+            message, refresh = "Preparing preview…", True
+        response = make_response(render_template("_preview_pending.html", message=message, refresh=refresh))
+        response.cache_control.no_store = True
+    else:
+        response = send_derivative(path, f"{paper.file_hash}-html", "text/html")
+    response.headers["Content-Security-Policy"] = DOCUMENT_PREVIEW_CSP
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
 
 
 # -------------------------
@@ -142,13 +202,7 @@ def delete_paper(paper_id):
         flash("You are not authorized to delete this file.", "danger")
         return redirect(url_for("main.dashboard"))
 
-    upload_path = current_app.config["UPLOAD_PATH"]
-    filepath = os.path.join(upload_path, paper.file_path)
-
-    if os.path.exists(filepath):
-        os.remove(filepath)
-
-    db.session.delete(paper)
+    remove_paper(paper)
     db.session.commit()
 
     flash("Paper deleted successfully!", "success")
@@ -159,32 +213,54 @@ def delete_paper(paper_id):
 # Global search
 # -------------------------
 @main.route("/papers")
+@cached_response(args=("q", "subject", "year", "sort", "page", "cursor"))
+@query_budget(6)
+@read_replica
 def papers():
     """Search and filter past papers with pagination"""
 
     query = request.args.get("q")
     subject_filter = request.args.get("subject")
     year_filter = request.args.get("year")
+    popular = request.args.get("sort") == "popular"
 
-    papers_query = Paper.query
+    papers_query = Paper.query.options(joinedload(Paper.author))
 
-    if query:
-        papers_query = papers_query.filter(
-            (Paper.title.ilike(f"%{query}%")) |
-            (Paper.subject.ilike(f"%{query}%")) |
-            (Paper.year.ilike(f"%{query}%"))
-        )
-    if subject_filter:
-        papers_query = papers_query.filter(Paper.subject.ilike(f"%{subject_filter}%"))
-    if year_filter:
-        papers_query = papers_query.filter(Paper.year == year_filter)
+    papers_query = filter_by_facets(papers_query, subject_filter, year_filter)
 
-    page = request.args.get("page", 1, type=int)
-    results = papers_query.order_by(Paper.uploaded_at.desc()).paginate(page=page, per_page=6)
+    # Title/subject/year search goes through the full-text index (ranked)
+    if query:
+        papers_query = get_search_backend().search(papers_query, query)
+    # "Most downloaded" replaces the relevance/newest order (page numbers, no cursor)
+    if popular:
+        results = paginate_popular(papers_query, 6)
+        downloads = results.downloads
+    else:
+        results = paginate_papers(papers_query, 6, ranked=bool(query))
+        downloads = {}
 
     # single ConfirmForm instance used to render CSRF token for every row's form
     confirm_form = ConfirmForm()
-    return render_template("papers.html", papers=results)
+    facets = facet_counts(subject_filter, year_filter, query)
+    return render_template("papers.html", papers=results, facets=facets, downloads=downloads)
+
+
+@main.route("/suggest")
+@query_budget(3)
+def suggest():
+    """Typeahead for the search box: subjects and titles starting with ?q="""
+    q = request.args.get("q", "")[:100]
+    limit = min(request.args.get("limit", 8, type=int), current_app.config["SUGGEST_MAX_RESULTS"])
+    kind = request.args.get("kind") if request.args.get("kind") in ("subject", "title") else None
+
+    matches = get_suggest_index().suggest(q, max(limit, 1), kind)
+    response = jsonify(
+        q=q,
+        suggestions=[{"text": text, "kind": k, "count": count} for k, text, count in matches],
+    )
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
 
 
 # -------------------------
@@ -192,14 +268,11 @@ def papers():
 # -------------------------
 @main.route("/my_papers")
 @login_required
+@query_budget(4)
+@read_replica
 def my_papers():
     """Show only the logged-in user's uploaded papers with pagination"""
-    page = request.args.get("page", 1, type=int)
-    papers = (
-        Paper.query.filter_by(user_id=current_user.id)
-        .order_by(Paper.uploaded_at.desc())
-        .paginate(page=page, per_page=5)
-    )
+    papers = paginate_papers(Paper.query.filter_by(user_id=current_user.id), 5)
 
     confirm_form = ConfirmForm()
     return render_template("my_papers.html", papers=papers, confirm_form=confirm_form)
@@ -210,17 +283,23 @@ def my_papers():
 # -------------------------
 @main.route("/view/<int:paper_id>")
 @login_required
+@query_budget(5)
+@read_replica
 def view_paper(paper_id):
     """Dedicated page to view a single paper with details + preview/download links"""
-    paper = Paper.query.get_or_404(paper_id)
-    return render_template("view_paper.html", paper=paper)
+    paper = Paper.query.options(joinedload(Paper.author)).get_or_404(paper_id)
+    page_count = paper.pages.count() if paper.text_status == "done" else 0
+    count_view(paper.id)
+    downloads, views = paper_counts(paper.id)
+    return render_template("view_paper.html", paper=paper, page_count=page_count, downloads=downloads, views=views)
 
 # -------------------------
 # Password Reset
 # -------------------------
 def send_reset_email(user):
     token = user.get_reset_token()
-    msg = EmailMessage(
+    # sent by the job worker; the caller commits
+    queue_email(
         subject="Password Reset Request",
         body=f'''To reset your password, visit the following link:
 {url_for('main.reset_token', token=token, _external=True)}
@@ -230,10 +309,10 @@ If you did not make this request then simply ignore this email.
         from_email="noreply@demo.com",
         to=[user.email]
     )
-    msg.send()
 
 # Request reset
 @main.route("/reset_password", methods=["GET", "POST"])
+@rate_limit("reset", account=form_email, methods=("POST",))
 def reset_request():
     if current_user.is_authenticated:
         return redirect(url_for("main.index"))
@@ -243,6 +322,7 @@ def reset_request():
         user = User.query.filter_by(email=form.email.data).first()
         if user:
             send_reset_email(user)
+            db.session.commit()
             flash("An email has been sent with instructions to reset your password.", "info")
             return redirect(url_for("auth.login"))
         else:
@@ -262,9 +342,9 @@ def reset_token(token):
 
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_pw = bcrypt.generate_password_hash(form.password.data).decode("utf-8")
-        user.password_hash = hashed_pw   # ✅ store in correct column
+        user.set_password(form.password.data)   # ✅ hashed on the bcrypt pool
         db.session.commit()
+        invalidate_user(user.id)
         flash("Your password has been updated! You can now log in.", "success")
         return redirect(url_for("auth.login"))
     return render_template("reset_token.html", form=form)
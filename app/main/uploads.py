@@ -0,0 +1,223 @@
+# app/main/uploads.py
+"""
+Resumable chunked upload API (JSON), for files too big for one form post.
+
+    POST   /uploads                   start  {title, subject, year, filename, size}
+    GET    /uploads/<id>              status -> {offset, size}
+    PUT    /uploads/<id>?offset=N     raw chunk body written at byte N
+    POST   /uploads/<id>/complete     turn the finished file into a Paper
+    DELETE /uploads/<id>              abort and discard
+
+Each chunk is streamed from the request into a file of its own, so a
+worker never holds more than CHUNK_SIZE bytes, and copied into the .part
+file only once its offset is claimed - a retried PUT racing the original
+can't overwrite bytes that were already hashed. A client that loses its
+connection asks GET /uploads/<id> for the last acknowledged offset and
+carries on from there.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from threading import Lock
+
+from flask import current_app, jsonify, request, url_for
+from flask_login import current_user, login_required
+from werkzeug.utils import secure_filename
+
+from . import main
+from .. import db
+from ..models import UploadSession
+from ..utils.papers import add_paper
+from ..utils.storage import CHUNK_SIZE, adopt_file, hash_file, part_path
+
+# Running SHA-256 per upload in this process: upload id -> (offset, hasher).
+# Chunks that land on another worker just mean we re-hash at finalize.
+_hashers = {}
+_hashers_lock = Lock()
+
+
+# -------------------------
+# Helpers
+# -------------------------
+def error(message, status):
+    return jsonify(error=message), status
+
+
+def get_own_session(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        return None
+    return upload
+
+
+def session_json(upload):
+    return {
+        "upload_id": upload.id,
+        "offset": upload.received,
+        "size": upload.total_size,
+        "chunk_size": current_app.config["UPLOAD_CHUNK_SIZE"],
+    }
+
+
+def splice(chunk_path, part, offset):
+    """Copy a received chunk into the .part file at `offset`."""
+    with open(chunk_path, "rb") as src, open(part, "r+b") as out:
+        out.seek(offset)
+        shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+
+def discard(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
+    try:
+        os.remove(part_path(upload.id))
+    except FileNotFoundError:
+        pass
+    db.session.delete(upload)
+
+
+# -------------------------
+# Routes
+# -------------------------
+@main.route("/uploads", methods=["POST"])
+@login_required
+def upload_start():
+    """Open an upload session and reserve its .part file."""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get("filename") or ""))
+    title = str(data.get("title") or "").strip()
+    subject = str(data.get("subject") or "").strip()
+    year = str(data.get("year") or "").strip() or None
+    size = data.get("size")
+
+    ext = os.path.splitext(filename)[1].lower()
+    if not filename or ext not in current_app.config["UPLOAD_EXTENSIONS"]:
+        return error("Invalid file type. Only PDF and DOCX are allowed.", 400)
+    if not title or len(title) > 150 or not subject or len(subject) > 100 or (year and len(year) > 10):
+        return error("Title and subject are required (max 150/100 characters).", 400)
+    if not isinstance(size, int) or size <= 0:
+        return error("File size is required.", 400)
+    if size > current_app.config["MAX_PAPER_SIZE"]:
+        return error("File is too large.", 413)
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex, user_id=current_user.id, filename=filename,
+        title=title, subject=subject, year=year, total_size=size, received=0,
+    )
+    open(part_path(upload.id), "wb").close()
+    with _hashers_lock:
+        _hashers[upload.id] = (0, hashlib.sha256())
+    db.session.add(upload)
+    db.session.commit()
+
+    response = jsonify(session_json(upload))
+    response.headers["Location"] = url_for("main.upload_status", upload_id=upload.id)
+    return response, 201
+
+
+@main.route("/uploads/<upload_id>", methods=["GET"])
+@login_required
+def upload_status(upload_id):
+    """Where to resume from."""
+    upload = get_own_session(upload_id)
+    if upload is None:
+        return error("Unknown upload.", 404)
+    return jsonify(session_json(upload))
+
+
+@main.route("/uploads/<upload_id>", methods=["PUT"])
+@login_required
+def upload_chunk(upload_id):
+    """Append one chunk. The offset must equal the bytes acknowledged so far."""
+    upload = get_own_session(upload_id)
+    if upload is None:
+        return error("Unknown upload.", 404)
+
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        offset = request.headers.get("Upload-Offset", type=int)
+    if offset != upload.received:
+        return jsonify(error="Offset mismatch.", offset=upload.received), 409
+
+    remaining = upload.total_size - offset
+    with _hashers_lock:
+        known_offset, hasher = _hashers.get(upload.id, (None, None))
+    hasher = hasher.copy() if known_offset == offset else None
+
+    part = part_path(upload.id)
+    fd, chunk_path = tempfile.mkstemp(dir=os.path.dirname(part), prefix=f"{upload.id}.", suffix=".chunk")
+    try:
+        written = 0
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: request.stream.read(CHUNK_SIZE), b""):
+                written += len(chunk)
+                if written > remaining:
+                    return error("Chunk runs past the declared file size.", 413)
+                out.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+
+        # Claim the offset: only acknowledge if nobody else moved it meanwhile. The
+        # UPDATE holds the session row (the database on SQLite) until the commit, so
+        # a racing PUT at the same offset waits and then misses, and the new offset
+        # isn't visible to /complete before the bytes are in the .part file.
+        acknowledged = UploadSession.query.filter_by(id=upload.id, received=offset).update(
+            {UploadSession.received: offset + written}, synchronize_session=False
+        )
+        if acknowledged:
+            splice(chunk_path, part, offset)
+        db.session.commit()
+    finally:
+        os.remove(chunk_path)
+    if not acknowledged:
+        db.session.refresh(upload)
+        return jsonify(error="Offset mismatch.", offset=upload.received), 409
+
+    with _hashers_lock:
+        if hasher is not None:
+            _hashers[upload.id] = (offset + written, hasher)
+        else:
+            _hashers.pop(upload.id, None)
+
+    db.session.refresh(upload)
+    return jsonify(session_json(upload))
+
+
+@main.route("/uploads/<upload_id>/complete", methods=["POST"])
+@login_required
+def upload_complete(upload_id):
+    """Move the finished file into storage and create the Paper."""
+    upload = get_own_session(upload_id)
+    if upload is None:
+        return error("Unknown upload.", 404)
+    if upload.received != upload.total_size:
+        return jsonify(error="Upload is incomplete.", offset=upload.received), 409
+
+    path = part_path(upload.id)
+    with _hashers_lock:
+        known_offset, hasher = _hashers.pop(upload.id, (None, None))
+    if known_offset == upload.total_size:
+        digest, size = hasher.hexdigest(), upload.total_size
+    else:  # chunks arrived at other workers; re-read from disk (still streaming)
+        digest, size = hash_file(path)
+
+    stored = adopt_file(path, digest, size, os.path.splitext(upload.filename)[1])
+    filename, title, subject, year = upload.filename, upload.title, upload.subject, upload.year
+    db.session.delete(upload)
+    paper = add_paper(stored, filename, title=title, subject=subject, year=year, user_id=current_user.id)
+
+    response = jsonify(paper_id=paper.id, url=url_for("main.view_paper", paper_id=paper.id))
+    return response, 201
+
+
+@main.route("/uploads/<upload_id>", methods=["DELETE"])
+@login_required
+def upload_abort(upload_id):
+    upload = get_own_session(upload_id)
+    if upload is None:
+        return error("Unknown upload.", 404)
+    discard(upload)
+    db.session.commit()
+    return "", 204
@@ -1,7 +1,8 @@
 # app/models.py
-from . import db, bcrypt
+from . import db
 from flask_login import UserMixin
 from datetime import datetime 
+from contextlib import nullcontext
 from itsdangerous import URLSafeTimedSerializer
 from flask import current_app
 import os
@@ -31,13 +32,24 @@ class User(UserMixin, db.Model):
     # Relationship: one user can upload many papers
     papers = db.relationship("Paper", backref="author", lazy=True)
 
-    # Hash password before storing
+    # Hash password before storing (on the bcrypt pool, see utils/passwords.py)
     def set_password(self, password: str):
-        self.password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
+        from .utils.passwords import hash_password
+        self.password_hash = hash_password(password)
 
     # Verify hashed password
     def check_password(self, password: str) -> bool:
-        return bcrypt.check_password_hash(self.password_hash, password)
+        from .utils.passwords import verify_password
+        return verify_password(self.password_hash, password)
+
+    # Verify, and upgrade the stored hash if BCRYPT_LOG_ROUNDS changed since (caller commits)
+    def check_and_upgrade_password(self, password: str) -> bool:
+        from .utils.passwords import needs_rehash
+        if not self.check_password(password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     # Generate a secure token for password reset
     def get_reset_token(self, expires_sec=3600):
@@ -59,22 +71,159 @@ class User(UserMixin, db.Model):
 # ------------------------------------------
 class Paper(db.Model):
     __tablename__ = "papers"
+    __table_args__ = (
+        # 🔹 Listing indexes: keyset pagination, "my papers", and the subject/year filters
+        db.Index("ix_papers_uploaded_at_id", "uploaded_at", "id"),
+        db.Index("ix_papers_user_id_uploaded_at", "user_id", "uploaded_at"),
+        db.Index("ix_papers_subject", "subject"),
+        db.Index("ix_papers_year", "year"),
+        # 🔹 MySQL full-text index used by utils/search.py (SQLite uses FTS5 instead)
+        db.Index("ix_papers_fulltext", "title", "subject", "year", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
     year = db.Column(db.String(10), nullable=True)
     
-    # 🔹 store only the filename, not the full path
-    file_path = db.Column(db.String(200), nullable=False)   
+    # 🔹 path relative to UPLOAD_PATH (ab/cd/<sha256>.pdf - see utils/storage.py)
+    file_path = db.Column(db.String(200), nullable=False)
+    file_hash = db.Column(db.String(64), db.ForeignKey("stored_files.sha256"), nullable=True, index=True)
+    original_filename = db.Column(db.String(200), nullable=True)  # used as the download name
     
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Foreign key: link paper to uploader
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
+    # 🔹 Text extraction state (see utils/extraction.py): pending / processing / done / failed / unsupported
+    text_status = db.Column(db.String(20), nullable=False, default="pending", server_default="pending")
+    text_error = db.Column(db.String(255), nullable=True)
+
+    # Relationship: extracted text, one row per page
+    pages = db.relationship(
+        "PaperPage", backref="paper", lazy="dynamic",
+        cascade="all, delete-orphan", order_by="PaperPage.page_number"
+    )
+
     # 🔹 Helper to get full path on disk
     def get_file_path(self):
-        """Return the absolute path to the stored file"""
-        upload_path = current_app.config["UPLOAD_PATH"]
-        return os.path.join(upload_path, self.file_path)
+        """Return the absolute path to the stored file (local file store only)"""
+        if self.file_hash is None:  # bare-filename uploads always sit on local disk
+            return os.path.join(current_app.config["UPLOAD_PATH"], self.file_path)
+        from .utils.file_store import get_file_store
+        return get_file_store().path(self.file_path)
+
+    # 🔹 Local path for libraries that need one; a temp copy with remote file stores
+    def local_file(self):
+        if self.file_hash is None:
+            return nullcontext(self.get_file_path())
+        from .utils.file_store import get_file_store
+        return get_file_store().local_path(self.file_path)
+
+    # 🔹 Name offered to the browser on download
+    def download_name(self):
+        return self.original_filename or os.path.basename(self.file_path)
+
+
+# ------------------------------------------
+# StoredFile is one file on disk, shared by every Paper with the same bytes
+# ------------------------------------------
+class StoredFile(db.Model):
+    __tablename__ = "stored_files"
+
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    path = db.Column(db.String(200), nullable=False)  # relative to UPLOAD_PATH
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ------------------------------------------
+# PaperPage stores text extracted from a paper's file, one row per page
+# ------------------------------------------
+class PaperPage(db.Model):
+    __tablename__ = "paper_pages"
+    __table_args__ = (
+        db.UniqueConstraint("paper_id", "page_number", name="uq_paper_pages_paper_page"),
+        # 🔹 MySQL full-text index so search can match file contents
+        db.Index("ix_paper_pages_fulltext", "text", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    paper_id = db.Column(db.Integer, db.ForeignKey("papers.id", ondelete="CASCADE"), nullable=False)
+    page_number = db.Column(db.Integer, nullable=False)  # 1-based
+    text = db.Column(db.Text, nullable=False, default="")
+
+
+# ------------------------------------------
+# UploadSession tracks a resumable chunked upload until it is finalized
+# ------------------------------------------
+class UploadSession(db.Model):
+    __tablename__ = "upload_sessions"
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, also names the .part file
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)
+    title = db.Column(db.String(150), nullable=False)
+    subject = db.Column(db.String(100), nullable=False)
+    year = db.Column(db.String(10), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ------------------------------------------
+# PaperFacet keeps the number of papers per (subject, year) for the
+# listing filters (maintained by utils/facets.py)
+# ------------------------------------------
+class PaperFacet(db.Model):
+    __tablename__ = "paper_facets"
+
+    subject = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.String(10), primary_key=True, default="")  # "" when the paper has no year
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ------------------------------------------
+# Job is one queued side-effect (email, file removal, extraction, ...)
+# run by the worker in utils/jobs.py
+# ------------------------------------------
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # 🔹 the worker's "next due job" lookup
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)        # registered task name
+    args = db.Column(db.Text, nullable=False, default="[]")  # JSON list
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+# ------------------------------------------
+# PaperStat holds download/view totals per paper, written in batches by
+# the buffered counters in utils/counters.py
+# ------------------------------------------
+class PaperStat(db.Model):
+    __tablename__ = "paper_stats"
+    __table_args__ = (
+        # 🔹 "popular" sort on /papers
+        db.Index("ix_paper_stats_downloads", "downloads", "paper_id"),
+    )
+
+    paper_id = db.Column(db.Integer, db.ForeignKey("papers.id", ondelete="CASCADE"), primary_key=True)
+    downloads = db.Column(db.BigInteger, nullable=False, default=0)
+    views = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,40 @@
+// Typeahead for search boxes: <input data-suggest-url="..." list="...">
+// fills the linked <datalist> from main.suggest as the user types.
+(function () {
+    document.querySelectorAll('input[data-suggest-url]').forEach(function (input) {
+        const list = document.getElementById(input.getAttribute('list'));
+        if (!list) return;
+
+        let timer = null;
+        let controller = null;
+
+        async function refresh() {
+            const q = input.value.trim();
+            if (q.length < 2) {
+                list.replaceChildren();
+                return;
+            }
+            if (controller) controller.abort();
+            controller = new AbortController();
+            try {
+                const url = `${input.dataset.suggestUrl}?q=${encodeURIComponent(q)}`;
+                const res = await fetch(url, { credentials: 'same-origin', signal: controller.signal });
+                if (!res.ok) return;
+                const data = await res.json();
+                list.replaceChildren(...data.suggestions.map(function (s) {
+                    const option = document.createElement('option');
+                    option.value = s.text;
+                    option.label = `${s.kind} · ${s.count}`;
+                    return option;
+                }));
+            } catch (err) {
+                // aborted by a newer keystroke, or offline - no suggestions
+            }
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(refresh, 150);
+        });
+    });
+})();
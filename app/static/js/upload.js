@@ -0,0 +1,68 @@
+// Chunked, resumable upload for files bigger than one request allows.
+// Small files still go through the normal form post.
+(function () {
+    const form = document.getElementById('upload-form');
+    if (!form) return;
+
+    const fileInput = form.querySelector('input[type=file]');
+    const status = document.getElementById('upload-status');
+    const directLimit = parseInt(form.dataset.directLimit, 10);
+    const maxRetries = 5;
+
+    function field(name) {
+        const el = form.querySelector(`[name=${name}]`);
+        return el ? el.value : '';
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function request(method, url, body, headers) {
+        const res = await fetch(url, { method, body, headers, credentials: 'same-origin' });
+        const data = res.status === 204 ? {} : await res.json();
+        if (!res.ok && res.status !== 409) throw new Error(data.error || res.statusText);
+        return { status: res.status, data };
+    }
+
+    async function sendChunks(file, session) {
+        let offset = session.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            try {
+                const res = await request('PUT', `${form.dataset.apiUrl}/${session.upload_id}?offset=${offset}`, chunk,
+                                          { 'Content-Type': 'application/octet-stream' });
+                offset = res.data.offset;   // 409 also tells us where the server is
+                failures = 0;
+                status.textContent = `Uploading… ${Math.floor(offset * 100 / file.size)}%`;
+            } catch (err) {
+                if (++failures > maxRetries) throw err;
+                status.textContent = 'Connection lost, resuming…';
+                await sleep(1000 * 2 ** failures);
+                // ask the server how far it got, then carry on from there
+                offset = (await request('GET', `${form.dataset.apiUrl}/${session.upload_id}`)).data.offset;
+            }
+        }
+    }
+
+    form.addEventListener('submit', async function (event) {
+        const file = fileInput.files[0];
+        if (!file || file.size <= directLimit) return;   // normal form post
+
+        event.preventDefault();
+        status.classList.remove('d-none');
+        try {
+            const start = await request('POST', form.dataset.apiUrl, JSON.stringify({
+                title: field('title'), subject: field('subject'), year: field('year'),
+                filename: file.name, size: file.size,
+            }), { 'Content-Type': 'application/json' });
+            await sendChunks(file, start.data);
+            const done = await request('POST', `${form.dataset.apiUrl}/${start.data.upload_id}/complete`);
+            window.location = done.data.url;
+        } catch (err) {
+            status.textContent = `Upload failed: ${err.message}`;
+            status.classList.replace('alert-info', 'alert-danger');
+        }
+    });
+})();
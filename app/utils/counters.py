@@ -0,0 +1,278 @@
+# app/utils/counters.py
+"""
+Write-behind download / view counters.
+
+    count_download(paper.id)   # in main.download
+    count_view(paper.id)       # in main.view_paper
+
+A hit only bumps a number in this process's buffer - no SQL on the request.
+A background thread flushes the buffer every COUNTER_FLUSH_SECONDS as a few
+batched upserts into paper_stats (one statement per COUNTER_FLUSH_BATCH
+papers, rows in paper_id order so concurrent flushes from several workers
+lock in the same order). A hot paper therefore costs one row update per
+flush interval instead of one per download. Counts that fail to flush
+are put back and retried next time; counts still buffered when a process
+is killed hard are lost, which is fine for popularity figures.
+
+COUNTER_FLUSH_SECONDS = 0 flushes right away (tests).
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, request
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select
+
+from .. import db
+
+log = logging.getLogger(__name__)
+
+DOWNLOADS, VIEWS = 0, 1
+
+
+class CounterBuffer:
+    """paper_id -> [downloads, views] not yet written to paper_stats."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.flushes = self.rows_written = self.failures = 0
+
+    def add(self, paper_id, index, amount=1):
+        with self._lock:
+            self._counts.setdefault(paper_id, [0, 0])[index] += amount
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def restore(self, counts):
+        """Put back counts whose flush failed."""
+        with self._lock:
+            for paper_id, (downloads, views) in counts.items():
+                entry = self._counts.setdefault(paper_id, [0, 0])
+                entry[DOWNLOADS] += downloads
+                entry[VIEWS] += views
+
+    def pending(self, paper_id):
+        with self._lock:
+            return tuple(self._counts.get(paper_id, (0, 0)))
+
+    def __len__(self):
+        return len(self._counts)
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    buffer = current_app.extensions.get("counters")
+    if buffer is None:
+        buffer = current_app.extensions.setdefault("counters", CounterBuffer())
+    return buffer
+
+
+# ------------------------------------------
+# Flushing
+# ------------------------------------------
+def _upsert(rows):
+    """Add each row's counts to paper_stats in one statement."""
+    from ..models import PaperStat
+
+    table = PaperStat.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.paper_id],
+            set_={
+                "downloads": table.c.downloads + stmt.excluded.downloads,
+                "views": table.c.views + stmt.excluded.views,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            downloads=table.c.downloads + stmt.inserted.downloads,
+            views=table.c.views + stmt.inserted.views,
+            updated_at=stmt.inserted.updated_at,
+        )
+    else:  # no native upsert: update what exists, insert the rest
+        existing = {
+            row.paper_id for row in
+            db.session.query(PaperStat.paper_id).filter(PaperStat.paper_id.in_([r["paper_id"] for r in rows]))
+        }
+        for row in rows:
+            if row["paper_id"] in existing:
+                PaperStat.query.filter_by(paper_id=row["paper_id"]).update(
+                    {
+                        PaperStat.downloads: PaperStat.downloads + row["downloads"],
+                        PaperStat.views: PaperStat.views + row["views"],
+                        PaperStat.updated_at: row["updated_at"],
+                    },
+                    synchronize_session=False,
+                )
+            else:
+                db.session.add(PaperStat(**row))
+        return
+    db.session.execute(stmt)
+
+
+def flush_counters():
+    """Write the buffered counts to paper_stats. Needs an app context; commits."""
+    from ..models import Paper
+
+    buffer = get_counter_buffer()
+    counts = buffer.drain()
+    if not counts:
+        return 0
+    batch_size = current_app.config["COUNTER_FLUSH_BATCH"]
+    now = datetime.utcnow()
+    ids = sorted(counts)
+    try:
+        written = 0
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            # papers deleted since the hit have no row to count against
+            alive = {row.id for row in db.session.query(Paper.id).filter(Paper.id.in_(chunk))}
+            rows = [
+                {"paper_id": paper_id, "downloads": counts[paper_id][DOWNLOADS],
+                 "views": counts[paper_id][VIEWS], "updated_at": now}
+                for paper_id in chunk if paper_id in alive
+            ]
+            if rows:
+                _upsert(rows)
+                written += len(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        buffer.restore(counts)
+        buffer.failures += 1
+        log.exception("Flushing %s paper counters failed; will retry", len(counts))
+        return 0
+    buffer.flushes += 1
+    buffer.rows_written += written
+    return written
+
+
+def _flush_in_app(app):
+    with app.app_context():
+        flush_counters()
+
+
+def _run_flusher(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            _flush_in_app(app)
+        except Exception:
+            log.exception("Counter flush thread error")
+
+
+def _start_flusher(app):
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_run_flusher, args=(app, app.config["COUNTER_FLUSH_SECONDS"]),
+                name="counter-flusher", daemon=True,
+            )
+            _flusher.start()
+            atexit.register(_flush_in_app, app)  # best effort on clean shutdown
+
+
+# ------------------------------------------
+# Counting and reading
+# ------------------------------------------
+def _count(paper_id, index):
+    app = current_app._get_current_object()
+    get_counter_buffer().add(paper_id, index)
+    if app.config["COUNTER_FLUSH_SECONDS"] <= 0:
+        _flush_in_app(app)  # a fresh session; the request's own stays untouched
+    elif _flusher is None:
+        _start_flusher(app)
+
+
+def count_download(paper_id):
+    _count(paper_id, DOWNLOADS)
+
+
+def count_view(paper_id):
+    _count(paper_id, VIEWS)
+
+
+def paper_counts(paper_id):
+    """(downloads, views): stored totals plus this process's unflushed hits."""
+    from ..models import PaperStat
+
+    stat = db.session.get(PaperStat, paper_id)
+    downloads, views = get_counter_buffer().pending(paper_id)
+    if stat is not None:
+        downloads += stat.downloads
+        views += stat.views
+    return downloads, views
+
+
+def counter_stats():
+    buffer = get_counter_buffer()
+    return {
+        "pending_papers": len(buffer),
+        "flushes": buffer.flushes,
+        "rows_written": buffer.rows_written,
+        "failures": buffer.failures,
+    }
+
+
+class PopularPagination(Pagination):
+    """Papers by stored downloads, then the never-downloaded ones newest first.
+
+    Downloaded papers come straight off ix_paper_stats_downloads
+    (paper_stats JOIN papers ORDER BY downloads DESC, paper_id DESC); the
+    rest follow in (uploaded_at, id) order. A page that straddles the two
+    costs one extra query. Any order on the query (search relevance) is
+    replaced.
+    """
+
+    def _segments(self):
+        from ..models import Paper, PaperStat
+
+        query = self._query_args["query"].order_by(None)
+        ranked = (
+            query.join(PaperStat, PaperStat.paper_id == Paper.id)
+            .filter(PaperStat.downloads > 0)
+            .add_columns(PaperStat.downloads)
+            .order_by(PaperStat.downloads.desc(), PaperStat.paper_id.desc())
+        )
+        downloaded = select(PaperStat.paper_id).where(PaperStat.paper_id == Paper.id, PaperStat.downloads > 0)
+        rest = query.filter(~downloaded.exists()).order_by(Paper.uploaded_at.desc(), Paper.id.desc())
+        return ranked, rest
+
+    def _query_items(self):
+        ranked, rest = self._segments()
+        offset = self._query_offset
+        rows = ranked.limit(self.per_page).offset(offset).all()
+        items = [paper for paper, _ in rows]
+        self.downloads = {paper.id: downloads for paper, downloads in rows}
+        if len(items) < self.per_page:
+            ranked_total = offset + len(rows) if rows or not offset else ranked.order_by(None).count()
+            items += rest.limit(self.per_page - len(items)).offset(max(0, offset - ranked_total)).all()
+        return items
+
+    def _query_count(self):
+        return self._query_args["query"].order_by(None).count()
+
+
+def paginate_popular(query, per_page, page_arg="page"):
+    """Offset-paginate a Paper query by downloads; page.downloads has the counts shown."""
+    return PopularPagination(query=query, page=request.args.get(page_arg, 1, type=int), per_page=per_page)
@@ -0,0 +1,129 @@
+# app/utils/database.py
+"""
+Engine configuration and read-replica routing.
+
+Pooling: DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT size the pool
+per process, DB_POOL_RECYCLE replaces connections before MySQL's
+wait_timeout (or a proxy) closes them under us, and DB_POOL_PRE_PING
+checks each connection on checkout so a restarted server costs one retry
+instead of a 500. The same options are used for the replica.
+
+Replica: with DATABASE_REPLICA_URL set, views marked @read_replica
+(the paper listings and the paper page) run their plain SELECTs on the
+"replica" bind; everything else - any INSERT/UPDATE/DELETE, flushes,
+SELECT ... FOR UPDATE, raw text() statements, and every read after the
+request has written something - goes to the primary. After a request
+writes, that browser reads from the primary for
+DATABASE_REPLICA_STICKY_SECONDS so it sees its own upload or delete
+despite replication lag. Without a replica URL the decorator does nothing.
+
+To try it locally with two SQLite files:
+
+    flask db upgrade && cp site.db replica.db
+    DATABASE_REPLICA_URL=sqlite:///replica.db flask run
+"""
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+REPLICA = "replica"
+_STICKY_KEY = "db_primary_until"
+
+
+def engine_options(url, config):
+    """create_engine() options for one database URL from the DB_POOL_* settings."""
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    if make_url(url).get_backend_name() != "sqlite":  # SQLite pools are per-file/per-thread
+        options.update(
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+        )
+    return options
+
+
+def configure_engines(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS / SQLALCHEMY_BINDS; call before db.init_app."""
+    config = app.config
+    options = engine_options(config["SQLALCHEMY_DATABASE_URI"], config)
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})  # explicit settings win
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    replica_url = config.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+        binds[REPLICA] = {"url": replica_url, **engine_options(replica_url, config)}
+        config["SQLALCHEMY_BINDS"] = binds
+
+
+# ------------------------------------------
+# Routing
+# ------------------------------------------
+class RoutingSession(Session):
+    """Sends plain SELECTs to the replica while a @read_replica view runs."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info["db_wrote"] = True
+        elif self.info.get("read_replica") and not self.info.get("db_wrote") and _plain_select(clause):
+            engines = self._db.engines
+            if engine is engines.get(None) and REPLICA in engines:
+                return engines[REPLICA]
+        return engine
+
+
+def _plain_select(clause):
+    return getattr(clause, "is_select", False) and getattr(clause, "_for_update_arg", None) is None
+
+
+def read_replica(f):
+    """Run this view's reads on the replica (unless this browser just wrote)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from .. import db
+
+        if session.get(_STICKY_KEY, 0) > time.time():
+            return f(*args, **kwargs)
+        db.session.info["read_replica"] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            db.session.info.pop("read_replica", None)
+    return decorated_function
+
+
+def _stick_to_primary(response):
+    from .. import db
+
+    if db.session.registry.has() and db.session.info.get("db_wrote") and has_request_context():
+        session[_STICKY_KEY] = time.time() + current_app.config["DATABASE_REPLICA_STICKY_SECONDS"]
+    return response
+
+
+def init_replica_routing(app):
+    """Read-your-writes for browsers that just wrote (only with a replica)."""
+    if app.config.get("DATABASE_REPLICA_URL"):
+        app.after_request(_stick_to_primary)
+
+
+def pool_stats():
+    """bind name -> checked-out / idle / overflow connections, for this process."""
+    from .. import db
+
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):  # QueuePool; SQLite memory/static pools have no counts
+            stats[key or "primary"] = {
+                "checked_out": pool.checkedout(), "idle": pool.checkedin(), "overflow": max(pool.overflow(), 0),
+            }
+    return stats
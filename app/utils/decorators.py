@@ -8,6 +8,6 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or current_user.role != "admin":
             flash("Admins only!", "danger")
-            return redirect(url_for("main.index"))
+            return redirect(url_for("main.home"))
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,102 @@
+# app/utils/delivery.py
+"""
+Sending paper files to the browser.
+
+Stored files are content-addressed and never change, so responses carry a
+strong ETag (the SHA-256), Last-Modified and a year-long private,
+immutable Cache-Control. Range requests (PDF viewers seeking) and
+If-None-Match / If-Modified-Since (304) are answered by Werkzeug's
+conditional send_file.
+
+SENDFILE_MODE lets the front web server move the bytes instead of the
+Python worker - the app only authorizes and sets headers:
+
+- "x-accel"   (nginx): X-Accel-Redirect to X_ACCEL_PREFIX + file_path, e.g.
+      location /protected-papers/ { internal; alias /srv/app/uploads/papers/; }
+- "x-sendfile" (Apache mod_xsendfile, lighttpd): Flask's USE_X_SENDFILE.
+
+Either way the app then runs behind a proxy: set PROXY_FIX_X_FOR (number of
+proxies, usually 1) so rate limits see client addresses, not the proxy's.
+
+With the S3 file store (utils/file_store.py) downloads are instead 302s to
+presigned URLs and SENDFILE_MODE only matters for legacy local files.
+"""
+import mimetypes
+from urllib.parse import quote
+
+from flask import current_app, redirect, request, send_file, send_from_directory
+
+from .file_store import get_file_store
+
+
+def _cache_headers(response, immutable):
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config["PAPER_CACHE_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:  # legacy, not content-addressed: make the browser revalidate
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+    return response
+
+
+def _x_accel_response(paper, as_attachment):
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(paper.download_name())[0] or "application/octet-stream"
+    )
+    response.headers["X-Accel-Redirect"] = current_app.config["X_ACCEL_PREFIX"] + quote(paper.file_path)
+    response.headers.set(
+        "Content-Disposition", "attachment" if as_attachment else "inline",
+        filename=paper.download_name(),
+    )
+    if paper.file_hash:
+        response.set_etag(paper.file_hash)
+    response.last_modified = paper.uploaded_at
+    # 304s are cheap to answer here; nginx handles Range on the redirected file
+    return response.make_conditional(request)
+
+
+def _presigned_redirect(paper, url):
+    # the URL expires, so the redirect itself must not be cached; a browser
+    # that already holds these (immutable) bytes still gets its 304
+    if request.if_none_match.contains(paper.file_hash):
+        response = current_app.response_class(status=304)
+        response.set_etag(paper.file_hash)
+        return _cache_headers(response, immutable=True)
+    response = redirect(url, code=302)
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+def send_paper(paper, as_attachment):
+    """Response for a paper's file (download or inline preview)."""
+    if paper.file_hash:
+        url = get_file_store().presigned_url(paper.file_path, paper.download_name(), as_attachment)
+        if url:  # remote file store: the client fetches the bytes from it directly
+            return _presigned_redirect(paper, url)
+
+    mode = current_app.config.get("SENDFILE_MODE")
+    if mode == "x-accel":
+        response = _x_accel_response(paper, as_attachment)
+    else:
+        # "x-sendfile" is handled inside send_file via USE_X_SENDFILE
+        response = send_from_directory(
+            current_app.config["UPLOAD_PATH"],
+            paper.file_path,
+            as_attachment=as_attachment,
+            download_name=paper.download_name(),
+            conditional=True,          # Range + 304 handling
+            etag=paper.file_hash or True,
+            max_age=None,
+        )
+    return _cache_headers(response, immutable=bool(paper.file_hash))
+
+
+
+def send_derivative(path, etag, mimetype):
+    """Response for a cached derivative (preview PDF/HTML) of a stored file."""
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=None)
+    return _cache_headers(response, immutable=True)
@@ -0,0 +1,287 @@
+# app/utils/derivatives.py
+"""
+Cached, lightweight derivatives of stored papers.
+
+view_paper's iframe shows a preview instead of the full upload:
+  * PDF  -> a "first pages" PDF: the first PREVIEW_PAGES pages, images
+            downsampled to PREVIEW_MAX_IMAGE_PX, content streams compressed
+            and document metadata dropped.
+  * DOCX -> a standalone HTML page rendered from word/document.xml. Only
+            text, headings, basic emphasis and tables are kept and every
+            piece of text is escaped, so nothing from the file can run.
+
+Derivatives live under DERIVATIVE_PATH/<h[0:2]>/<h[2:4]>/<hash>/ keyed by
+the file's content hash, so identical uploads share one and it is removed
+together with the stored file (see utils/storage.release_file). They are
+built by a job (utils/jobs.py) queued at upload, or by the first view that
+finds none.
+"""
+import importlib.util
+import logging
+import os
+import shutil
+from functools import lru_cache
+
+from flask import current_app
+from markupsafe import escape
+
+from .. import db
+from .extraction import read_docx_xml
+from .jobs import enqueue, task
+
+log = logging.getLogger(__name__)
+
+PREVIEW_PDF = "preview.pdf"
+PREVIEW_HTML = "preview.html"
+FAILED_SUFFIX = ".failed"  # marker so a broken file isn't retried on every view
+
+
+class DerivativeUnavailable(Exception):
+    """Raised when the libraries needed to build a derivative are missing."""
+
+
+def derivative_dir(digest):
+    return os.path.join(current_app.config["DERIVATIVE_PATH"], digest[:2], digest[2:4], digest)
+
+
+PREVIEWS = {
+    ".pdf": PREVIEW_PDF,
+    ".docx": PREVIEW_HTML,
+}
+
+
+def derivative_path(paper, name):
+    """Absolute path of a paper's derivative, or None for legacy (unhashed) files."""
+    if not paper.file_hash:
+        return None
+    return os.path.join(derivative_dir(paper.file_hash), name)
+
+
+def preview_name(paper):
+    """Which preview a paper gets (PREVIEW_PDF / PREVIEW_HTML), or None."""
+    return PREVIEWS.get(os.path.splitext(paper.file_path)[1].lower())
+
+
+@lru_cache(maxsize=None)
+def can_build(name):
+    """False when the library a preview needs is missing (pypdf for PDFs)."""
+    return name != PREVIEW_PDF or importlib.util.find_spec("pypdf") is not None
+
+
+# ------------------------------------------
+# Builders
+# ------------------------------------------
+def _downsample_images(page, max_px):
+    try:
+        from PIL import Image  # noqa: F401  (pypdf hands us PIL images)
+    except ImportError:
+        return  # still worth it: fewer pages, compressed streams
+    for image in page.images:
+        img = image.image
+        if max(img.size) <= max_px:
+            continue
+        img.thumbnail((max_px, max_px))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        image.replace(img, quality=70)
+
+
+def build_pdf_preview(source, dest, max_pages, max_image_px):
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        raise DerivativeUnavailable("PDF previews need the 'pypdf' package")
+
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    for page in reader.pages[:max_pages]:
+        writer.add_page(page)
+    for page in writer.pages:
+        _downsample_images(page, max_image_px)
+        page.compress_content_streams()
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    writer.metadata = None  # strip title/author/producer
+
+    temp = dest + ".tmp"
+    with open(temp, "wb") as fh:
+        writer.write(fh)
+    os.replace(temp, dest)
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_HTML_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Preview</title>
+<style>
+body{font-family:Georgia,serif;max-width:48rem;margin:1.5rem auto;padding:0 1rem;line-height:1.5;color:#212529}
+table{border-collapse:collapse;margin:1rem 0}td{border:1px solid #ced4da;padding:.25rem .5rem;vertical-align:top}
+hr.page{border:0;border-top:1px dashed #adb5bd;margin:2rem 0}p.li{margin-left:1.5rem}p.note{color:#6c757d;font-style:italic}
+</style></head><body>
+%s
+</body></html>
+"""
+
+
+def _on(props, tag):
+    """True when a w:rPr toggle (w:b, w:i, ...) is present and not switched off."""
+    node = props.find(_W + tag) if props is not None else None
+    return node is not None and node.get(_W + "val", "true") not in ("0", "false", "none")
+
+
+def _docx_run(run):
+    parts = []
+    for node in run:
+        if node.tag == _W + "t" and node.text:
+            parts.append(str(escape(node.text)))
+        elif node.tag == _W + "tab":
+            parts.append("&emsp;")
+        elif node.tag == _W + "br" and node.get(_W + "type") != "page":
+            parts.append("<br>")
+    html = "".join(parts)
+    props = run.find(_W + "rPr")
+    for tag, wrap in (("b", "strong"), ("i", "em"), ("u", "u")):
+        if html and _on(props, tag):
+            html = f"<{wrap}>{html}</{wrap}>"
+    return html
+
+
+def _docx_paragraph(para):
+    """Render one w:p; returns (html, page_breaks_inside)."""
+    props = para.find(_W + "pPr")
+    style = ""
+    if props is not None and props.find(_W + "pStyle") is not None:
+        style = props.find(_W + "pStyle").get(_W + "val", "")
+
+    breaks = sum(
+        1 for node in para.iter()
+        if node.tag == _W + "br" and node.get(_W + "type") == "page"
+    )
+    html = "".join(_docx_run(run) for run in para.iter(_W + "r"))
+    if not html.strip():
+        return "", breaks
+
+    if style == "Title":
+        tag, cls = "h1", ""
+    elif style.startswith("Heading") and style[7:].isdigit():
+        tag, cls = f"h{min(int(style[7:]) + 1, 6)}", ""
+    elif props is not None and props.find(_W + "numPr") is not None:
+        tag, cls = "p", ' class="li"'
+        html = "&bull; " + html
+    else:
+        tag, cls = "p", ""
+    return f"<{tag}{cls}>{html}</{tag}>", breaks
+
+
+def _docx_table(table):
+    rows = []
+    for row in table.iter(_W + "tr"):
+        cells = []
+        for cell in row.findall(_W + "tc"):
+            cells.append("<td>%s</td>" % "".join(_docx_block(child)[0] for child in cell))
+        rows.append("<tr>%s</tr>" % "".join(cells))
+    return "<table>%s</table>" % "".join(rows)
+
+
+def _docx_block(node):
+    if node.tag == _W + "p":
+        return _docx_paragraph(node)
+    if node.tag == _W + "tbl":
+        return _docx_table(node), 0
+    return "", 0
+
+
+def build_docx_preview(source, dest, max_chars):
+    """Render word/document.xml as escaped HTML, truncated after max_chars."""
+    root = read_docx_xml(source)
+    body = root.find(_W + "body")
+    blocks, size = [], 0
+    for node in body if body is not None else ():
+        html, breaks = _docx_block(node)
+        if html:
+            blocks.append(html)
+            size += len(html)
+        blocks.extend('<hr class="page">' for _ in range(breaks))
+        if size > max_chars:
+            blocks.append('<p class="note">Preview truncated - download the paper to read the rest.</p>')
+            break
+    if not blocks:
+        blocks.append('<p class="note">This document has no text to preview.</p>')
+
+    temp = dest + ".tmp"
+    with open(temp, "w", encoding="utf-8") as fh:
+        fh.write(_HTML_PAGE % "\n".join(blocks))
+    os.replace(temp, dest)
+
+
+# ------------------------------------------
+# Jobs
+# ------------------------------------------
+def _build(paper, name, dest):
+    config = current_app.config
+    with paper.local_file() as source:
+        if name == PREVIEW_PDF:
+            build_pdf_preview(source, dest, config["PREVIEW_PAGES"], config["PREVIEW_MAX_IMAGE_PX"])
+        else:
+            build_docx_preview(source, dest, config["PREVIEW_HTML_MAX_CHARS"])
+
+
+@task("build_preview")
+def generate_preview(paper_id):
+    """Build the preview for one paper if it isn't cached yet."""
+    from ..models import Paper
+
+    paper = db.session.get(Paper, paper_id)
+    if paper is None:
+        return
+    name = preview_name(paper)
+    dest = derivative_path(paper, name) if name else None
+    if dest is None or os.path.exists(dest) or os.path.exists(dest + FAILED_SUFFIX):
+        return
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        _build(paper, name, dest)
+    except DerivativeUnavailable:
+        pass
+    except Exception as exc:
+        log.warning("Preview build failed for paper %s: %s", paper_id, exc)
+        open(dest + FAILED_SUFFIX, "w").close()
+
+
+def schedule_preview(paper):
+    """Queue a preview build (caller commits) unless the paper has none, it
+    can't be built here, or one is already queued."""
+    name = preview_name(paper)
+    if not paper.file_hash or name is None or not can_build(name):
+        return None
+    return enqueue("build_preview", paper.id, unique=True)
+
+
+@task("remove_derivatives")
+def remove_derivatives(digest):
+    """Delete a released file's derivatives unless the file was stored again."""
+    from ..models import StoredFile
+
+    if StoredFile.query.filter_by(sha256=digest).first() is None:
+        shutil.rmtree(derivative_dir(digest), ignore_errors=True)
+
+
+def get_preview(paper):
+    """Path of the cached preview, or None (a build is queued if possible)."""
+    name = preview_name(paper)
+    path = derivative_path(paper, name) if name else None
+    if path is None:
+        return None
+    if os.path.exists(path):
+        return path
+    if can_build(name) and not os.path.exists(path + FAILED_SUFFIX):
+        schedule_preview(paper)
+        db.session.commit()
+    return None
+
+
+def preview_failed(paper):
+    """True when building this paper's preview was tried and failed."""
+    name = preview_name(paper)
+    path = derivative_path(paper, name) if name else None
+    return path is not None and os.path.exists(path + FAILED_SUFFIX)
@@ -0,0 +1,19 @@
+# app/utils/emails.py
+"""
+Outgoing email, sent by the job worker (utils/jobs.py) rather than on the
+request thread. Build the message in the request (url_for needs it), then
+queue it with queue_email() and commit.
+"""
+from flask_mailman import EmailMessage
+
+from .jobs import enqueue, task
+
+
+@task("send_email")
+def send_email(subject, body, from_email, to):
+    EmailMessage(subject=subject, body=body, from_email=from_email, to=list(to)).send()
+
+
+def queue_email(subject, body, from_email, to):
+    """Queue a plain-text email in the current transaction; the caller commits."""
+    return enqueue("send_email", subject, body, from_email, list(to))
@@ -0,0 +1,162 @@
+# app/utils/extraction.py
+"""
+Background text extraction for uploaded papers.
+
+add_paper() queues an "extract_text" job (utils/jobs.py) with the new
+Paper row; the actual work (opening the PDF/DOCX, pulling text page by
+page, writing PaperPage rows and refreshing the search index) runs on the
+job worker, so the request returns straight away. Search
+only ever reads the stored pages - files are never re-read at query time.
+"""
+import logging
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from flask import current_app
+
+from .. import db
+from .jobs import enqueue, task
+from .search import get_search_backend
+
+log = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_UNSUPPORTED = "unsupported"
+
+# MySQL TEXT holds 65,535 bytes (not characters: utf8mb4 uses up to 4 per
+# character); no exam page comes close, but guard anyway
+MAX_PAGE_BYTES = 60000
+
+# Refuse to inflate absurd document.xml parts (zip bombs)
+MAX_DOCX_XML_BYTES = 50 * 1024 * 1024
+
+
+class ExtractionUnavailable(Exception):
+    """Raised when a file type can't be read (e.g. pypdf not installed)."""
+
+
+# ------------------------------------------
+# Extractors: path -> list of page texts
+# ------------------------------------------
+def extract_pdf(path, max_pages):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionUnavailable("PDF extraction needs the 'pypdf' package")
+
+    reader = PdfReader(path)
+    pages = []
+    for page in reader.pages[:max_pages]:
+        pages.append(page.extract_text() or "")
+    return pages
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def read_docx_xml(path):
+    """Parse a DOCX's word/document.xml, refusing parts over MAX_DOCX_XML_BYTES."""
+    with zipfile.ZipFile(path) as archive:
+        if archive.getinfo("word/document.xml").file_size > MAX_DOCX_XML_BYTES:
+            raise ValueError("word/document.xml is too large")
+        with archive.open("word/document.xml") as fh:
+            return ElementTree.parse(fh).getroot()
+
+
+def extract_docx(path, max_pages):
+    """Read word/document.xml directly; page boundaries come from explicit
+    page breaks and the breaks Word recorded the last time it laid out the file."""
+    root = read_docx_xml(path)
+
+    pages, lines, size = [], [], 0
+    for para in root.iter(f"{_W}p"):
+        line = []
+        for node in para.iter():
+            if node.tag == f"{_W}t" and node.text:
+                if size < MAX_PAGE_BYTES:  # chars <= bytes; the rest is cut by _clean anyway
+                    line.append(node.text)
+                    size += len(node.text)
+            elif node.tag == f"{_W}tab":
+                line.append("\t")
+            elif node.tag == f"{_W}lastRenderedPageBreak" or (
+                node.tag == f"{_W}br" and node.get(f"{_W}type") == "page"
+            ):
+                lines.append("".join(line))
+                pages.append("\n".join(lines))
+                lines, line, size = [], [], 0
+                if len(pages) >= max_pages:
+                    return pages
+        lines.append("".join(line))
+    if any(l.strip() for l in lines):
+        pages.append("\n".join(lines))
+    return pages[:max_pages]
+
+
+EXTRACTORS = {
+    ".pdf": extract_pdf,
+    ".docx": extract_docx,
+}
+
+
+def _clean(text):
+    text = re.sub(r"[ \t\r\f\v]+", " ", text or "")
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    # cut on the UTF-8 length, dropping a character split at the boundary
+    return text.strip().encode("utf-8")[:MAX_PAGE_BYTES].decode("utf-8", "ignore")
+
+
+# ------------------------------------------
+# Job body
+# ------------------------------------------
+@task("extract_text")
+def extract_paper_text(paper_id):
+    """Extract and store the text of one paper. Needs an app context."""
+    from ..models import Paper, PaperPage
+
+    paper = db.session.get(Paper, paper_id)
+    if paper is None:  # deleted before we got to it
+        return
+
+    extractor = EXTRACTORS.get(os.path.splitext(paper.file_path)[1].lower())
+    if extractor is None:
+        paper.text_status = STATUS_UNSUPPORTED
+        db.session.commit()
+        return
+
+    paper.text_status = STATUS_PROCESSING
+    paper.text_error = None
+    db.session.commit()
+
+    try:
+        with paper.local_file() as source:
+            raw_pages = extractor(source, current_app.config["EXTRACTION_MAX_PAGES"])
+
+        PaperPage.query.filter_by(paper_id=paper.id).delete(synchronize_session=False)
+        db.session.add_all(
+            PaperPage(paper_id=paper.id, page_number=n, text=_clean(text))
+            for n, text in enumerate(raw_pages, start=1)
+        )
+        db.session.flush()
+        get_search_backend().index(paper)
+        paper.text_status = STATUS_DONE
+        db.session.commit()
+    except ExtractionUnavailable as exc:
+        paper.text_status, paper.text_error = STATUS_UNSUPPORTED, str(exc)[:255]
+        db.session.commit()
+    except Exception as exc:  # corrupt/encrypted files, missing file, pages the database refused, ...
+        log.warning("Text extraction failed for paper %s: %s", paper_id, exc)
+        db.session.rollback()
+        paper = db.session.get(Paper, paper_id)
+        if paper is not None:
+            paper.text_status, paper.text_error = STATUS_FAILED, str(exc)[:255]
+            db.session.commit()
+
+
+def schedule_extraction(paper_id):
+    """Queue extraction for a paper; the caller commits."""
+    return enqueue("extract_text", paper_id)
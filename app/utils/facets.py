@@ -0,0 +1,146 @@
+# app/utils/facets.py
+"""
+Subject / year counts for the listing filters.
+
+paper_facets holds one row per (subject, year) with its number of papers.
+add_paper/remove_paper (utils/papers.py) adjust it in the same transaction
+as the paper itself, so the dropdowns never need a GROUP BY over papers.
+`flask facets rebuild` recomputes it from scratch if it ever drifts.
+
+The table is tiny (distinct subject/year pairs), so a listing reads all of
+it in one query and narrows it in Python: subject counts respect the
+selected year and year counts respect the selected subject. With a search
+term the counts come from the top FACET_SEARCH_CAP hits instead.
+"""
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+
+
+def _key(subject, year):
+    return subject or "", year or ""
+
+
+# ------------------------------------------
+# Maintenance (call inside the paper's transaction)
+# ------------------------------------------
+def adjust_facet(subject, year, delta):
+    """Add `delta` papers to the (subject, year) bucket."""
+    from ..models import PaperFacet
+
+    subject, year = _key(subject, year)
+    bucket = PaperFacet.query.filter_by(subject=subject, year=year)
+    updated = bucket.update({PaperFacet.count: PaperFacet.count + delta}, synchronize_session=False)
+    if not updated and delta > 0:
+        try:
+            with db.session.begin_nested():
+                db.session.add(PaperFacet(subject=subject, year=year, count=delta))
+        except IntegrityError:  # a concurrent upload created the bucket first
+            bucket.update({PaperFacet.count: PaperFacet.count + delta}, synchronize_session=False)
+    elif delta < 0:
+        bucket.filter(PaperFacet.count <= 0).delete(synchronize_session=False)
+
+
+def facet_added(paper):
+    adjust_facet(paper.subject, paper.year, 1)
+
+
+def facet_removed(paper):
+    adjust_facet(paper.subject, paper.year, -1)
+
+
+def rebuild_facets():
+    """Recompute every bucket from papers. Caller commits."""
+    from ..models import Paper, PaperFacet
+
+    year = func.coalesce(Paper.year, "")
+    rows = db.session.query(Paper.subject, year, func.count(Paper.id)).group_by(Paper.subject, year).all()
+
+    PaperFacet.query.delete(synchronize_session=False)
+    db.session.add_all(
+        PaperFacet(subject=subject, year=year_value, count=count) for subject, year_value, count in rows
+    )
+    return len(rows)
+
+
+# ------------------------------------------
+# Reading
+# ------------------------------------------
+class Facets:
+    """Dropdown options as (value, count) lists: subjects by count, years newest first."""
+
+    def __init__(self, subjects, years, capped=False):
+        self.subjects = subjects
+        self.years = years
+        self.capped = capped  # counts cover only the top FACET_SEARCH_CAP search hits
+
+
+def _search_buckets(search, cap):
+    from ..models import Paper
+    from .search import get_search_backend
+
+    hits = (
+        get_search_backend().search(Paper.query, search)
+        .with_entities(Paper.subject.label("subject"), Paper.year.label("year"))
+        .limit(cap + 1)
+        .subquery()
+    )
+    rows = db.session.query(hits.c.subject, hits.c.year, func.count()).group_by(hits.c.subject, hits.c.year).all()
+    total = sum(count for _, _, count in rows)
+    return rows, total > cap
+
+
+def facet_counts(subject=None, year=None, search=None):
+    """Counts for the subject/year dropdowns, narrowed by the other filter."""
+    from ..models import PaperFacet
+
+    if search:
+        rows, capped = _search_buckets(search, current_app.config["FACET_SEARCH_CAP"])
+    else:
+        rows, capped = db.session.query(PaperFacet.subject, PaperFacet.year, PaperFacet.count).all(), False
+
+    subjects, years = Counter(), Counter()
+    for row_subject, row_year, count in rows:
+        row_subject, row_year = _key(row_subject, row_year)
+        if not year or row_year == year:
+            subjects[row_subject] += count
+        if row_year and (not subject or row_subject == subject):
+            years[row_year] += count
+
+    limit = current_app.config["FACET_MAX_OPTIONS"]
+    return Facets(
+        subjects=sorted(subjects.items(), key=lambda item: (-item[1], item[0].lower()))[:limit],
+        years=sorted(years.items(), reverse=True)[:limit],
+        capped=capped,
+    )
+
+
+def filter_by_facets(query, subject=None, year=None):
+    """Apply the exact subject/year filters chosen from the dropdowns."""
+    from ..models import Paper
+
+    if subject:
+        query = query.filter(Paper.subject == subject)
+    if year:
+        query = query.filter(Paper.year == year)
+    return query
+
+
+# ------------------------------------------
+# CLI: flask facets rebuild
+# ------------------------------------------
+facets_cli = AppGroup("facets", help="Manage subject/year filter counts.")
+
+
+@facets_cli.command("rebuild")
+def rebuild_command():
+    """Recompute paper_facets from the papers table."""
+    buckets = rebuild_facets()
+    db.session.commit()
+    click.echo(f"Rebuilt {buckets} subject/year buckets.")
@@ -0,0 +1,215 @@
+# app/utils/file_store.py
+"""
+Where paper files physically live.
+
+utils/storage.py decides *which* key a file gets (content-addressed,
+reference counted); a file store only puts, reads, serves and deletes
+bytes under a key:
+
+  * "local" - UPLOAD_PATH on this machine's disk (default). Downloads go
+              through send_file or the front web server (SENDFILE_MODE).
+  * "s3"    - an S3-compatible bucket (AWS, MinIO, ...; needs `boto3`).
+              Downloads are 302 redirects to short-lived presigned URLs,
+              so the bytes never pass through the app nodes.
+
+Either way UPLOAD_PATH/.tmp stays the local scratch area where uploads are
+hashed before they are put into the store. Preview derivatives
+(DERIVATIVE_PATH) are a rebuildable per-node cache and stay local.
+
+S3 settings: FILE_STORE_S3_BUCKET, FILE_STORE_S3_PREFIX,
+FILE_STORE_S3_ENDPOINT (e.g. http://localhost:9000 for MinIO),
+FILE_STORE_S3_REGION and FILE_STORE_S3_URL_EXPIRES; credentials come from
+the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY environment.
+Run `flask storage migrate` before switching so no bare-filename rows
+are left behind on local disk.
+"""
+import mimetypes
+import os
+import tempfile
+from contextlib import closing, contextmanager
+from urllib.parse import quote
+
+from flask import current_app
+
+
+def content_type(key):
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+# ------------------------------------------
+# Backends
+# ------------------------------------------
+class LocalFileStore:
+    """Files under UPLOAD_PATH."""
+
+    name = "local"
+
+    def __init__(self, app):
+        self.root = app.config["UPLOAD_PATH"]
+
+    def path(self, key):
+        """Absolute path of a key on this disk."""
+        return os.path.join(self.root, key)
+
+    def put(self, temp_path, key):
+        """Move a local temp file in under `key` (dropping it if the key exists)."""
+        final_path = self.path(key)
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        """Size in bytes, or None if the key doesn't exist."""
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    @contextmanager
+    def local_path(self, key):
+        """A filesystem path with the key's bytes (the file itself here)."""
+        yield self.path(key)
+
+    def presigned_url(self, key, filename, as_attachment):
+        return None  # served by send_file / the front web server
+
+    def iter_keys(self):
+        """(key, size, mtime) for every stored file, in key order, skipping .tmp."""
+        def walk(directory, prefix):
+            with os.scandir(directory) as it:
+                # "/" after directory names keeps the output in plain string order
+                entries = sorted(it, key=lambda e: e.name + ("/" if e.is_dir(follow_symlinks=False) else ""))
+            for entry in entries:
+                relative = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if relative != ".tmp":
+                        yield from walk(entry.path, relative + "/")
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield relative.replace("/", os.sep), stat.st_size, stat.st_mtime
+        if os.path.isdir(self.root):
+            yield from walk(self.root, "")
+
+
+class S3FileStore:
+    """Objects in an S3-compatible bucket, served by presigned redirects."""
+
+    name = "s3"
+
+    def __init__(self, app):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("FILE_STORE_BACKEND = 's3' needs the 'boto3' package")
+        config = app.config
+        if not config["FILE_STORE_S3_BUCKET"]:
+            raise RuntimeError("FILE_STORE_BACKEND = 's3' needs FILE_STORE_S3_BUCKET")
+        self.bucket = config["FILE_STORE_S3_BUCKET"]
+        self.prefix = config["FILE_STORE_S3_PREFIX"]
+        self.url_expires = config["FILE_STORE_S3_URL_EXPIRES"]
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=config["FILE_STORE_S3_ENDPOINT"] or None,
+            region_name=config["FILE_STORE_S3_REGION"] or None,
+        )
+        self._client_error = ClientError
+        self.scratch = os.path.join(config["UPLOAD_PATH"], ".tmp")
+
+    def _key(self, key):
+        return self.prefix + key.replace(os.sep, "/")
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def path(self, key):
+        raise NotImplementedError("S3 objects have no local path; use local_path()")
+
+    def put(self, temp_path, key):
+        try:
+            if self._head(key) is None:  # content-addressed: same key, same bytes
+                self.client.upload_file(
+                    temp_path, self.bucket, self._key(key), ExtraArgs={"ContentType": content_type(key)}
+                )
+        finally:
+            os.remove(temp_path)
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return None if head is None else head["ContentLength"]
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def open(self, key):
+        return closing(self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"])
+
+    @contextmanager
+    def local_path(self, key):
+        """Download to a scratch file for libraries that need a real path."""
+        os.makedirs(self.scratch, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.scratch, suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), temp_path)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def presigned_url(self, key, filename, as_attachment):
+        disposition = "attachment" if as_attachment else "inline"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(key),
+                "ResponseContentType": content_type(filename),
+                "ResponseContentDisposition": f"{disposition}; filename*=UTF-8''{quote(filename)}",
+            },
+            ExpiresIn=self.url_expires,
+        )
+
+    def iter_keys(self):
+        """(key, size, mtime) per object; S3 lists keys in order already."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(self.prefix):]
+                yield key.replace("/", os.sep), item["Size"], item["LastModified"].timestamp()
+
+
+BACKENDS = {
+    "local": LocalFileStore,
+    "s3": S3FileStore,
+}
+
+
+def get_file_store():
+    """The app's file store (created on first use)."""
+    store = current_app.extensions.get("file_store")
+    if store is None:
+        backend = BACKENDS[current_app.config["FILE_STORE_BACKEND"]]
+        store = current_app.extensions.setdefault("file_store", backend(current_app))
+    return store
@@ -0,0 +1,314 @@
+# app/utils/importer.py
+"""
+`flask import-papers` - bulk ingest of departmental past-paper archives.
+
+    flask import-papers ./archive manifest.csv --uploader registrar
+
+The manifest (CSV with a header row, or a JSON list of objects) has one
+entry per paper: `file` (path relative to the directory), `title`,
+`subject`, optional `year` and optional `uploader` (username or email;
+--uploader is the fallback).
+
+Files are validated (extension, size, magic bytes) and copied into
+UPLOAD_PATH/.tmp by a process pool, hashing while they copy so each file
+is read once. Only a few files per worker are in flight at a time, and an
+aborted run deletes the copies it never adopted. --dry-run validates and
+hashes without copying. The main process adopts the copies into
+content-addressed storage (utils/storage.py) and inserts the Paper rows
+through build_paper, committing every --batch-size papers. After each commit the imported
+entries are appended to a state file next to the manifest, so re-running
+the same command after a crash or a bad row picks up where it stopped.
+Extraction and preview jobs are queued as usual; run `flask jobs worker`
+to work through them.
+"""
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_
+
+from .. import db
+from .papers import build_paper
+from .storage import CHUNK_SIZE, _temp_dir, adopt_file
+
+# leading bytes every accepted file type starts with
+MAGIC = {
+    ".pdf": b"%PDF-",
+    ".docx": b"PK\x03\x04",  # DOCX is a zip container
+}
+
+
+# what a committed batch needs to remember (the Paper objects are expired by then)
+Imported = namedtuple("Imported", "file paper_id title subject")
+
+
+class ManifestError(ValueError):
+    pass
+
+
+# ------------------------------------------
+# Manifest and state
+# ------------------------------------------
+def read_manifest(path):
+    """List of entry dicts from a CSV or JSON manifest."""
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        if path.lower().endswith(".json"):
+            entries = json.load(fh)
+            if not isinstance(entries, list):
+                raise ManifestError("A JSON manifest must be a list of objects.")
+        else:
+            entries = list(csv.DictReader(fh))
+    cleaned = []
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise ManifestError(f"Entry {number} is not an object.")
+        entry = {key.strip().lower(): str(value).strip() for key, value in entry.items() if key and value is not None}
+        entry["file"] = entry.get("file") or entry.get("filename", "")
+        cleaned.append(entry)
+    return cleaned
+
+
+def load_state(path):
+    """Manifest `file` values already imported by an earlier run."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as fh:
+        return {json.loads(line)["file"] for line in fh if line.strip()}
+
+
+def record_state(path, imported):
+    with open(path, "a", encoding="utf-8") as fh:
+        for item in imported:
+            fh.write(json.dumps({"file": item.file, "paper_id": item.paper_id}) + "\n")
+
+
+def check_entry(entry, limits):
+    """Metadata problems for one entry, or None."""
+    if not entry["file"]:
+        return "no file given"
+    if not entry.get("title") or len(entry["title"]) > limits["title"]:
+        return f"title missing or longer than {limits['title']} characters"
+    if not entry.get("subject") or len(entry["subject"]) > limits["subject"]:
+        return f"subject missing or longer than {limits['subject']} characters"
+    if len(entry.get("year", "")) > limits["year"]:
+        return f"year longer than {limits['year']} characters"
+    return None
+
+
+# ------------------------------------------
+# Worker processes (no app context in here)
+# ------------------------------------------
+def prepare_file(job):
+    """Validate one file and copy it into the temp dir while hashing.
+
+    Returns (temp_path, digest, size, error); runs in a pool process. With
+    temp_dir None (dry runs) the file is only validated and hashed.
+    """
+    source, temp_dir, allowed, max_size = job
+    ext = os.path.splitext(source)[1].lower()
+    if ext not in allowed:
+        return None, None, 0, f"file type {ext or '(none)'} not allowed"
+    try:
+        size = os.path.getsize(source)
+        if size > max_size:
+            return None, None, size, f"larger than {max_size} bytes"
+        with open(source, "rb") as fh:
+            head = fh.read(CHUNK_SIZE)
+            if not head.startswith(MAGIC[ext]):
+                return None, None, size, f"not a valid {ext[1:].upper()} file"
+            sha = hashlib.sha256(head)
+            if temp_dir is None:
+                for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                return None, sha.hexdigest(), size, None
+            fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    out.write(head)
+                    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                        sha.update(chunk)
+                        out.write(chunk)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+    except OSError as exc:
+        return None, None, 0, str(exc)
+    return temp_path, sha.hexdigest(), size, None
+
+
+def _remove_temp(temp_path):
+    if temp_path and os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+def prepared_files(pool, jobs, window):
+    """prepare_file results in job order, with at most `window` jobs in flight.
+
+    Closing the generator early (an error or Ctrl-C in the caller) cancels
+    the jobs that haven't started and deletes the temp copies of those that
+    finished but were never adopted, so an aborted import leaves nothing in
+    UPLOAD_PATH/.tmp.
+    """
+    in_flight = deque()
+    try:
+        for job in jobs:
+            in_flight.append(pool.submit(prepare_file, job))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        for future in in_flight:
+            if not future.cancelled():
+                try:
+                    _remove_temp(future.result()[0])
+                except Exception:
+                    pass
+
+
+# ------------------------------------------
+# Import
+# ------------------------------------------
+def _find_uploader(value, cache):
+    from ..models import User
+
+    if value not in cache:
+        user = User.query.filter(or_(User.username == value, User.email == value)).first()
+        cache[value] = user.id if user else None
+    return cache[value]
+
+
+def _commit_batch(batch, state_path):
+    """Commit one batch; returns how many papers it held."""
+    from .suggest import suggest_added
+
+    db.session.commit()
+    for item in batch:
+        suggest_added(item)
+    record_state(state_path, batch)
+    db.session.expunge_all()  # keep the identity map from growing with the archive
+    return len(batch)
+
+
+@click.command("import-papers")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option("--uploader", default=None, help="Username/email for entries without an uploader.")
+@click.option("--workers", type=int, default=None, help="Hashing processes (default: CPU count).")
+@click.option("--batch-size", type=int, default=200, show_default=True, help="Papers per transaction.")
+@click.option("--state", "state_path", default=None, help="Progress file (default: <manifest>.imported).")
+@click.option("--restart", is_flag=True, help="Ignore the progress file and import everything again.")
+@click.option("--dry-run", is_flag=True, help="Only validate the manifest and files.")
+@with_appcontext
+def import_papers_command(directory, manifest, uploader, workers, batch_size, state_path, restart, dry_run):
+    """Import a directory of papers described by a CSV/JSON manifest."""
+    from ..models import Paper
+
+    try:
+        entries = read_manifest(manifest)
+    except (ValueError, csv.Error) as exc:
+        raise click.ClickException(f"Bad manifest: {exc}")
+
+    state_path = state_path or manifest + ".imported"
+    if restart and os.path.exists(state_path) and not dry_run:
+        os.remove(state_path)
+    done = set() if restart else load_state(state_path)
+
+    limits = {
+        "title": Paper.title.property.columns[0].type.length,
+        "subject": Paper.subject.property.columns[0].type.length,
+        "year": Paper.year.property.columns[0].type.length,
+    }
+    users, pending, failed = {}, [], []
+    skipped = 0
+    for entry in entries:
+        if entry["file"] in done:
+            skipped += 1
+            continue
+        problem = check_entry(entry, limits)
+        user_id = None
+        if problem is None:
+            name = entry.get("uploader") or uploader
+            user_id = _find_uploader(name, users) if name else None
+            if user_id is None:
+                problem = f"unknown uploader {name!r}" if name else "no uploader (use --uploader)"
+        if problem is None and os.path.isabs(entry["file"]):
+            problem = "file must be relative to the directory"
+        if problem:
+            failed.append((entry["file"], problem))
+        else:
+            pending.append((entry, user_id))
+
+    config = current_app.config
+    temp_dir = None if dry_run else _temp_dir()  # dry runs only hash, nothing is copied
+    jobs = (
+        (os.path.join(directory, entry["file"]), temp_dir, config["UPLOAD_EXTENSIONS"], config["MAX_PAPER_SIZE"])
+        for entry, _ in pending
+    )
+    click.echo(f"{len(pending)} to import, {skipped} already imported, {len(failed)} invalid entries.")
+
+    started = time.monotonic()
+    imported = committed = duplicates = total_bytes = valid = 0
+    batch = []
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            closing(prepared_files(pool, jobs, window=workers * 4)) as results:
+        for (entry, user_id), (temp_path, digest, size, problem) in zip(pending, results):
+            if problem:
+                failed.append((entry["file"], problem))
+                continue
+            if dry_run:
+                valid += 1
+                continue
+            try:
+                stored = adopt_file(temp_path, digest, size, os.path.splitext(entry["file"])[1])
+                duplicates += stored.ref_count > 1
+                paper = build_paper(
+                    stored, os.path.basename(entry["file"]),
+                    title=entry["title"], subject=entry["subject"],
+                    year=entry.get("year"), user_id=user_id,
+                )
+                batch.append(Imported(entry["file"], paper.id, paper.title, paper.subject))
+                imported += 1
+                total_bytes += size
+                if len(batch) >= batch_size:
+                    committed += _commit_batch(batch, state_path)
+                    batch = []
+                    _report(imported, total_bytes, started, prefix="  ")
+            except Exception as exc:
+                db.session.rollback()
+                _remove_temp(temp_path)  # still there if adopt_file failed before moving it
+                raise click.ClickException(
+                    f"Stopped at {entry['file']}: {exc}. "
+                    f"{committed} papers were committed; re-run the same command to resume."
+                )
+    if batch:
+        committed += _commit_batch(batch, state_path)
+
+    for name, problem in failed:
+        click.echo(f"failed: {name}: {problem}", err=True)
+    if dry_run:
+        click.echo(f"Dry run: {valid} ok, {len(failed)} failed.")
+        return
+    _report(imported, total_bytes, started)
+    click.echo(f"{duplicates} shared an already stored file, {skipped} skipped, {len(failed)} failed.")
+
+
+def _report(count, total_bytes, started, prefix=""):
+    elapsed = max(time.monotonic() - started, 1e-6)
+    click.echo(
+        f"{prefix}Imported {count} papers ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f}s: "
+        f"{count / elapsed:.1f} papers/s, {total_bytes / 1e6 / elapsed:.1f} MB/s"
+    )
+
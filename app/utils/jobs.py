@@ -0,0 +1,368 @@
+# app/utils/jobs.py
+"""
+Durable job queue for side-effects that shouldn't run on the request
+thread (emails, file removal, text extraction, previews).
+
+    @task("send_email")
+    def send_email(subject, body, from_email, to): ...
+
+    enqueue("send_email", subject, body, sender, [address])
+    db.session.commit()
+
+enqueue() only adds a row to `jobs` in the caller's transaction, so a job
+exists exactly when the change that needed it was committed. Arguments
+are stored as JSON. A worker claims due jobs with a conditional UPDATE
+(safe with several workers), runs them in their own app context and marks
+them done - or re-queues them with exponential backoff until max_attempts,
+after which they stay "failed" for `flask jobs retry`. Jobs left "running"
+by a crashed worker are re-queued after JOB_LOCK_TIMEOUT_SECONDS, so tasks
+must be safe to run twice.
+
+JOBS_MODE picks who runs them:
+  * "embedded" - a worker thread pool inside each web process (default).
+  * "external" - only `flask jobs worker`; web processes just enqueue.
+  * "inline"   - right after the enqueuing commit, on the same thread
+                 (tests and debugging).
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect
+
+from .. import db
+
+log = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+TASKS = {}
+_NEW_JOBS_KEY = "jobs_enqueued"
+
+
+# ------------------------------------------
+# Registering and enqueueing
+# ------------------------------------------
+def task(name):
+    """Register a function as a job task under `name`."""
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+
+def enqueue(name, *args, delay=0, max_attempts=None, unique=False):
+    """Queue `name(*args)` in the current transaction; the caller commits.
+
+    unique=True skips the insert when the same call is already queued or
+    running (e.g. a preview requested by every view until it exists).
+    """
+    from ..models import Job
+
+    if name not in TASKS:
+        raise KeyError(f"Unknown job task: {name}")
+    payload = json.dumps(args)
+    if unique:
+        existing = (
+            Job.query.filter_by(name=name, args=payload)
+            .filter(Job.status.in_([STATUS_QUEUED, STATUS_RUNNING]))
+            .first()
+        )
+        if existing is not None:
+            return existing
+
+    job = Job(
+        name=name,
+        args=payload,
+        status=STATUS_QUEUED,
+        max_attempts=max_attempts or current_app.config["JOB_MAX_ATTEMPTS"],
+        run_after=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    db.session.info.setdefault(_NEW_JOBS_KEY, []).append(job)
+    return job
+
+
+# ------------------------------------------
+# Claiming and running
+# ------------------------------------------
+def _claim(job_id, worker_id):
+    """Mark one queued job as ours; False if someone else got it first."""
+    from ..models import Job
+
+    claimed = Job.query.filter_by(id=job_id, status=STATUS_QUEUED).update(
+        {
+            Job.status: STATUS_RUNNING,
+            Job.locked_by: worker_id,
+            Job.locked_at: datetime.utcnow(),
+            Job.attempts: Job.attempts + 1,
+        },
+        synchronize_session=False,
+    )
+    return bool(claimed)
+
+
+def claim_due(worker_id, limit):
+    """Claim up to `limit` due jobs, oldest first. Commits."""
+    from ..models import Job
+
+    candidates = [
+        row.id for row in
+        db.session.query(Job.id)
+        .filter(Job.status == STATUS_QUEUED, Job.run_after <= datetime.utcnow())
+        .order_by(Job.run_after, Job.id)
+        .limit(limit * 2)
+    ]
+    claimed = []
+    for job_id in candidates:
+        if _claim(job_id, worker_id):
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    db.session.commit()
+    return claimed
+
+
+def requeue_stale():
+    """Put back jobs whose worker died mid-run. Commits."""
+    from ..models import Job
+
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT_SECONDS"])
+    count = Job.query.filter(Job.status == STATUS_RUNNING, Job.locked_at < cutoff).update(
+        {Job.status: STATUS_QUEUED, Job.locked_by: None, Job.locked_at: None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return count
+
+
+def backoff_seconds(attempts):
+    config = current_app.config
+    return min(config["JOB_BACKOFF_SECONDS"] * 2 ** max(attempts - 1, 0), config["JOB_BACKOFF_MAX_SECONDS"])
+
+
+def run_job(job_id):
+    """Run one claimed job and record the outcome. Needs an app context."""
+    from ..models import Job
+
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != STATUS_RUNNING:
+        return
+    name, args = job.name, json.loads(job.args)
+    try:
+        func = TASKS.get(name)
+        if func is None:
+            raise LookupError(f"No task registered as {name!r}")
+        func(*args)
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = f"{type(exc).__name__}: {exc}"[:255]
+        job.locked_by = job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = STATUS_FAILED
+            job.finished_at = datetime.utcnow()
+            log.exception("Job %s (%s) failed for good after %s attempts", job_id, name, job.attempts)
+        else:
+            job.status = STATUS_QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=backoff_seconds(job.attempts))
+            log.warning("Job %s (%s) failed, retrying: %s", job_id, name, exc)
+    else:
+        job = db.session.get(Job, job_id)
+        job.status = STATUS_DONE
+        job.finished_at = datetime.utcnow()
+        job.locked_by = job.locked_at = None
+        job.last_error = None
+    db.session.commit()
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception:  # bookkeeping itself failed; the lock timeout recovers it
+            log.exception("Could not record the outcome of job %s", job_id)
+            db.session.rollback()
+
+
+# ------------------------------------------
+# Worker
+# ------------------------------------------
+class Worker:
+    """Polls for due jobs and runs them on a thread pool."""
+
+    def __init__(self, app, threads=None, poll_seconds=None):
+        self.app = app
+        self.threads = threads or app.config["JOB_WORKER_THREADS"]
+        self.poll_seconds = poll_seconds or app.config["JOB_POLL_SECONDS"]
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"[:100]
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job-worker")
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self._running = set()
+        self._last_stale_check = 0.0
+
+    def tick(self):
+        """Claim as many due jobs as there are free threads; returns how many."""
+        self._running = {f for f in self._running if not f.done()}
+        free = self.threads - len(self._running)
+        if free <= 0:
+            return 0
+        with self.app.app_context():
+            if time.monotonic() - self._last_stale_check > 60:
+                requeue_stale()
+                self._last_stale_check = time.monotonic()
+            claimed = claim_due(self.worker_id, free)
+        for job_id in claimed:
+            self._running.add(self.executor.submit(_run_in_app, self.app, job_id))
+        return len(claimed)
+
+    def run(self, once=False):
+        while not self.stopping:
+            try:
+                claimed = self.tick()
+            except Exception:
+                log.exception("Job worker poll failed")
+                claimed = 0
+            if once and not claimed and not self._running:
+                break
+            if not claimed:
+                self.wakeup.wait(self.poll_seconds)
+                self.wakeup.clear()
+            elif once:
+                for future in list(self._running):
+                    future.result()
+        self.executor.shutdown(wait=True)
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+
+_embedded = None
+_embedded_lock = threading.Lock()
+
+
+def _embedded_worker(app):
+    global _embedded
+    with _embedded_lock:
+        if _embedded is None:
+            _embedded = Worker(app)
+            threading.Thread(target=_embedded.run, name="job-poller", daemon=True).start()
+        return _embedded
+
+
+# ------------------------------------------
+# Dispatch after commit
+# ------------------------------------------
+def _dispatch_committed(session):
+    if session.in_nested_transaction():  # a SAVEPOINT was released, not the real commit
+        return
+    jobs = session.info.pop(_NEW_JOBS_KEY, None)
+    if not jobs:
+        return
+    app = current_app._get_current_object()
+    mode = app.config["JOBS_MODE"]
+    if mode == "embedded":
+        if _embedded is not None:  # CLI commands just leave the jobs queued
+            _embedded.wakeup.set()
+    elif mode == "inline":
+        # attributes are expired after commit; the identity key needs no SQL
+        job_ids = [inspect(job).identity[0] for job in jobs if inspect(job).identity]
+        for job_id in job_ids:
+            with app.app_context():  # a fresh session, ours is mid-commit
+                if _claim(job_id, "inline"):
+                    db.session.commit()
+                    run_job(job_id)
+
+
+def _forget_enqueued(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_NEW_JOBS_KEY, None)
+
+
+def init_jobs(app):
+    """Hand freshly committed jobs to the worker (or run them inline)."""
+    if not event.contains(db.session, "after_commit", _dispatch_committed):
+        event.listen(db.session, "after_commit", _dispatch_committed)
+        event.listen(db.session, "after_soft_rollback", _forget_enqueued)
+
+    # started by the first request, not at import (keeps `flask db ...` thread-free)
+    @app.before_request
+    def start_embedded_worker():
+        if _embedded is None and app.config["JOBS_MODE"] == "embedded":
+            _embedded_worker(app)
+
+
+# ------------------------------------------
+# CLI: flask jobs worker / status / retry / purge
+# ------------------------------------------
+jobs_cli = AppGroup("jobs", help="Run and inspect background jobs.")
+
+
+@jobs_cli.command("worker")
+@click.option("--threads", type=int, default=None, help="Concurrent jobs (default JOB_WORKER_THREADS).")
+@click.option("--poll", type=float, default=None, help="Seconds between polls (default JOB_POLL_SECONDS).")
+@click.option("--once", is_flag=True, help="Exit when no job is due instead of waiting.")
+def worker_command(threads, poll, once):
+    """Run queued jobs until interrupted."""
+    worker = Worker(current_app._get_current_object(), threads, poll)
+    click.echo(f"Job worker {worker.worker_id} running {worker.threads} threads.")
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@jobs_cli.command("status")
+def status_command():
+    """Count jobs per status and list recent failures."""
+    from ..models import Job
+
+    for status, count in db.session.query(Job.status, func.count(Job.id)).group_by(Job.status):
+        click.echo(f"{status}: {count}")
+    for job in Job.query.filter_by(status=STATUS_FAILED).order_by(Job.id.desc()).limit(10):
+        click.echo(f"  #{job.id} {job.name} x{job.attempts}: {job.last_error}")
+
+
+@jobs_cli.command("retry")
+@click.argument("job_ids", nargs=-1, type=int)
+@click.option("--failed", "all_failed", is_flag=True, help="Retry every failed job.")
+def retry_command(job_ids, all_failed):
+    """Re-queue failed jobs (by id, or all of them)."""
+    from ..models import Job
+
+    query = Job.query.filter_by(status=STATUS_FAILED)
+    if not all_failed:
+        query = query.filter(Job.id.in_(job_ids or [0]))
+    count = query.update(
+        {Job.status: STATUS_QUEUED, Job.attempts: 0, Job.run_after: datetime.utcnow(), Job.finished_at: None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    click.echo(f"Re-queued {count} jobs.")
+
+
+@jobs_cli.command("purge")
+@click.option("--days", type=int, default=7, help="Delete finished jobs older than this.")
+def purge_command(days):
+    """Delete old finished (done) jobs."""
+    from ..models import Job
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    count = Job.query.filter(Job.status == STATUS_DONE, Job.finished_at < cutoff).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    click.echo(f"Deleted {count} finished jobs.")
@@ -0,0 +1,315 @@
+# app/utils/metrics.py
+"""
+Request and SQL instrumentation, exported in Prometheus text format.
+
+    GET /admin/metrics   (admins only)
+
+Hooks installed by init_metrics():
+
+  * before/after_request - latency histogram and request count per
+    endpoint, method and status class; bytes received (uploads, form
+    posts) and sent (downloads, previews) per endpoint.
+  * SQLAlchemy before/after_cursor_execute - statement count and time per
+    endpoint ("-" outside a request: job workers, the counter flusher,
+    CLI commands), a per-statement latency histogram, and statements
+    slower than METRICS_SLOW_QUERY_SECONDS logged with their SQL.
+
+Figures are per process, like the other stats in this app: with N workers
+scrape each one or add them up. Sent bytes only cover what the worker
+itself writes - with SENDFILE_MODE = "x-accel" or the S3 file store the
+bytes are counted by nginx / the bucket. The endpoint also reports the
+response cache, password hasher, rate limit and counter buffer stats,
+database pool usage and the job queue depth. METRICS_ENABLED = False
+leaves the hooks out.
+"""
+import logging
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from .. import db
+
+log = logging.getLogger(__name__)
+
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+NO_ENDPOINT = "-"
+
+
+# ------------------------------------------
+# Registry
+# ------------------------------------------
+class Histogram:
+    """Cumulative-bucket histogram as Prometheus wants it."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def samples(self):
+        """(le, cumulative count) pairs, +Inf last."""
+        running = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            running += count
+            yield ("+Inf" if bound == "+Inf" else repr(float(bound))), running
+
+
+class Metrics:
+    """Counters and histograms for this process, keyed by label tuples."""
+
+    def __init__(self, app):
+        self.latency_buckets = tuple(app.config["METRICS_LATENCY_BUCKETS"])
+        self.slow_query_seconds = app.config["METRICS_SLOW_QUERY_SECONDS"]
+        self.started_at = time.time()
+        self._lock = Lock()
+        self.requests = {}         # (endpoint, method, status) -> count
+        self.latency = {}          # endpoint -> Histogram
+        self.bytes_received = {}   # endpoint -> bytes
+        self.bytes_sent = {}       # endpoint -> bytes
+        self.sql_statements = {}   # endpoint -> count
+        self.sql_seconds = {}      # endpoint -> seconds
+        self.sql_latency = Histogram(SQL_BUCKETS)
+        self.slow_queries = 0
+
+    def observe_request(self, endpoint, method, status, seconds, received, sent):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = Histogram(self.latency_buckets)
+            histogram.observe(seconds)
+            if received:
+                self.bytes_received[endpoint] = self.bytes_received.get(endpoint, 0) + received
+            if sent:
+                self.bytes_sent[endpoint] = self.bytes_sent.get(endpoint, 0) + sent
+
+    def observe_statement(self, endpoint, seconds):
+        with self._lock:
+            self.sql_statements[endpoint] = self.sql_statements.get(endpoint, 0) + 1
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + seconds
+            self.sql_latency.observe(seconds)
+            slow = seconds >= self.slow_query_seconds
+            if slow:
+                self.slow_queries += 1
+        return slow
+
+    def snapshot(self):
+        """Copies of everything, taken under the lock."""
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "latency": {
+                    endpoint: (list(h.samples()), h.total, sum(h.counts))
+                    for endpoint, h in self.latency.items()
+                },
+                "bytes_received": dict(self.bytes_received),
+                "bytes_sent": dict(self.bytes_sent),
+                "sql_statements": dict(self.sql_statements),
+                "sql_seconds": dict(self.sql_seconds),
+                "sql_latency": (list(self.sql_latency.samples()), self.sql_latency.total,
+                                sum(self.sql_latency.counts)),
+                "slow_queries": self.slow_queries,
+            }
+
+
+def get_metrics():
+    metrics = current_app.extensions.get("metrics")
+    if metrics is None:
+        metrics = current_app.extensions.setdefault("metrics", Metrics(current_app))
+    return metrics
+
+
+def _endpoint():
+    # unmatched URLs (404s, scanners) share one label so they can't blow up the series
+    if has_request_context():
+        return request.endpoint or "(unmatched)"
+    return NO_ENDPOINT
+
+
+# ------------------------------------------
+# Hooks
+# ------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if not has_app_context() or "metrics" not in current_app.extensions:
+        return
+    endpoint = _endpoint()
+    if get_metrics().observe_statement(endpoint, elapsed):
+        log.warning("Slow SQL (%.3fs) in %s: %s", elapsed, endpoint, " ".join(statement.split())[:2000])
+
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        received = request.content_length if request.method not in ("GET", "HEAD") else 0
+        get_metrics().observe_request(
+            _endpoint(), request.method, f"{response.status_code // 100}xx",
+            time.perf_counter() - started, received or 0, response.content_length or 0,
+        )
+    return response
+
+
+def init_metrics(app):
+    """Install the request and SQL timing hooks."""
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.extensions.setdefault("metrics", Metrics(app))
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+
+# ------------------------------------------
+# Prometheus text format
+# ------------------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {value}")
+
+    def metric(self, name, kind, help_text, value, **labels):
+        self.family(name, kind, help_text)
+        self.sample(name, value, **labels)
+
+    def histogram(self, name, data, **labels):
+        buckets, total, count = data
+        for le, cumulative in buckets:
+            self.sample(name + "_bucket", cumulative, **labels, le=le)
+        self.sample(name + "_sum", round(total, 6), **labels)
+        self.sample(name + "_count", count, **labels)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _app_stats(out):
+    """Stats the other utils already keep, plus the job queue depth."""
+    from ..models import Job
+    from .counters import counter_stats
+    from .database import pool_stats
+    from .passwords import hasher_stats
+    from .rate_limit import rate_limit_stats
+    from .response_cache import cache_stats
+
+    cache = cache_stats()
+    out.family("response_cache_requests_total", "counter", "Response cache lookups by result.")
+    for result in ("hits", "misses"):
+        out.sample("response_cache_requests_total", cache.get(result, 0), result=result)
+    out.metric("response_cache_entries", "gauge", "Entries in the response cache.", cache["entries"])
+
+    hasher = hasher_stats()
+    out.family("password_hash_operations_total", "counter", "bcrypt hash/verify calls.")
+    for op in ("hash", "verify"):
+        out.sample("password_hash_operations_total", hasher[op]["count"], op=op)
+    out.metric("password_hash_rejected_total", "counter", "Hashes refused because the pool was busy.",
+               hasher["rejected"])
+
+    out.family("rate_limited_requests_total", "counter", "Requests refused with 429, by limit.")
+    for name, count in sorted(rate_limit_stats().items()):
+        out.sample("rate_limited_requests_total", count, limit=name)
+
+    counters = counter_stats()
+    out.metric("paper_counters_pending", "gauge", "Papers with unflushed download/view counts.",
+               counters["pending_papers"])
+    out.metric("paper_counter_flush_failures_total", "counter", "Failed counter flushes.", counters["failures"])
+
+    pools = pool_stats()
+    out.family("db_pool_connections", "gauge", "Pooled database connections by bind and state.")
+    for bind, counts in sorted(pools.items()):
+        for state, count in counts.items():
+            out.sample("db_pool_connections", count, bind=bind, state=state)
+
+    out.family("jobs", "gauge", "Rows in the job queue by status.")
+    for status, count in db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).order_by(Job.status):
+        out.sample("jobs", count, status=status)
+
+
+def render_metrics():
+    """All metrics for this process as Prometheus exposition text."""
+    data = get_metrics().snapshot()
+    out = _Writer()
+    out.metric("process_start_time_seconds", "gauge", "Start time of this process (unix seconds).",
+               round(get_metrics().started_at, 3))
+
+    out.family("http_requests_total", "counter", "Requests handled, by endpoint, method and status class.")
+    for (endpoint, method, status), count in sorted(data["requests"].items()):
+        out.sample("http_requests_total", count, endpoint=endpoint, method=method, status=status)
+
+    out.family("http_request_duration_seconds", "histogram", "Request latency by endpoint.")
+    for endpoint, histogram in sorted(data["latency"].items()):
+        out.histogram("http_request_duration_seconds", histogram, endpoint=endpoint)
+
+    out.family("http_request_bytes_total", "counter", "Request body bytes received (uploads, form posts).")
+    for endpoint, total in sorted(data["bytes_received"].items()):
+        out.sample("http_request_bytes_total", total, endpoint=endpoint)
+
+    out.family("http_response_bytes_total", "counter", "Response body bytes sent by this process.")
+    for endpoint, total in sorted(data["bytes_sent"].items()):
+        out.sample("http_response_bytes_total", total, endpoint=endpoint)
+
+    out.family("sql_statements_total", "counter", "SQL statements executed, by endpoint.")
+    for endpoint, count in sorted(data["sql_statements"].items()):
+        out.sample("sql_statements_total", count, endpoint=endpoint)
+
+    out.family("sql_statement_seconds_total", "counter", "Time spent in SQL statements, by endpoint.")
+    for endpoint, seconds in sorted(data["sql_seconds"].items()):
+        out.sample("sql_statement_seconds_total", round(seconds, 6), endpoint=endpoint)
+
+    out.family("sql_statement_duration_seconds", "histogram", "Latency of single SQL statements.")
+    out.histogram("sql_statement_duration_seconds", data["sql_latency"])
+
+    out.metric("sql_slow_statements_total", "counter", "Statements slower than METRICS_SLOW_QUERY_SECONDS.",
+               data["slow_queries"])
+
+    _app_stats(out)
+    return out.text()
+
+
+def metrics_response():
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,157 @@
+# app/utils/pagination.py
+"""
+Keyset ("seek") pagination for paper listings.
+
+Flask-SQLAlchemy's paginate() runs OFFSET n plus a COUNT(*) over the whole
+filtered set, so page 500 costs 500 pages of work. Here each page is fetched
+with WHERE (uploaded_at, id) < (last row seen) ORDER BY uploaded_at DESC,
+id DESC LIMIT n+1, which the ix_papers_uploaded_at_id index answers directly
+no matter how deep the page. Position travels in an opaque cursor.
+
+Relevance-ranked search results are not ordered by (uploaded_at, id), so
+they keep using offset pagination.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import and_, func, or_, select
+
+from .. import db
+
+NEXT = "n"
+PREV = "p"
+
+
+# ------------------------------------------
+# Cursors
+# ------------------------------------------
+def encode_cursor(direction, uploaded_at, paper_id):
+    raw = json.dumps([direction, uploaded_at.isoformat(), paper_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (direction, uploaded_at, id), or None for a missing/garbled cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, stamp, paper_id = json.loads(raw)
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, datetime.fromisoformat(stamp), int(paper_id)
+    except (ValueError, TypeError):
+        return None
+
+
+# ------------------------------------------
+# Page object
+# ------------------------------------------
+class KeysetPage:
+    """Just enough of the Pagination interface for the listing templates."""
+
+    cursor_mode = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, total_capped=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_capped = total_capped
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_label(self):
+        if self.total is None:
+            return ""
+        return f"{self.total:,}+" if self.total_capped else f"{self.total:,}"
+
+
+def approximate_count(query, cap):
+    """Count matching rows but stop at `cap`; returns (count, capped)."""
+    from ..models import Paper
+    limited = query.order_by(None).with_entities(Paper.id).limit(cap + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(limited)).scalar()
+    return min(count, cap), count > cap
+
+
+def keyset_paginate(query, cursor, per_page, with_total=None):
+    """Return one KeysetPage of a Paper query, newest first."""
+    from ..models import Paper
+
+    if with_total is None:
+        with_total = current_app.config["PAGINATION_SHOW_TOTALS"]
+
+    total, capped = None, False
+    if with_total:
+        total, capped = approximate_count(query, current_app.config["PAGINATION_COUNT_CAP"])
+
+    position = decode_cursor(cursor)
+    direction = position[0] if position else NEXT
+
+    if position:
+        _, stamp, paper_id = position
+        if direction == NEXT:
+            query = query.filter(or_(
+                Paper.uploaded_at < stamp,
+                and_(Paper.uploaded_at == stamp, Paper.id < paper_id),
+            ))
+        else:
+            query = query.filter(or_(
+                Paper.uploaded_at > stamp,
+                and_(Paper.uploaded_at == stamp, Paper.id > paper_id),
+            ))
+
+    if direction == NEXT:
+        query = query.order_by(Paper.uploaded_at.desc(), Paper.id.desc())
+    else:
+        query = query.order_by(Paper.uploaded_at.asc(), Paper.id.asc())
+
+    # one extra row tells us whether there is another page in this direction
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    items = rows[:per_page]
+    if direction == PREV:
+        items.reverse()
+
+    if not items:
+        return KeysetPage([], per_page, total=total, total_capped=capped)
+
+    first, last = items[0], items[-1]
+    has_newer = more if direction == PREV else position is not None
+    has_older = more if direction == NEXT else position is not None
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor(NEXT, last.uploaded_at, last.id) if has_older else None,
+        prev_cursor=encode_cursor(PREV, first.uploaded_at, first.id) if has_newer else None,
+        total=total,
+        total_capped=capped,
+    )
+
+
+def paginate_papers(query, per_page, ranked=False, page_arg="page", cursor_arg="cursor"):
+    """Paginate a listing from the current request's args.
+
+    Unranked listings use keyset pagination (unless PAGINATION_MODE is
+    "offset"); ranked search results are already ordered by relevance and
+    use classic page numbers.
+    """
+    from ..models import Paper
+
+    if ranked or current_app.config["PAGINATION_MODE"] == "offset":
+        if not ranked:
+            query = query.order_by(Paper.uploaded_at.desc(), Paper.id.desc())
+        page = request.args.get(page_arg, 1, type=int)
+        return query.paginate(page=page, per_page=per_page)
+    return keyset_paginate(query, request.args.get(cursor_arg), per_page)
@@ -0,0 +1,93 @@
+# app/utils/papers.py
+"""
+Single place for the bookkeeping that goes with adding or removing a paper
+(file references, search index, facet counts, typeahead, cached pages,
+text extraction, previews),
+so the form upload, the chunked upload API and the admin routes all stay
+in sync.
+"""
+from collections import Counter
+
+from .. import db
+from ..models import Paper, PaperPage, PaperStat
+from .derivatives import schedule_preview
+from .extraction import schedule_extraction
+from .facets import adjust_facet, facet_added, facet_removed
+from .response_cache import invalidate_after_commit
+from .search import get_search_backend
+from .storage import release_file, release_files
+from .suggest import suggest_added, suggest_removed
+
+
+def add_paper(stored, filename, title, subject, year, user_id):
+    """Create and commit a Paper for an already-stored file, together with
+    its text extraction and preview jobs. `stored` is the StoredFile from
+    utils/storage.py."""
+    paper = build_paper(stored, filename, title, subject, year, user_id)
+    db.session.commit()
+    suggest_added(paper)
+    return paper
+
+
+def build_paper(stored, filename, title, subject, year, user_id):
+    """add_paper without the commit, for callers batching many papers per
+    transaction (call suggest_added once it has committed)."""
+    paper = Paper(
+        title=title,
+        subject=subject,
+        year=year or None,
+        file_path=stored.path,  # relative path inside UPLOAD_PATH
+        file_hash=stored.sha256,
+        original_filename=filename,
+        user_id=user_id,
+    )
+    db.session.add(paper)
+    db.session.flush()  # assigns paper.id for the search index
+    get_search_backend().index(paper)
+    facet_added(paper)
+    invalidate_after_commit()  # cached public listings go stale
+
+    # Pull the file's text out (so search can cover it) and build the
+    # preview on the job worker; the jobs commit together with the paper
+    schedule_extraction(paper.id)
+    schedule_preview(paper)
+    return paper
+
+
+def remove_paper(paper):
+    """Delete a paper and drop its file reference / index entry / facet count.
+    The caller commits (so several removals can share one transaction)."""
+    release_file(paper)  # file goes after commit, once no other paper shares it
+    get_search_backend().remove(paper.id)
+    facet_removed(paper)
+    suggest_removed(paper)
+    invalidate_after_commit()
+    PaperStat.query.filter_by(paper_id=paper.id).delete(synchronize_session=False)
+    db.session.delete(paper)
+
+
+def remove_papers(paper_ids):
+    """Set-based remove_paper: one SELECT of the needed columns, then bulk
+    UPDATE/DELETEs, with file removals queued in batches. Returns how many
+    papers were deleted; the caller commits."""
+    rows = (
+        db.session.query(Paper.id, Paper.title, Paper.subject, Paper.year, Paper.file_hash, Paper.file_path)
+        .filter(Paper.id.in_(paper_ids))
+        .all()
+    )
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+
+    release_files(rows)
+    get_search_backend().remove_many(ids)
+    for (subject, year), count in Counter((row.subject, row.year) for row in rows).items():
+        adjust_facet(subject, year, -count)
+    for row in rows:
+        suggest_removed(row)
+    invalidate_after_commit()
+
+    PaperPage.query.filter(PaperPage.paper_id.in_(ids)).delete(synchronize_session=False)
+    PaperStat.query.filter(PaperStat.paper_id.in_(ids)).delete(synchronize_session=False)
+    Paper.query.filter(Paper.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
@@ -0,0 +1,155 @@
+# app/utils/passwords.py
+"""
+Password hashing off the request thread.
+
+bcrypt is deliberately slow (~250 ms at cost 12), and a burst of logins at
+exam time used to run one hash per request thread at once. Hashing and
+verification now go through a small per-process thread pool
+(PASSWORD_HASH_THREADS; bcrypt releases the GIL, so these run in
+parallel) with a bounded wait list (PASSWORD_HASH_MAX_PENDING). When the
+list is full, or a result takes longer than PASSWORD_HASH_TIMEOUT, callers
+get PasswordHasherBusy and answer 503 instead of piling up more work.
+
+BCRYPT_LOG_ROUNDS is the cost for new hashes. Logging in with a hash of a
+different cost rehashes the password (needs_rehash), so raising or
+lowering the cost takes effect as users come back. `flask passwords
+benchmark` shows how long each cost takes on this machine; latency of the
+real hashes is kept in hasher_stats().
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .. import bcrypt
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hashes queued in this process; try again shortly."""
+
+
+class _OpStats:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self):
+        mean = self.total_seconds / self.count if self.count else 0.0
+        return {"count": self.count, "mean_ms": round(mean * 1000, 1), "max_ms": round(self.max_seconds * 1000, 1)}
+
+
+class PasswordHasher:
+    """Bounded thread pool for bcrypt plus latency counters."""
+
+    def __init__(self, app):
+        self.threads = app.config["PASSWORD_HASH_THREADS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="bcrypt")
+        self._slots = BoundedSemaphore(self.threads + app.config["PASSWORD_HASH_MAX_PENDING"])
+        self._lock = Lock()
+        self.stats = {"hash": _OpStats(), "verify": _OpStats()}
+        self.rejected = 0
+
+    def _timed(self, op, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stats[op].add(elapsed)
+
+    def run(self, op, func, *args):
+        """Run func(*args) on the pool and wait for it."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+        future = self.executor.submit(self._timed, op, func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def as_dict(self):
+        with self._lock:
+            stats = {op: values.as_dict() for op, values in self.stats.items()}
+            stats.update(threads=self.threads, rejected=self.rejected)
+        return stats
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get("password_hasher")
+    if hasher is None:
+        hasher = current_app.extensions.setdefault("password_hasher", PasswordHasher(current_app))
+    return hasher
+
+
+def hasher_stats():
+    """Hash/verify counts and latency for this process."""
+    stats = get_password_hasher().as_dict()
+    stats["rounds"] = current_app.config["BCRYPT_LOG_ROUNDS"]
+    return stats
+
+
+# ------------------------------------------
+# Public helpers
+# ------------------------------------------
+def hash_password(password):
+    """bcrypt hash (str) at the configured cost."""
+    rounds = current_app.config["BCRYPT_LOG_ROUNDS"]
+    hashed = get_password_hasher().run("hash", bcrypt.generate_password_hash, password, rounds)
+    return hashed.decode("utf-8")
+
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return get_password_hasher().run("verify", bcrypt.check_password_hash, password_hash, password)
+
+
+def hash_rounds(password_hash):
+    """Cost factor stored in a "$2b$12$..." hash, or None if unreadable."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != current_app.config["BCRYPT_LOG_ROUNDS"]
+
+
+# ------------------------------------------
+# CLI: flask passwords benchmark
+# ------------------------------------------
+passwords_cli = AppGroup("passwords", help="Password hashing tools.")
+
+
+@passwords_cli.command("benchmark")
+@click.option("--min-rounds", type=int, default=10, show_default=True)
+@click.option("--max-rounds", type=int, default=14, show_default=True)
+@click.option("--samples", type=int, default=3, show_default=True)
+def benchmark_command(min_rounds, max_rounds, samples):
+    """Time one bcrypt hash per cost factor (pick BCRYPT_LOG_ROUNDS from this)."""
+    current = current_app.config["BCRYPT_LOG_ROUNDS"]
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.generate_password_hash("benchmark-password", rounds)
+            timings.append(time.perf_counter() - started)
+        marker = "  (current)" if rounds == current else ""
+        click.echo(f"cost {rounds:2d}: {min(timings) * 1000:8.1f} ms{marker}")
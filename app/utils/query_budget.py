@@ -0,0 +1,97 @@
+# app/utils/query_budget.py
+"""
+Per-request SQL query accounting.
+
+Every statement executed while handling a request is counted on `g`. A view
+can declare how many statements it is allowed with @query_budget(n) (or via
+the SQL_QUERY_BUDGETS config dict, keyed by endpoint). Going over budget logs
+a warning, or raises QueryBudgetExceeded when SQL_QUERY_BUDGET_STRICT is on -
+which is what test suites should enable so N+1 regressions fail loudly.
+"""
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A request ran more SQL statements than its endpoint allows."""
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may run.
+
+    Put it directly above the view function (below @login_required etc.) so
+    the attribute is copied onto the outer wrappers by functools.wraps.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
+
+
+# ------------------------------------------
+# Counting
+# ------------------------------------------
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+_counters = []  # active count_queries() blocks (tests / benchmarks)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_query_count = g.get("sql_query_count", 0) + 1
+    for counter in _counters:
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Count every statement run inside the block, e.g. around a test client call."""
+    counter = QueryCounter()
+    _counters.append(counter)
+    try:
+        yield counter
+    finally:
+        _counters.remove(counter)
+
+
+def get_budget(endpoint):
+    budgets = current_app.config.get("SQL_QUERY_BUDGETS") or {}
+    if endpoint in budgets:
+        return budgets[endpoint]
+    view = current_app.view_functions.get(endpoint)
+    return getattr(view, "query_budget", None)
+
+
+def _check_budget(response):
+    used = g.get("sql_query_count", 0)
+    budget = get_budget(request.endpoint)
+    if current_app.debug or current_app.testing:
+        response.headers["X-SQL-Queries"] = str(used)
+    if budget is not None and used > budget:
+        message = f"{request.endpoint} ran {used} SQL queries (budget {budget})"
+        if current_app.config.get("SQL_QUERY_BUDGET_STRICT"):
+            raise QueryBudgetExceeded(message)
+        log.warning(message)
+    return response
+
+
+def init_query_budget(app):
+    """Attach the statement counter and the after-request budget check."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    app.after_request(_check_budget)
@@ -0,0 +1,192 @@
+# app/utils/rate_limit.py
+"""
+Token-bucket rate limits for expensive or abusable routes.
+
+    @auth.route("/login", methods=["GET", "POST"])
+    @rate_limit("login", account=form_email)
+    def login(): ...
+
+RATE_LIMITS maps a limit name to buckets per client IP and per account:
+
+    "login": {"ip": (20, 60), "account": (5, 300)}
+
+(capacity, seconds): a bucket holds `capacity` tokens and refills at
+capacity/seconds, so short bursts are fine but the long-run rate is
+bounded. Every limited request takes one token from each bucket; if either
+is empty the request gets 429 with a Retry-After saying when the next
+token arrives. `account` is a function returning the account key for this
+request (e.g. the email typed into the form), or None to skip that bucket.
+
+Backends (RATE_LIMIT_BACKEND):
+  * "memory" - per process; with N workers the effective limit is up to N
+               times higher.
+  * "redis"  - shared via RATE_LIMIT_URL (needs the `redis` package).
+If the backend fails the request is let through. RATE_LIMIT_ENABLED =
+False turns the decorator into a no-op.
+
+The "ip" bucket uses request.remote_addr. Behind nginx or a load balancer
+set PROXY_FIX_X_FOR to the number of proxies in front of the app, or every
+client gets the proxy's address and the whole site shares one bucket.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, jsonify, render_template, request
+from flask_login import current_user
+
+log = logging.getLogger(__name__)
+
+
+class RateLimited(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Rate limit {name!r} exceeded")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# ------------------------------------------
+# Backends
+# ------------------------------------------
+class MemoryBuckets:
+    """Buckets in a per-process LRU (idle keys fall out first)."""
+
+    name = "memory"
+
+    def __init__(self, app):
+        self.max_keys = app.config["RATE_LIMIT_MAX_KEYS"]
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = Lock()
+
+    def take(self, key, capacity, seconds):
+        """Take a token; returns 0 if allowed, else seconds until the next one."""
+        rate = capacity / seconds
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBuckets:
+    """Shared buckets; one Lua call per take keeps it atomic across workers."""
+
+    name = "redis"
+    SCRIPT = """
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens, ts = tonumber(state[1]) or capacity, tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return tostring(wait)
+    """
+
+    def __init__(self, app):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND = 'redis' needs the 'redis' package")
+        self.client = redis.Redis.from_url(app.config["RATE_LIMIT_URL"])
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, seconds):
+        wait = self._take(keys=["rate-limit:" + key], args=[capacity, capacity / seconds, time.time()])
+        return float(wait)
+
+
+BACKENDS = {
+    "memory": MemoryBuckets,
+    "redis": RedisBuckets,
+}
+
+
+def get_rate_limiter():
+    """The app's bucket backend (created on first use)."""
+    buckets = current_app.extensions.get("rate_limit")
+    if buckets is None:
+        backend = BACKENDS[current_app.config["RATE_LIMIT_BACKEND"]]
+        buckets = current_app.extensions.setdefault("rate_limit", backend(current_app))
+        current_app.extensions.setdefault("rate_limit_stats", {})
+    return buckets
+
+
+def rate_limit_stats():
+    """Requests refused per limit name, for this process."""
+    get_rate_limiter()
+    return dict(current_app.extensions["rate_limit_stats"])
+
+
+# ------------------------------------------
+# Account keys
+# ------------------------------------------
+def form_email():
+    """Account key for login / password reset forms."""
+    return (request.form.get("email") or "").strip().lower() or None
+
+
+def logged_in_user():
+    return current_user.get_id() if current_user.is_authenticated else None
+
+
+# ------------------------------------------
+# Decorator
+# ------------------------------------------
+def check_rate_limit(name, account=None):
+    """Take a token from each of `name`'s buckets; raises RateLimited if any is empty."""
+    limits = current_app.config["RATE_LIMITS"].get(name, {})
+    keys = []
+    if "ip" in limits:
+        keys.append(("ip", request.remote_addr or "unknown"))
+    if "account" in limits and account is not None:
+        value = account()
+        if value:
+            keys.append(("account", value))
+
+    buckets = get_rate_limiter()
+    wait = 0
+    for scope, value in keys:
+        capacity, seconds = limits[scope]
+        try:
+            wait = max(wait, buckets.take(f"{name}:{scope}:{value}", capacity, seconds))
+        except Exception:  # e.g. Redis down - fail open rather than lock everyone out
+            log.exception("Rate limit check failed")
+    if wait > 0:
+        stats = current_app.extensions["rate_limit_stats"]
+        stats[name] = stats.get(name, 0) + 1
+        raise RateLimited(name, math.ceil(wait))
+
+
+def rate_limit(name, account=None, methods=None):
+    """Apply RATE_LIMITS[name] to this view (only to `methods`, if given)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if current_app.config["RATE_LIMIT_ENABLED"] and (methods is None or request.method in methods):
+                check_rate_limit(name, account)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def rate_limited_response(exc):
+    """429 page (or JSON for the API) with Retry-After."""
+    message = "Too many requests. Please wait a moment and try again."
+    if request.blueprint == "api" or request.accept_mimetypes.best == "application/json":
+        response = jsonify(error=message, retry_after=exc.retry_after)
+    else:
+        response = current_app.make_response(render_template("errors/429.html", retry_after=exc.retry_after))
+    response.status_code = 429
+    response.headers["Retry-After"] = str(exc.retry_after)
+    return response
@@ -0,0 +1,251 @@
+# app/utils/response_cache.py
+"""
+Whole-response cache for public pages (home, the anonymous papers list).
+
+    @main.route("/papers")
+    @cached_response(args=("q", "subject", "year", "page", "cursor"))
+    @query_budget(5)
+    def papers(): ...
+
+Only anonymous GETs without pending flash messages are served from or
+stored in the cache; logged-in pages show the user's name and are always
+rendered. The key is endpoint + the listed query args (trimmed, empties
+dropped, sorted - anything else in the URL is ignored) + the current paper
+"generation". add_paper/remove_paper bump the generation after commit, so
+every cached listing goes stale at once instead of being hunted down.
+
+Backends (RESPONSE_CACHE_BACKEND):
+  * "memory" - per-process LRU. The generation is per process too, so other
+               workers catch up within RESPONSE_CACHE_TTL.
+  * "redis"  - shared via RESPONSE_CACHE_URL (needs the `redis` package);
+               the generation is a shared counter.
+RESPONSE_CACHE_ENABLED = False turns the decorator into a no-op.
+"""
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import event
+
+from .. import db
+
+log = logging.getLogger(__name__)
+
+_BUMP_KEY = "response_cache_bump"
+
+
+# ------------------------------------------
+# Backends
+# ------------------------------------------
+class MemoryCache:
+    """Thread-safe LRU with a TTL per entry."""
+
+    name = "memory"
+
+    def __init__(self, app):
+        self.max_entries = app.config["RESPONSE_CACHE_MAX_ENTRIES"]
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generation = 0
+        self._lock = Lock()
+
+    def generation(self):
+        return self._generation
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()  # every key embeds the old generation now
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Shared cache; entries expire by TTL, the generation is one INCR key."""
+
+    name = "redis"
+    GENERATION_KEY = "response-cache:generation"
+
+    def __init__(self, app):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND = 'redis' needs the 'redis' package")
+        self.client = redis.Redis.from_url(app.config["RESPONSE_CACHE_URL"])
+
+    def generation(self):
+        return int(self.client.get(self.GENERATION_KEY) or 0)
+
+    def bump(self):
+        self.client.incr(self.GENERATION_KEY)
+
+    def get(self, key):
+        raw = self.client.get("response-cache:" + key)
+        if raw is None:
+            return None
+        content_type, _, body = raw.partition(b"\n")
+        return content_type.decode(), body
+
+    def set(self, key, value, ttl):
+        content_type, body = value
+        self.client.set("response-cache:" + key, content_type.encode() + b"\n" + body, ex=ttl)
+
+    def __len__(self):
+        return 0  # not tracked for the shared backend
+
+
+BACKENDS = {
+    "memory": MemoryCache,
+    "redis": RedisCache,
+}
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = self.misses = self.stores = self.bypasses = self.invalidations = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def get_response_cache():
+    """The app's cache backend (created on first use)."""
+    cache = current_app.extensions.get("response_cache")
+    if cache is None:
+        backend = BACKENDS[current_app.config["RESPONSE_CACHE_BACKEND"]]
+        cache = current_app.extensions.setdefault("response_cache", backend(current_app))
+        current_app.extensions.setdefault("response_cache_stats", CacheStats())
+    return cache
+
+
+def cache_stats():
+    """This process's hit/miss counters plus backend info."""
+    cache = get_response_cache()
+    stats = current_app.extensions["response_cache_stats"].as_dict()
+    stats.update(backend=cache.name, entries=len(cache), enabled=current_app.config["RESPONSE_CACHE_ENABLED"])
+    return stats
+
+
+# ------------------------------------------
+# Invalidation
+# ------------------------------------------
+def invalidate_responses():
+    """Make every cached page stale (now)."""
+    get_response_cache().bump()
+    current_app.extensions["response_cache_stats"].invalidations += 1
+
+
+def invalidate_after_commit():
+    """Bump the generation once the current transaction commits."""
+    db.session.info[_BUMP_KEY] = True
+
+
+def _bump_on_commit(session):
+    if session.in_nested_transaction():  # SAVEPOINT released; wait for the real commit
+        return
+    if session.info.pop(_BUMP_KEY, False):
+        try:
+            invalidate_responses()
+        except Exception:  # e.g. Redis down - pages just stay cached until their TTL
+            log.exception("Response cache invalidation failed")
+
+
+def _forget_bump(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_BUMP_KEY, None)
+
+
+def init_response_cache(app):
+    """Hook generation bumps onto the session's commit/rollback."""
+    if not event.contains(db.session, "after_commit", _bump_on_commit):
+        event.listen(db.session, "after_commit", _bump_on_commit)
+        event.listen(db.session, "after_soft_rollback", _forget_bump)
+
+
+# ------------------------------------------
+# Decorator
+# ------------------------------------------
+def _cache_key(args):
+    values = []
+    for name in args:
+        value = request.args.get(name, "").strip()
+        if value:
+            values.append(f"{name}={value}")
+    return f"{request.endpoint}:{get_response_cache().generation()}:{'&'.join(sorted(values))}"
+
+
+def _cacheable_request():
+    return (
+        request.method == "GET"
+        and "_flashes" not in session
+        and not current_user.is_authenticated
+    )
+
+
+def cached_response(args=()):
+    """Serve anonymous GETs of this view from the response cache.
+
+    `args` are the query parameters that change the page; others are ignored.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*view_args, **view_kwargs):
+            if not current_app.config["RESPONSE_CACHE_ENABLED"]:
+                return f(*view_args, **view_kwargs)
+
+            cache = get_response_cache()
+            stats = current_app.extensions["response_cache_stats"]
+            if not _cacheable_request():
+                stats.bypasses += 1
+                return f(*view_args, **view_kwargs)
+
+            try:
+                key = _cache_key(args)
+                cached = cache.get(key)
+            except Exception:
+                log.exception("Response cache lookup failed")
+                return f(*view_args, **view_kwargs)
+
+            if cached is not None:
+                stats.hits += 1
+                content_type, body = cached
+                response = current_app.response_class(body, content_type=content_type)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            stats.misses += 1
+            response = current_app.make_response(f(*view_args, **view_kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                try:
+                    cache.set(key, (response.content_type, response.get_data()),
+                              current_app.config["RESPONSE_CACHE_TTL"])
+                    stats.stores += 1
+                except Exception:
+                    log.exception("Response cache store failed")
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return decorated_function
+    return decorator
+
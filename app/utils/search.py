@@ -0,0 +1,235 @@
+# app/utils/search.py
+"""
+Full-text search for papers.
+
+One small interface, picked per database dialect:
+- SQLite -> FTS5 virtual table ``papers_fts`` (rowid = papers.id), kept in
+  sync by the routes that add/remove papers and by text extraction.
+- MySQL  -> FULLTEXT indexes on papers(title, subject, year) and
+  paper_pages(text). InnoDB maintains them itself, so index()/remove() are
+  no-ops there.
+- anything else -> the old ILIKE filter (no ranking).
+"""
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, or_, text
+
+from .. import db
+
+# Only plain word characters ever reach MATCH/AGAINST, so user input can't
+# inject FTS operators or break the query syntax.
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TERMS = 8
+
+
+def tokenize(q):
+    """Split a search box value into lower-cased search terms."""
+    return _TOKEN_RE.findall((q or "").lower())[:MAX_TERMS]
+
+
+# ------------------------------------------
+# Backends
+# ------------------------------------------
+class SearchBackend:
+    """Fallback backend: substring match with ILIKE, newest first."""
+
+    name = "like"
+
+    def setup(self):
+        """Create whatever index structure the backend needs (idempotent)."""
+
+    def index(self, paper):
+        """Add or refresh one paper. Call after flush(), before commit()."""
+
+    def remove(self, paper_id):
+        """Drop one paper from the index. Call before commit()."""
+
+    def remove_many(self, paper_ids):
+        """Drop several papers from the index. Call before commit()."""
+        for paper_id in paper_ids:
+            self.remove(paper_id)
+
+    def rebuild(self):
+        """Re-index every row in `papers`; returns the number of rows."""
+        from ..models import Paper
+        return Paper.query.count()
+
+    def search(self, query, q):
+        """Filter `query` (a Paper query) by `q` and order it by relevance."""
+        from ..models import Paper
+        like = f"%{q}%"
+        return query.filter(
+            or_(Paper.title.ilike(like), Paper.subject.ilike(like), Paper.year.ilike(like))
+        ).order_by(Paper.uploaded_at.desc())
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 with bm25 ranking (title > subject > year > file text)."""
+
+    name = "fts5"
+
+    def setup(self):
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts "
+            "USING fts5(title, subject, year, body, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+    def index(self, paper):
+        body = db.session.execute(
+            text("SELECT group_concat(text, char(10)) FROM "
+                 "(SELECT text FROM paper_pages WHERE paper_id = :id ORDER BY page_number)"),
+            {"id": paper.id},
+        ).scalar()
+        self.remove(paper.id)
+        db.session.execute(
+            text("INSERT INTO papers_fts (rowid, title, subject, year, body) "
+                 "VALUES (:id, :title, :subject, :year, :body)"),
+            {"id": paper.id, "title": paper.title, "subject": paper.subject,
+             "year": paper.year or "", "body": body or ""},
+        )
+
+    def remove(self, paper_id):
+        db.session.execute(text("DELETE FROM papers_fts WHERE rowid = :id"), {"id": paper_id})
+
+    def remove_many(self, paper_ids):
+        if paper_ids:
+            db.session.execute(
+                text("DELETE FROM papers_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(paper_ids)},
+            )
+
+    def rebuild(self):
+        # drop + create so an index built with an older column layout is replaced
+        db.session.execute(text("DROP TABLE IF EXISTS papers_fts"))
+        self.setup()
+        result = db.session.execute(text(
+            "INSERT INTO papers_fts (rowid, title, subject, year, body) "
+            "SELECT p.id, p.title, p.subject, COALESCE(p.year, ''), "
+            "COALESCE((SELECT group_concat(text, char(10)) FROM paper_pages WHERE paper_id = p.id), '') "
+            "FROM papers p"
+        ))
+        return result.rowcount
+
+    def search(self, query, q):
+        from ..models import Paper
+        terms = tokenize(q)
+        if not terms:
+            return query.order_by(Paper.uploaded_at.desc())
+
+        # every term must match, each as a prefix ("calc" finds "calculus")
+        match = " ".join(f'"{t}"*' for t in terms)
+        hits = (
+            text("SELECT rowid AS paper_id, bm25(papers_fts, 10.0, 4.0, 1.0, 0.5) AS score "
+                 "FROM papers_fts WHERE papers_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(paper_id=db.Integer, score=db.Float)
+            .subquery("fts_hits")
+        )
+        # bm25() is "lower is better"
+        return query.join(hits, hits.c.paper_id == Paper.id).order_by(
+            hits.c.score.asc(), Paper.uploaded_at.desc()
+        )
+
+
+class MySQLFulltextBackend(SearchBackend):
+    """MySQL FULLTEXT in boolean mode, ranked by MATCH() relevance."""
+
+    name = "fulltext"
+
+    INDEXES = {
+        "ix_papers_fulltext": "CREATE FULLTEXT INDEX ix_papers_fulltext ON papers (title, subject, year)",
+        "ix_paper_pages_fulltext": "CREATE FULLTEXT INDEX ix_paper_pages_fulltext ON paper_pages (text)",
+    }
+
+    def setup(self):
+        for name, ddl in self.INDEXES.items():
+            exists = db.session.execute(text(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND index_name = :name"
+            ), {"name": name}).scalar()
+            if not exists:
+                db.session.execute(text(ddl))
+
+    def rebuild(self):
+        self.setup()
+        db.session.execute(text("OPTIMIZE TABLE papers, paper_pages"))
+        return super().rebuild()
+
+    def search(self, query, q):
+        from sqlalchemy import func, select
+        from sqlalchemy.dialects.mysql import match
+        from ..models import Paper, PaperPage
+        terms = tokenize(q)
+        if not terms:
+            return query.order_by(Paper.uploaded_at.desc())
+
+        against = " ".join(f"+{t}*" for t in terms)
+        meta_score = match(Paper.title, Paper.subject, Paper.year, against=against).in_boolean_mode()
+        page_score = match(PaperPage.text, against=against).in_boolean_mode()
+        page_hits = (
+            select(PaperPage.paper_id, func.max(page_score).label("score"))
+            .where(page_score > 0)
+            .group_by(PaperPage.paper_id)
+            .subquery("page_hits")
+        )
+        # metadata hits outrank hits that only occur inside the file
+        score = meta_score * 4 + func.coalesce(page_hits.c.score, 0)
+        return (
+            query.outerjoin(page_hits, page_hits.c.paper_id == Paper.id)
+            .filter(or_(meta_score > 0, page_hits.c.paper_id.isnot(None)))
+            .order_by(score.desc(), Paper.uploaded_at.desc())
+        )
+
+
+BACKENDS = {
+    "like": SearchBackend,
+    "fts5": SQLiteFTSBackend,
+    "fulltext": MySQLFulltextBackend,
+}
+_DIALECT_DEFAULTS = {"sqlite": "fts5", "mysql": "fulltext", "mariadb": "fulltext"}
+
+
+def get_search_backend():
+    """Return the search backend for the current app (cached per app)."""
+    backend = current_app.extensions.get("search")
+    if backend is None:
+        name = current_app.config.get("SEARCH_BACKEND", "auto")
+        if name == "auto":
+            name = _DIALECT_DEFAULTS.get(db.engine.dialect.name, "like")
+        backend = BACKENDS[name]()
+        current_app.extensions["search"] = backend
+    return backend
+
+
+# ------------------------------------------
+# CLI: flask search rebuild
+# ------------------------------------------
+search_cli = AppGroup("search", help="Manage the paper full-text index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """(Re)create the search index and fill it from the papers table."""
+    backend = get_search_backend()
+    count = backend.rebuild()
+    db.session.commit()
+    click.echo(f"Indexed {count} papers with the '{backend.name}' backend.")
+
+
+@search_cli.command("extract")
+@click.option("--all", "everything", is_flag=True, help="Re-extract papers that already have text.")
+def extract_command(everything):
+    """Extract file text for papers that don't have it yet (runs inline)."""
+    from ..models import Paper
+    from .extraction import STATUS_DONE, STATUS_UNSUPPORTED, extract_paper_text
+
+    query = Paper.query.with_entities(Paper.id).order_by(Paper.id)
+    if not everything:
+        query = query.filter(Paper.text_status.notin_([STATUS_DONE, STATUS_UNSUPPORTED]))
+    ids = [row.id for row in query]
+    for paper_id in ids:
+        extract_paper_text(paper_id)
+    click.echo(f"Processed {len(ids)} papers.")
@@ -0,0 +1,501 @@
+# app/utils/storage.py
+"""
+Content-addressed storage for paper files.
+
+Uploads are streamed to a temp file while being hashed (SHA-256), then put
+into the file store (utils/file_store.py: UPLOAD_PATH or an S3 bucket) under
+<h[0:2]>/<h[2:4]>/<hash><ext>. Identical bytes are stored
+once; the stored_files table keeps a reference count per hash and the file
+is removed only when the last Paper pointing at it is deleted. Removal is a
+job queued in the deleting transaction (utils/jobs.py), so it happens off
+the request thread and only if that transaction commits. The job holds the
+hash's unique key in stored_files while it deletes, so it can't remove a
+file that an upload of the same bytes has just put but not yet committed.
+
+Paper.file_path holds that key, so rows created before this layout (bare
+filenames, always on local disk) keep resolving until
+`flask storage migrate` rehomes them. `flask storage reconcile` checks the
+store against both tables (orphans, missing files, size and reference
+count drift) and reclaims what nothing points at.
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from .file_store import get_file_store
+from .jobs import enqueue, task
+
+CHUNK_SIZE = 64 * 1024
+REMOVAL_BATCH = 200  # files per removal job for bulk deletes
+
+
+def shard_path(digest, ext):
+    """Relative path for a hash: ab/cd/abcd....pdf"""
+    return os.path.join(digest[:2], digest[2:4], digest + ext.lower())
+
+
+def hash_file(path):
+    """Stream a file from disk and return (sha256 hex, size)."""
+    with open(path, "rb") as fh:
+        return hash_stream(fh)
+
+
+def hash_stream(fh):
+    """(sha256 hex, size) of a binary stream, read in chunks."""
+    sha, size = hashlib.sha256(), 0
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def _temp_dir():
+    path = os.path.join(current_app.config["UPLOAD_PATH"], ".tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_temp(stream):
+    """Copy a stream into a temp file under UPLOAD_PATH, hashing as we go."""
+    sha, size = hashlib.sha256(), 0
+    fd, temp_path = tempfile.mkstemp(dir=_temp_dir())
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, sha.hexdigest(), size
+
+
+def part_path(upload_id):
+    """Where a chunked upload (see main/uploads.py) accumulates its bytes."""
+    path = os.path.join(_temp_dir(), "chunked")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f"{upload_id}.part")
+
+
+# ------------------------------------------
+# Store / release
+# ------------------------------------------
+def adopt_file(temp_path, digest, size, ext):
+    """Move an already-hashed temp file into the store and take a reference.
+
+    Returns the StoredFile row. Must be followed by a commit.
+    """
+    stored = _get_or_create(digest, size, ext)
+    if not _add_reference(stored):
+        # the row was released and deleted under us; start over with a fresh one
+        stored = _get_or_create(digest, size, ext)
+        _add_reference(stored)
+
+    get_file_store().put(temp_path, stored.path)
+    return stored
+
+
+def _get_or_create(digest, size, ext):
+    from ..models import StoredFile
+
+    stored = StoredFile.query.filter_by(sha256=digest).first()
+    if stored is None:
+        stored = StoredFile(sha256=digest, path=shard_path(digest, ext), size=size, ref_count=0)
+        try:
+            with db.session.begin_nested():
+                db.session.add(stored)
+        except IntegrityError:  # a concurrent upload of the same bytes won the insert
+            stored = StoredFile.query.filter_by(sha256=digest).one()
+    return stored
+
+
+def _add_reference(stored):
+    """Atomically bump ref_count; False if the row no longer exists."""
+    from ..models import StoredFile
+
+    updated = StoredFile.query.filter_by(id=stored.id).update(
+        {StoredFile.ref_count: StoredFile.ref_count + 1}, synchronize_session=False
+    )
+    if updated:
+        db.session.refresh(stored)
+    return bool(updated)
+
+
+def store_upload(stream, ext):
+    """Store an uploaded file stream; returns its StoredFile row."""
+    temp_path, digest, size = _write_temp(stream)
+    return adopt_file(temp_path, digest, size, ext)
+
+
+def release_file(paper):
+    """Drop `paper`'s reference to its file. The file itself is deleted by a
+    job if nothing else points at it. Call before deleting the paper."""
+    from ..models import Paper, StoredFile
+
+    if paper.file_hash is None:
+        # pre-content-addressing row: delete the bare file unless shared
+        shared = Paper.query.filter(Paper.file_path == paper.file_path, Paper.id != paper.id).count()
+        if not shared:
+            enqueue("remove_stored_file", paper.file_path, None)
+        return
+
+    StoredFile.query.filter_by(sha256=paper.file_hash).update(
+        {StoredFile.ref_count: StoredFile.ref_count - 1}, synchronize_session=False
+    )
+    stored = StoredFile.query.filter_by(sha256=paper.file_hash).populate_existing().first()
+    if stored is not None and stored.ref_count <= 0:
+        db.session.delete(stored)
+        enqueue("remove_stored_file", stored.path, stored.sha256)
+        # cached previews of this file go with it
+        enqueue("remove_derivatives", stored.sha256)
+
+
+def release_files(papers):
+    """Set-based release_file for many papers at once (ORM objects or rows
+    with id, file_hash and file_path). Returns how many files will go."""
+    from ..models import Paper, StoredFile
+
+    ids = {paper.id for paper in papers}
+    removals = []
+
+    legacy_paths = {paper.file_path for paper in papers if paper.file_hash is None}
+    if legacy_paths:
+        still_used = {
+            row.file_path for row in
+            db.session.query(Paper.file_path)
+            .filter(Paper.file_path.in_(legacy_paths), Paper.id.notin_(ids))
+            .distinct()
+        }
+        removals += [(path, None) for path in sorted(legacy_paths - still_used)]
+
+    references = Counter(paper.file_hash for paper in papers if paper.file_hash)
+    if references:
+        # one UPDATE, each hash decremented by the number of papers using it
+        StoredFile.query.filter(StoredFile.sha256.in_(references)).update(
+            {StoredFile.ref_count: StoredFile.ref_count - case(references, value=StoredFile.sha256, else_=0)},
+            synchronize_session=False,
+        )
+        released = (
+            db.session.query(StoredFile.sha256, StoredFile.path)
+            .filter(StoredFile.sha256.in_(references), StoredFile.ref_count <= 0)
+            .all()
+        )
+        if released:
+            StoredFile.query.filter(StoredFile.sha256.in_([row.sha256 for row in released])).delete(
+                synchronize_session=False
+            )
+            removals += [(row.path, row.sha256) for row in released]
+
+    for start in range(0, len(removals), REMOVAL_BATCH):
+        enqueue("remove_stored_files", removals[start:start + REMOVAL_BATCH])
+    return len(removals)
+
+
+def _claim_digest(digest, relative_path):
+    """Insert an uncommitted placeholder row for `digest`; None if it's taken.
+
+    adopt_file inserts (or updates) the same row before it puts the file, so
+    an upload still in flight makes this insert wait for it and then fail,
+    and an upload starting now waits on the placeholder until we commit.
+    """
+    from ..models import StoredFile
+
+    placeholder = StoredFile(sha256=digest, path=relative_path, size=0, ref_count=0)
+    try:
+        with db.session.begin_nested():
+            db.session.add(placeholder)
+    except IntegrityError:  # stored again (committed or in flight): keep the file
+        return None
+    return placeholder
+
+
+@task("remove_stored_file")
+def remove_stored_file(relative_path, digest):
+    """Delete a released file - unless it came back in the meantime (the same
+    bytes uploaded again, or another legacy paper using the path)."""
+    from ..models import Paper
+
+    if digest is not None:
+        placeholder = _claim_digest(digest, relative_path)
+        if placeholder is None:
+            return
+        try:
+            get_file_store().delete(relative_path)
+        finally:
+            db.session.delete(placeholder)
+            db.session.commit()
+        return
+    if Paper.query.filter_by(file_path=relative_path).first() is not None:
+        return
+    # bare-filename files predate the file store and always sit on local disk
+    try:
+        os.remove(os.path.join(current_app.config["UPLOAD_PATH"], relative_path))
+    except FileNotFoundError:
+        pass
+
+
+@task("remove_stored_files")
+def remove_stored_files(entries):
+    """Batch of [relative_path, digest] pairs from release_files()."""
+    from .derivatives import remove_derivatives
+
+    for relative_path, digest in entries:
+        remove_stored_file(relative_path, digest)
+        if digest is not None:
+            remove_derivatives(digest)
+
+
+@task("remove_upload_parts")
+def remove_upload_parts(upload_ids):
+    """Delete the .part files of discarded chunked uploads."""
+    for upload_id in upload_ids:
+        try:
+            os.remove(part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+
+# ------------------------------------------
+# Reconciling the store with the database
+# ------------------------------------------
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Reconciliation:
+    """What `flask storage reconcile` found."""
+
+    def __init__(self):
+        self.files = self.rows = 0
+        self.orphans = []          # (relative path, size) on disk, known to no row
+        self.missing = []          # (relative path, paper ids) rows whose file is gone
+        self.size_mismatch = []    # (relative path, expected, actual)
+        self.hash_mismatch = []    # (relative path, actual sha256)
+        self.ref_drift = []        # (sha256, stored ref_count, actual papers)
+        self.dangling = []         # paper ids whose file_hash has no stored_files row
+
+    @property
+    def orphan_bytes(self):
+        return sum(size for _, size in self.orphans)
+
+
+def find_orphans(report, batch_size, min_age):
+    """Pass 1: stream the directory; look each batch of paths up in one query per table."""
+    from ..models import Paper, StoredFile
+
+    cutoff = datetime.now().timestamp() - min_age
+    for batch in _batches(get_file_store().iter_keys(), batch_size):
+        report.files += len(batch)
+        paths = [path for path, _, _ in batch]
+        known = {row.path for row in db.session.query(StoredFile.path).filter(StoredFile.path.in_(paths))}
+        known |= {
+            row.file_path for row in
+            db.session.query(Paper.file_path).filter(Paper.file_path.in_(paths), Paper.file_hash.is_(None))
+        }
+        for path, size, mtime in batch:
+            # files younger than min_age may belong to an upload that hasn't committed yet
+            if path not in known and mtime < cutoff:
+                report.orphans.append((path, size))
+
+
+def check_rows(report, batch_size, verify):
+    """Pass 2: stream stored_files (then legacy papers) by id and check each file."""
+    from ..models import Paper, StoredFile
+
+    upload_path = current_app.config["UPLOAD_PATH"]
+    store = get_file_store()
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(StoredFile.id, StoredFile.sha256, StoredFile.path, StoredFile.size, StoredFile.ref_count)
+            .filter(StoredFile.id > last_id).order_by(StoredFile.id).limit(batch_size).all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        report.rows += len(rows)
+        refs = dict(
+            db.session.query(Paper.file_hash, func.count(Paper.id))
+            .filter(Paper.file_hash.in_([row.sha256 for row in rows]))
+            .group_by(Paper.file_hash)
+        )
+        for row in rows:
+            if refs.get(row.sha256, 0) != row.ref_count:
+                report.ref_drift.append((row.sha256, row.ref_count, refs.get(row.sha256, 0)))
+            size = store.size(row.path)
+            if size is None:
+                ids = [p.id for p in db.session.query(Paper.id).filter_by(file_hash=row.sha256)]
+                report.missing.append((row.path, ids))
+                continue
+            if size != row.size:
+                report.size_mismatch.append((row.path, row.size, size))
+            if verify:
+                with store.open(row.path) as fh:
+                    digest, _ = hash_stream(fh)
+                if digest != row.sha256:
+                    report.hash_mismatch.append((row.path, digest))
+
+    # legacy rows (bare filenames) and papers whose stored_files row is gone
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(Paper.id, Paper.file_path, Paper.file_hash, StoredFile.id.label("stored_id"))
+            .outerjoin(StoredFile, StoredFile.sha256 == Paper.file_hash)
+            .filter(Paper.id > last_id)
+            .filter(or_(Paper.file_hash.is_(None), StoredFile.id.is_(None)))
+            .order_by(Paper.id).limit(batch_size).all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            if row.file_hash is not None:
+                report.dangling.append(row.id)
+            elif not os.path.exists(os.path.join(upload_path, row.file_path)):
+                report.missing.append((row.file_path, [row.id]))
+
+
+def repair(report):
+    """Reclaim orphans and fix reference counts. Returns bytes freed. Commits."""
+    from ..models import Paper, StoredFile
+
+    store = get_file_store()
+    freed = 0
+    for path, size in report.orphans:
+        store.delete(path)
+        freed += size
+
+    for digest, _, _ in report.ref_drift:
+        # recount in the UPDATE itself, in case uploads happened since the scan
+        actual = (
+            db.session.query(func.count(Paper.id)).filter(Paper.file_hash == StoredFile.sha256).scalar_subquery()
+        )
+        StoredFile.query.filter_by(sha256=digest).update({StoredFile.ref_count: actual}, synchronize_session=False)
+        stored = StoredFile.query.filter_by(sha256=digest).populate_existing().first()
+        if stored is not None and stored.ref_count <= 0:  # unreferenced: release like release_file would
+            db.session.delete(stored)
+            enqueue("remove_stored_files", [[stored.path, digest]])
+    db.session.commit()
+    return freed
+
+
+# ------------------------------------------
+# CLI: flask storage migrate / clean-uploads / reconcile
+# ------------------------------------------
+storage_cli = AppGroup("storage", help="Manage stored paper files.")
+
+
+@storage_cli.command("migrate")
+@click.option("--dry-run", is_flag=True, help="Only report what would move.")
+def migrate_command(dry_run):
+    """Rehome flat-directory uploads into the content-addressed layout."""
+    from ..models import Paper
+
+    upload_path = current_app.config["UPLOAD_PATH"]
+    legacy_paths = [
+        row.file_path for row in
+        db.session.query(Paper.file_path).filter(Paper.file_hash.is_(None)).distinct().order_by(Paper.file_path)
+    ]
+    moved = missing = 0
+    for relative in legacy_paths:
+        source = os.path.join(upload_path, relative)
+        if not os.path.exists(source):
+            click.echo(f"missing: {relative}")
+            missing += 1
+            continue
+        papers = Paper.query.filter_by(file_path=relative, file_hash=None).all()
+        if dry_run:
+            click.echo(f"would move: {relative} ({len(papers)} papers)")
+            continue
+
+        # copy into a temp file first so a crash never loses the original
+        with open(source, "rb") as fh:
+            temp_path, digest, size = _write_temp(fh)
+        ext = os.path.splitext(relative)[1]
+        stored = None
+        for paper in papers:
+            if stored is None:
+                stored = adopt_file(temp_path, digest, size, ext)
+            else:
+                _add_reference(stored)
+            paper.original_filename = paper.original_filename or os.path.basename(relative)
+            paper.file_path = stored.path
+            paper.file_hash = digest
+        enqueue("remove_stored_file", relative, None)
+        db.session.commit()
+        moved += 1
+
+    click.echo(f"Moved {moved} files, {missing} missing.")
+
+
+
+@storage_cli.command("clean-uploads")
+@click.option("--hours", type=int, default=None, help="Age limit (default UPLOAD_SESSION_TTL_HOURS).")
+def clean_uploads_command(hours):
+    """Discard chunked uploads that haven't received data for a while."""
+    from ..models import UploadSession
+
+    hours = hours if hours is not None else current_app.config["UPLOAD_SESSION_TTL_HOURS"]
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        try:
+            os.remove(part_path(upload.id))
+        except FileNotFoundError:
+            pass
+        db.session.delete(upload)
+    db.session.commit()
+    click.echo(f"Removed {len(stale)} stale uploads.")
+
+
+@storage_cli.command("reconcile")
+@click.option("--dry-run", is_flag=True, help="Only report; change nothing.")
+@click.option("--verify", is_flag=True, help="Also re-hash every stored file (reads all bytes).")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+@click.option("--min-age", type=int, default=3600, show_default=True,
+              help="Seconds before an unreferenced file counts as an orphan.")
+@click.option("--limit", type=int, default=20, show_default=True, help="Entries listed per problem.")
+def reconcile_command(dry_run, verify, batch_size, min_age, limit):
+    """Compare UPLOAD_PATH with stored_files/papers; reclaim orphaned files."""
+    report = Reconciliation()
+    find_orphans(report, batch_size, min_age)
+    check_rows(report, batch_size, verify)
+
+    click.echo(f"Scanned {report.files} files and {report.rows} stored_files rows.")
+    sections = [
+        ("orphaned files", [f"{path} ({size} bytes)" for path, size in report.orphans]),
+        ("missing files", [f"{path} (papers {', '.join(map(str, ids)) or '-'})" for path, ids in report.missing]),
+        ("size mismatches", [f"{path}: expected {want}, found {got}" for path, want, got in report.size_mismatch]),
+        ("content mismatches", [f"{path}: hashes to {digest}" for path, digest in report.hash_mismatch]),
+        ("reference count drift", [f"{digest}: {stored} stored, {actual} papers" for digest, stored, actual in report.ref_drift]),
+        ("papers without a stored file", [f"paper {paper_id}" for paper_id in report.dangling]),
+    ]
+    for title, lines in sections:
+        click.echo(f"{len(lines)} {title}")
+        for line in lines[:limit]:
+            click.echo(f"  {line}")
+        if len(lines) > limit:
+            click.echo(f"  ... and {len(lines) - limit} more")
+
+    if dry_run:
+        click.echo(f"Dry run: {report.orphan_bytes} bytes reclaimable.")
+        return
+    freed = repair(report)
+    click.echo(f"Removed {len(report.orphans)} orphaned files ({freed} bytes); fixed {len(report.ref_drift)} reference counts.")
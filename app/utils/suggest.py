@@ -0,0 +1,212 @@
+# app/utils/suggest.py
+"""
+In-memory prefix index for the search box typeahead (main.suggest).
+
+Every subject and title is normalized (lower case, accents and punctuation
+dropped) and stored in a sorted array under each of its word starts, so
+"lin" finds both "Linear Algebra" and "Applied Linear Models". A lookup is
+one bisect plus a short scan; the best matches by popularity (number of
+papers carrying that subject/title) win.
+
+The index is per process: a background thread started by the first request
+the process serves loads it (subject counts from paper_facets, title counts
+from one grouped query) and reloads it every SUGGEST_REFRESH_SECONDS so
+changes made by other workers show up too; add_paper/remove_paper update it
+in place in between. Requests only ever read it, and CLI commands (db
+upgrade, the job worker, import-papers) never touch it. Until the first
+load finishes, or while loading fails, lookups return nothing.
+SUGGEST_REFRESH_SECONDS = 0 loads once and never refreshes.
+"""
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from .. import db
+
+log = logging.getLogger(__name__)
+
+SUBJECT = "subject"
+TITLE = "title"
+
+MAX_KEY_WORDS = 6      # word starts indexed per entry
+MAX_SCAN = 2000        # keys looked at per lookup, keeps short prefixes cheap
+
+
+def normalize(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(ch for ch in value if not unicodedata.combining(ch)).lower()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in value).split())
+
+
+def _word_starts(key):
+    words = key.split(" ")
+    return [" ".join(words[i:]) for i in range(min(len(words), MAX_KEY_WORDS))]
+
+
+class PrefixIndex:
+    """Sorted (key, kind, text) array plus a popularity count per entry."""
+
+    def __init__(self):
+        self._keys = []
+        self._counts = {}  # (kind, text) -> number of papers
+        self._lock = Lock()
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _insert(self, kind, text):
+        for key in _word_starts(normalize(text)):
+            if key:
+                insort(self._keys, (key, kind, text))
+
+    def _delete(self, kind, text):
+        for key in _word_starts(normalize(text)):
+            pos = bisect_left(self._keys, (key, kind, text))
+            if pos < len(self._keys) and self._keys[pos] == (key, kind, text):
+                del self._keys[pos]
+
+    def add(self, kind, text, count=1):
+        if not text:
+            return
+        with self._lock:
+            entry = (kind, text)
+            if entry not in self._counts:
+                self._insert(kind, text)
+            self._counts[entry] = self._counts.get(entry, 0) + count
+
+    def remove(self, kind, text):
+        with self._lock:
+            entry = (kind, text)
+            if entry not in self._counts:
+                return
+            self._counts[entry] -= 1
+            if self._counts[entry] <= 0:
+                del self._counts[entry]
+                self._delete(kind, text)
+
+    def load(self, entries):
+        """Replace the contents with (kind, text, count) rows."""
+        counts = {}
+        for kind, text, count in entries:
+            if text:
+                counts[(kind, text)] = counts.get((kind, text), 0) + count
+        keys = sorted(
+            (key, kind, text)
+            for kind, text in counts
+            for key in _word_starts(normalize(text)) if key
+        )
+        with self._lock:
+            self._keys, self._counts = keys, counts
+            self.loaded_at = time.monotonic()
+
+    def suggest(self, prefix, limit=8, kind=None):
+        """Top `limit` (kind, text, count) whose words start with `prefix`."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            keys, counts = self._keys, self._counts
+            seen = {}
+            pos = bisect_left(keys, (prefix,))
+            end = min(len(keys), pos + MAX_SCAN)
+            while pos < end and keys[pos][0].startswith(prefix):
+                _, entry_kind, text = keys[pos]
+                if kind is None or entry_kind == kind:
+                    seen[(entry_kind, text)] = counts.get((entry_kind, text), 0)
+                pos += 1
+        ranked = sorted(seen.items(), key=lambda item: (-item[1], len(item[0][1]), item[0][1]))
+        return [(entry_kind, text, count) for (entry_kind, text), count in ranked[:limit]]
+
+
+def _load_entries():
+    from ..models import Paper, PaperFacet
+
+    subjects = (
+        db.session.query(PaperFacet.subject, func.sum(PaperFacet.count))
+        .group_by(PaperFacet.subject)
+        .all()
+    )
+    titles = db.session.query(Paper.title, func.count(Paper.id)).group_by(Paper.title).all()
+    return [(SUBJECT, s, int(n)) for s, n in subjects] + [(TITLE, t, n) for t, n in titles]
+
+
+def refresh_suggest_index(app):
+    """Reload the app's index from the database; returns False if that failed."""
+    index = app.extensions["suggest"]
+    with app.app_context():
+        try:
+            entries = _load_entries()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            log.warning("Loading the suggest index failed: %s", getattr(exc, "orig", None) or exc)
+            return False
+        finally:
+            db.session.remove()
+    index.load(entries)  # swaps the arrays under the index lock
+    return True
+
+
+def _run_refresher(app, interval):
+    while True:
+        try:
+            refresh_suggest_index(app)
+        except Exception:
+            log.exception("Suggest refresh thread error")
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+_refresher_lock = threading.Lock()
+
+
+def _start_refresher():
+    app = current_app._get_current_object()
+    if "suggest_refresher" in app.extensions:
+        return
+    with _refresher_lock:
+        if "suggest_refresher" not in app.extensions:
+            thread = threading.Thread(
+                target=_run_refresher, args=(app, app.config["SUGGEST_REFRESH_SECONDS"]),
+                name="suggest-refresher", daemon=True,
+            )
+            app.extensions["suggest_refresher"] = thread
+            thread.start()
+
+
+def init_suggest(app):
+    """Set up an empty index; the first request starts loading it in the background."""
+    app.extensions["suggest"] = PrefixIndex()
+    app.before_request(_start_refresher)
+
+
+def get_suggest_index():
+    """This process's index (loaded and refreshed by the suggest-refresher thread)."""
+    return current_app.extensions["suggest"]
+
+
+def _loaded_index():
+    index = current_app.extensions.get("suggest")
+    return index if index is not None and index.loaded_at is not None else None
+
+
+def suggest_added(paper):
+    index = _loaded_index()  # not loaded yet: the first load will include it
+    if index is not None:
+        index.add(SUBJECT, paper.subject)
+        index.add(TITLE, paper.title)
+
+
+def suggest_removed(paper):
+    index = _loaded_index()
+    if index is not None:
+        index.remove(SUBJECT, paper.subject)
+        index.remove(TITLE, paper.title)
@@ -0,0 +1,98 @@
+# app/utils/user_cache.py
+"""
+Per-process cache for the logged-in user.
+
+Flask-Login calls the user_loader on every authenticated request; without a
+cache that is a users-table hit per request. load_cached_user() keeps a
+small detached snapshot of each user (CachedUser - no session, no lazy
+relationships) for USER_CACHE_TTL seconds.
+
+Anything that changes what the snapshot holds (ban/unban, promote/demote,
+delete, password reset) must call invalidate_user() *after* committing.
+Other worker processes pick the change up when their entry expires, so the
+TTL is the upper bound on how stale a role or ban can be.
+"""
+import time
+from threading import Lock
+
+from flask import current_app
+from flask_login import UserMixin
+
+from .. import db
+
+_cache = {}  # user_id -> (expires_at, CachedUser)
+_lock = Lock()
+
+
+class CachedUser(UserMixin):
+    """Read-only stand-in for models.User as `current_user`.
+
+    Carries only the columns the request path reads. Load the real row
+    (db.session.get(User, current_user.id)) before changing anything.
+    """
+
+    __slots__ = ("id", "username", "email", "role", "is_banned", "active")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.is_banned = bool(user.is_banned)
+        self.active = user.active is not False
+
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def is_active(self):
+        return self.active and not self.is_banned
+
+
+def load_cached_user(user_id):
+    """user_loader body: a CachedUser, or None for unknown/banned users."""
+    from ..models import User
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        cached = entry[1]
+    else:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        cached = CachedUser(user)
+        ttl = current_app.config["USER_CACHE_TTL"]
+        if ttl > 0:
+            with _lock:
+                if len(_cache) >= current_app.config["USER_CACHE_MAX_ENTRIES"]:
+                    _evict(now)
+                _cache[user_id] = (now + ttl, cached)
+
+    # a ban logs the user out on their next request
+    return None if cached.is_banned else cached
+
+
+def _evict(now):
+    """Drop expired entries, then the oldest ones if still full. Holds _lock."""
+    for key in [k for k, (expires, _) in _cache.items() if expires <= now]:
+        del _cache[key]
+    while len(_cache) >= current_app.config["USER_CACHE_MAX_ENTRIES"]:
+        del _cache[next(iter(_cache))]
+
+
+def invalidate_user(user_id):
+    """Forget a user's snapshot in this process (call after commit)."""
+    with _lock:
+        _cache.pop(int(user_id), None)
+
+
+def clear_user_cache():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,90 @@
+# benchmarks/compare.py
+"""
+Compare two benchmarks/run.py result files.
+
+    python benchmarks/compare.py base.json head.json --threshold 15
+
+Prints p50, p99, throughput and SQL statements per request for every
+scenario in both files, with the change from base to head. Exits 1 when a
+scenario regressed: p50 or p99 grew by more than --threshold percent (and
+by more than --min-ms, so sub-millisecond jitter doesn't count), or it
+runs more SQL statements per request than before. Warns when the two runs
+used different dataset settings, since their numbers aren't comparable.
+"""
+import json
+import sys
+
+import click
+
+
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def change(old, new):
+    if not old:
+        return "    n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def regressions(name, old, new, threshold, min_ms):
+    """Reasons `new` is worse than `old` for one scenario."""
+    found = []
+    for key in ("p50_ms", "p99_ms"):
+        grew = new[key] - old[key]
+        if grew > min_ms and old[key] and grew / old[key] * 100 > threshold:
+            found.append(f"{name}: {key} {old[key]:.2f} -> {new[key]:.2f}")
+    if new["sql_per_request"] > old["sql_per_request"]:
+        found.append(f"{name}: SQL per request {old['sql_per_request']} -> {new['sql_per_request']}")
+    if new["errors"] > old["errors"]:
+        found.append(f"{name}: {new['errors']} errors")
+    return found
+
+
+@click.command()
+@click.argument("base", type=click.Path(exists=True, dir_okay=False))
+@click.argument("head", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", type=float, default=10.0, show_default=True, help="Allowed latency growth, percent.")
+@click.option("--min-ms", type=float, default=0.5, show_default=True, help="Ignore latency changes below this.")
+def main(base, head, threshold, min_ms):
+    """Show what changed between two benchmark runs."""
+    base_report, head_report = load(base), load(head)
+    base_meta, head_meta = base_report["meta"], head_report["meta"]
+    click.echo(f"base {(base_meta.get('commit') or '?')[:12]}  head {(head_meta.get('commit') or '?')[:12]}")
+
+    ignore = {"iterations", "warmup"}
+    differing = sorted(
+        key for key in set(base_meta["options"]) | set(head_meta["options"])
+        if key not in ignore and base_meta["options"].get(key) != head_meta["options"].get(key)
+    )
+    if differing:
+        click.echo(f"warning: runs used different settings ({', '.join(differing)})", err=True)
+
+    click.echo(f"{'scenario':16s} {'p50 ms':>18s} {'':>7s} {'p99 ms':>18s} {'':>7s} {'req/s':>18s} {'':>7s} {'sql':>11s}")
+    found = []
+    for name, new in head_report["scenarios"].items():
+        old = base_report["scenarios"].get(name)
+        if old is None:
+            click.echo(f"{name:16s} (new)")
+            continue
+        click.echo(
+            f"{name:16s} "
+            f"{old['p50_ms']:8.2f} {new['p50_ms']:9.2f} {change(old['p50_ms'], new['p50_ms'])} "
+            f"{old['p99_ms']:8.2f} {new['p99_ms']:9.2f} {change(old['p99_ms'], new['p99_ms'])} "
+            f"{old['throughput_rps']:8.1f} {new['throughput_rps']:9.1f} "
+            f"{change(old['throughput_rps'], new['throughput_rps'])} "
+            f"{old['sql_per_request']:5.1f} {new['sql_per_request']:5.1f}"
+        )
+        found.extend(regressions(name, old, new, threshold, min_ms))
+
+    if found:
+        click.echo("\nRegressions:", err=True)
+        for line in found:
+            click.echo(f"  {line}", err=True)
+        sys.exit(1)
+    click.echo("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
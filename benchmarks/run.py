@@ -0,0 +1,322 @@
+# benchmarks/run.py
+"""
+Performance benchmarks for the main request paths.
+
+    python benchmarks/run.py --papers 20000 --output results/abc123.json
+    python benchmarks/compare.py results/old.json results/new.json
+
+Each run builds a fresh SQLite database in a scratch directory, seeds it
+with benchmarks/seed.py (deterministic for a given --seed) and drives the
+app through the Flask test client - no web server, so the figures are
+the app's own cost per request:
+
+  search          GET /papers?q=<term>             (FTS ranking + facets)
+  deep_pages      GET /papers?cursor=<deep cursor> (keyset pagination)
+  deep_search     GET /papers?q=<subject>&page=<deep page> (offset pagination)
+  dashboard       GET /dashboard, logged in
+  admin_dashboard GET /admin/dashboard?user_page=<n>, as admin
+  upload          POST /upload of a new file
+  download        GET /download/<id> (body read in full)
+  login           POST /login from a fresh client (one bcrypt verify)
+
+Per scenario the JSON results hold throughput, mean/p50/p90/p99/max
+latency and the mean number of SQL statements per request, next to the
+git commit and dataset settings, so two runs can be compared with
+benchmarks/compare.py. Rate limits, the response cache and background jobs
+are off (JOBS_MODE = "external": uploads only queue their jobs), so the
+numbers don't depend on what ran before.
+"""
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib.metadata import version
+
+import click
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = (
+    "search", "deep_pages", "deep_search", "dashboard", "admin_dashboard", "upload", "download", "login",
+)
+
+
+# ------------------------------------------
+# Measuring
+# ------------------------------------------
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def measure(send, iterations, warmup, expected):
+    """Call send(i) warmup + iterations times; stats for the measured calls.
+
+    send returns a test client response; anything not in `expected` counts
+    as an error (and is still timed).
+    """
+    from app.utils.query_budget import count_queries
+
+    for i in range(warmup):
+        send(i).close()
+    latencies, statements, errors = [], 0, 0
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        with count_queries() as counter:
+            t0 = time.perf_counter()
+            response = send(i)
+            response.get_data()  # streamed bodies (downloads) are part of the cost
+            latencies.append(time.perf_counter() - t0)
+        response.close()
+        statements += counter.count
+        if response.status_code not in expected:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        "throughput_rps": round(iterations / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+        "sql_per_request": round(statements / iterations, 2) if iterations else 0.0,
+    }
+
+
+# ------------------------------------------
+# Scenarios
+# ------------------------------------------
+class Bench:
+    """Seeded app, logged-in clients and the inputs each scenario cycles through."""
+
+    def __init__(self, app, options):
+        from app import db
+        from app.models import Paper
+        from sqlalchemy import func
+        from benchmarks.seed import ADMIN_EMAIL, SEARCH_TERMS, SUBJECTS
+
+        self.app = app
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.anonymous = app.test_client()
+        self.user = self.logged_in("user1@bench.example.com")
+        self.admin = self.logged_in(ADMIN_EMAIL)
+
+        with app.app_context():
+            from app.utils.pagination import NEXT, encode_cursor
+
+            total = db.session.query(Paper.id).count()
+            self.paper_ids = [row.id for row in db.session.query(Paper.id).order_by(Paper.id)]
+            # cursors 50-99% of the way down the newest-first listing
+            newest_first = db.session.query(Paper.uploaded_at, Paper.id).order_by(
+                Paper.uploaded_at.desc(), Paper.id.desc()
+            )
+            self.cursors = []
+            for depth in range(50, 100, 5):
+                row = newest_first.offset(total * depth // 100).limit(1).first()
+                if row:
+                    self.cursors.append(encode_cursor(NEXT, row.uploaded_at, row.id))
+
+            subject_counts = dict(db.session.query(Paper.subject, func.count(Paper.id)).group_by(Paper.subject))
+            self.subjects = [(subject, subject_counts[subject]) for subject in SUBJECTS if subject in subject_counts]
+
+        self.search_terms = SEARCH_TERMS
+        user_pages = max(1, options["users"] // 10)
+        self.user_pages = [max(1, user_pages * depth // 100) for depth in (10, 50, 90, 100)]
+
+    def logged_in(self, email):
+        from benchmarks.seed import PASSWORD
+
+        client = self.app.test_client()
+        response = client.post("/login", data={"email": email, "password": PASSWORD})
+        if response.status_code != 302:
+            raise click.ClickException(f"Could not log in as {email} ({response.status_code})")
+        return client
+
+    def search(self, i):
+        return self.anonymous.get("/papers", query_string={"q": self.search_terms[i % len(self.search_terms)]})
+
+    def deep_pages(self, i):
+        return self.anonymous.get("/papers", query_string={"cursor": self.cursors[i % len(self.cursors)]})
+
+    def deep_search(self, i):
+        # a subject search hits at least that subject's papers, 6 per page
+        subject, count = self.subjects[i % len(self.subjects)]
+        page = max(1, count // 6 * (50 + i * 7 % 50) // 100)
+        return self.anonymous.get("/papers", query_string={"q": subject, "page": page})
+
+    def dashboard(self, i):
+        return self.user.get("/dashboard")
+
+    def admin_dashboard(self, i):
+        return self.admin.get("/admin/dashboard", query_string={"user_page": self.user_pages[i % len(self.user_pages)]})
+
+    def upload(self, i):
+        body = b"%PDF-1.4\n" + f"benchmark upload {i}\n".encode() + self.rng.randbytes(self.options["upload_kb"] * 1024)
+        return self.user.post(
+            "/upload",
+            data={"title": f"Benchmark upload {i}", "subject": "Benchmarks", "year": "2024",
+                  "file": (io.BytesIO(body), f"upload-{i}.pdf")},
+            content_type="multipart/form-data",
+        )
+
+    def download(self, i):
+        return self.user.get(f"/download/{self.rng.choice(self.paper_ids)}")
+
+    def login(self, i):
+        from benchmarks.seed import PASSWORD, user_email
+
+        client = self.app.test_client()
+        email = user_email(i % max(self.options["users"], 1) + 1)
+        return client.post("/login", data={"email": email, "password": PASSWORD})
+
+
+EXPECTED = {
+    "search": {200}, "deep_pages": {200}, "deep_search": {200}, "dashboard": {200},
+    "admin_dashboard": {200}, "upload": {302}, "download": {200}, "login": {302},
+}
+
+
+# ------------------------------------------
+# Setup
+# ------------------------------------------
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+def make_app(workdir, options):
+    """A fresh app whose database and uploads live in workdir."""
+    # UPLOAD_PATH is taken from the working directory when `app` is imported
+    os.chdir(workdir)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "JOBS_MODE": "external",
+        "RATE_LIMIT_ENABLED": "0",
+        "RESPONSE_CACHE_ENABLED": "1" if options["response_cache"] else "0",
+        "FILE_STORE_BACKEND": "local",
+        "BCRYPT_LOG_ROUNDS": str(options["bcrypt_rounds"]),
+        "SQL_QUERY_BUDGET_STRICT": "0",
+    })
+    sys.path.insert(0, REPO_ROOT)
+    from app import create_app
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False, REMEMBER_COOKIE_SECURE=False)
+    return app
+
+
+@click.command()
+@click.option("--users", type=int, default=1000, show_default=True)
+@click.option("--papers", type=int, default=20000, show_default=True)
+@click.option("--files", type=int, default=200, show_default=True, help="Distinct stored files.")
+@click.option("--file-kb", type=int, default=64, show_default=True, help="Size of each stored file.")
+@click.option("--upload-kb", type=int, default=64, show_default=True, help="Size of each uploaded file.")
+@click.option("--iterations", type=int, default=200, show_default=True, help="Measured requests per scenario.")
+@click.option("--warmup", type=int, default=20, show_default=True, help="Unmeasured requests first.")
+@click.option("--seed", type=int, default=1, show_default=True)
+@click.option("--bcrypt-rounds", type=int, default=10, show_default=True, help="Cost of the seeded hashes.")
+@click.option("--response-cache", is_flag=True, help="Leave the anonymous response cache on.")
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(SCENARIOS), help="Only these (repeatable).")
+@click.option("--workdir", default=None, help="Scratch directory (default: a temp dir, removed afterwards).")
+@click.option("--output", "-o", default=None, help="Write JSON results here (default: stdout).")
+def main(users, papers, files, file_kb, upload_kb, iterations, warmup, seed, bcrypt_rounds,
+         response_cache, scenarios, workdir, output):
+    """Seed a scratch database and benchmark the main request paths."""
+    options = {
+        "users": users, "papers": papers, "files": files, "file_kb": file_kb, "upload_kb": upload_kb,
+        "iterations": iterations, "warmup": warmup, "seed": seed, "bcrypt_rounds": bcrypt_rounds,
+        "response_cache": response_cache,
+    }
+    output = os.path.abspath(output) if output else None
+    keep = workdir is not None
+    workdir = os.path.abspath(workdir) if keep else tempfile.mkdtemp(prefix="uni-papers-bench-")
+    if keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+
+    app = None
+    try:
+        app = make_app(workdir, options)
+        from benchmarks.seed import seed_database
+
+        started = time.perf_counter()
+        with app.app_context():
+            seed_database(users=users, papers=papers, files=files, file_kb=file_kb, seed=seed)
+        click.echo(f"Seeded {users} users, {papers} papers, {files} files in "
+                   f"{time.perf_counter() - started:.1f}s", err=True)
+
+        bench = Bench(app, options)
+        results = {}
+        for name in scenarios or SCENARIOS:
+            results[name] = measure(getattr(bench, name), iterations, warmup, EXPECTED[name])
+            r = results[name]
+            click.echo(
+                f"{name:16s} {r['throughput_rps']:9.1f} req/s  p50 {r['p50_ms']:8.2f} ms  "
+                f"p99 {r['p99_ms']:8.2f} ms  sql {r['sql_per_request']:5.1f}"
+                + (f"  ERRORS {r['errors']}" if r["errors"] else ""),
+                err=True,
+            )
+    finally:
+        os.chdir(REPO_ROOT)
+        if app is not None:
+            from app.utils.counters import flush_counters
+
+            with app.app_context():
+                flush_counters()  # or the exit-time flush finds the database gone
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit, dirty = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "flask": version("flask"),
+            "sqlalchemy": version("sqlalchemy"),
+            "sqlite": sqlite3.sqlite_version,
+            "options": options,
+        },
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+        click.echo(f"Results written to {output}", err=True)
+    else:
+        click.echo(text)
+    if any(r["errors"] for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/seed.py
+"""
+Synthetic data for the benchmark suite (see benchmarks/run.py).
+
+seed_database() fills an empty database with `users` users, `papers` papers
+and `files` distinct stored files shared between them (papers point at the
+files round-robin, like re-uploads of the same exam). Everything is drawn
+from random.Random(seed) and timestamps count back from a fixed date, so
+the same arguments always give the same rows, titles and file bytes - two
+commits benchmarked with the same settings see identical data.
+
+Rows go in with batched Core inserts, then the search index and subject/
+year facets are rebuilt the same way `flask search rebuild` and `flask
+facets rebuild` do.
+"""
+import hashlib
+import os
+import random
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Paper, StoredFile, User
+from app.utils.facets import rebuild_facets
+from app.utils.file_store import get_file_store
+from app.utils.passwords import hash_password
+from app.utils.search import get_search_backend
+from app.utils.storage import _temp_dir, shard_path
+
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "admin@bench.example.com"
+BASE_TIME = datetime(2024, 1, 1)
+INSERT_BATCH = 5000
+
+SUBJECTS = [
+    "Mathematics", "Physics", "Chemistry", "Biology", "Computer Science", "Economics",
+    "Accounting", "History", "Geography", "Literature", "Philosophy", "Psychology",
+    "Sociology", "Statistics", "Law", "Medicine", "Nursing", "Architecture",
+    "Civil Engineering", "Electrical Engineering", "Mechanical Engineering",
+    "Political Science", "Education", "Business Studies", "Agriculture",
+]
+TOPICS = [
+    "Calculus", "Algebra", "Mechanics", "Thermodynamics", "Organic", "Genetics",
+    "Algorithms", "Databases", "Networks", "Microeconomics", "Macroeconomics", "Auditing",
+    "Ancient", "Modern", "Climate", "Poetry", "Ethics", "Cognition", "Methods",
+    "Probability", "Contract", "Anatomy", "Pharmacology", "Design", "Structures",
+    "Circuits", "Materials", "Theory", "Curriculum", "Marketing", "Soil", "Optics",
+]
+KINDS = ["Final Exam", "Midterm", "Quiz", "Supplementary Exam", "Mock Exam", "Assignment"]
+
+# words a search benchmark can rely on hitting
+SEARCH_TERMS = ["calculus", "networks", "final", "midterm", "genetics", "theory", "design", "ethics"]
+
+
+def _file_bytes(rng, size):
+    return b"%PDF-1.4\n" + rng.randbytes(max(size - 9, 0))
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(db.insert(model), rows[start:start + INSERT_BATCH])
+
+
+def seed_database(users=1000, papers=20000, files=200, file_kb=64, seed=1):
+    """Create tables and fill them; needs an app context on an empty database."""
+    rng = random.Random(seed)
+    db.create_all()
+    password_hash = hash_password(PASSWORD)  # one bcrypt call, shared by every account
+
+    user_rows = [{
+        "username": "admin", "email": ADMIN_EMAIL, "password_hash": password_hash,
+        "role": "admin", "active": True, "is_banned": False, "created_at": BASE_TIME,
+    }]
+    for number in range(1, users + 1):
+        user_rows.append({
+            "username": f"user{number}", "email": user_email(number), "password_hash": password_hash,
+            "role": "user", "active": True, "is_banned": False,
+            "created_at": BASE_TIME - timedelta(hours=number),
+        })
+    _insert(User, user_rows)
+
+    store = get_file_store()
+    stored = []
+    for _ in range(max(files, 1)):
+        body = _file_bytes(rng, file_kb * 1024)
+        digest = hashlib.sha256(body).hexdigest()
+        path = shard_path(digest, ".pdf")
+        temp_path = os.path.join(_temp_dir(), digest)
+        with open(temp_path, "wb") as fh:
+            fh.write(body)
+        store.put(temp_path, path)
+        stored.append({"sha256": digest, "path": path, "size": len(body), "ref_count": 0, "created_at": BASE_TIME})
+
+    paper_rows = []
+    uploaded_at = BASE_TIME
+    for number in range(papers):
+        subject = rng.choice(SUBJECTS)
+        stored_file = stored[number % len(stored)]
+        stored_file["ref_count"] += 1
+        uploaded_at -= timedelta(minutes=rng.randint(1, 30))
+        paper_rows.append({
+            "title": f"{rng.choice(TOPICS)} {rng.choice(KINDS)} {number}",
+            "subject": subject,
+            "year": str(rng.randint(2005, 2024)) if rng.random() > 0.05 else None,
+            "file_path": stored_file["path"],
+            "file_hash": stored_file["sha256"],
+            "original_filename": f"paper-{number}.pdf",
+            "uploaded_at": uploaded_at,
+            "user_id": rng.randint(2, users + 1) if users else 1,
+            "text_status": "unsupported",
+        })
+    _insert(StoredFile, stored)
+    _insert(Paper, paper_rows)
+
+    get_search_backend().rebuild()
+    rebuild_facets()
+    db.session.commit()
+
+
+def user_email(number):
+    return f"user{number}@bench.example.com"
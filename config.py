@@ -1,6 +1,64 @@
 import os
+from datetime import timedelta
+
 
 class Config:
-    SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret")
-    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///dev.db")
+    """Settings shared by every profile (APP_CONFIG picks one, see CONFIGS)."""
+
+    SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_key")
+
+    # Primary database; MySQL in production (see .env.example)
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///site.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO") == "1"
+
+    # Connection pool (see app/utils/database.py; pool sizes don't apply to SQLite)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))            # connections kept open per process
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))     # extra ones under load
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))     # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # keep below MySQL's wait_timeout
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"  # test connections before use
+
+    # Read replica for listing pages; empty = everything on the primary
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+    DATABASE_REPLICA_STICKY_SECONDS = 5  # after a write, that browser reads from the primary
+
+    # Security & session settings
+    SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SECURE = True        # requires HTTPS
+    SESSION_COOKIE_SAMESITE = "Lax"
+
+    REMEMBER_COOKIE_HTTPONLY = True
+    REMEMBER_COOKIE_SECURE = True       # requires HTTPS
+
+    PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    # plain http on localhost
+    SESSION_COOKIE_SECURE = False
+    REMEMBER_COOKIE_SECURE = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv("TEST_DATABASE_URL", "sqlite:///test.db")
+    DATABASE_REPLICA_URL = os.getenv("TEST_DATABASE_REPLICA_URL", "")
+    WTF_CSRF_ENABLED = False
+    SESSION_COOKIE_SECURE = False
+    REMEMBER_COOKIE_SECURE = False
+
+
+class ProductionConfig(Config):
+    SECRET_KEY = os.getenv("SECRET_KEY")  # required; create_app refuses to start without it
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+
+CONFIGS = {
+    "default": Config,
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+    "production": ProductionConfig,
+}
@@ -0,0 +1,40 @@
+"""Add paper full-text search index
+
+Revision ID: 8aba9e7926c0
+Revises: 4982f7ad772d
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8aba9e7926c0'
+down_revision = '4982f7ad772d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts "
+            "USING fts5(title, subject, year, tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO papers_fts (rowid, title, subject, year) "
+            "SELECT id, title, subject, COALESCE(year, '') FROM papers"
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        op.create_index('ix_papers_fulltext', 'papers', ['title', 'subject', 'year'],
+                        unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS papers_fts")
+    elif dialect in ('mysql', 'mariadb'):
+        op.drop_index('ix_papers_fulltext', table_name='papers')
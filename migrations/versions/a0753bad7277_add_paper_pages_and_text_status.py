@@ -0,0 +1,69 @@
+"""Add paper_pages and text extraction status
+
+Revision ID: a0753bad7277
+Revises: 8aba9e7926c0
+Create Date: 2026-10-18 10:02:11.540391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0753bad7277'
+down_revision = '8aba9e7926c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    with op.batch_alter_table('papers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_status', sa.String(length=20), nullable=False, server_default='pending'))
+        batch_op.add_column(sa.Column('text_error', sa.String(length=255), nullable=True))
+
+    op.create_table('paper_pages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('paper_id', sa.Integer(), nullable=False),
+    sa.Column('page_number', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['paper_id'], ['papers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('paper_id', 'page_number', name='uq_paper_pages_paper_page')
+    )
+
+    if dialect == 'sqlite':
+        # FTS5 tables can't gain columns; recreate with a body column for file text
+        op.execute("DROP TABLE IF EXISTS papers_fts")
+        op.execute(
+            "CREATE VIRTUAL TABLE papers_fts "
+            "USING fts5(title, subject, year, body, tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO papers_fts (rowid, title, subject, year, body) "
+            "SELECT id, title, subject, COALESCE(year, ''), '' FROM papers"
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        op.create_index('ix_paper_pages_fulltext', 'paper_pages', ['text'],
+                        unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS papers_fts")
+        op.execute(
+            "CREATE VIRTUAL TABLE papers_fts "
+            "USING fts5(title, subject, year, tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO papers_fts (rowid, title, subject, year) "
+            "SELECT id, title, subject, COALESCE(year, '') FROM papers"
+        )
+
+    op.drop_table('paper_pages')
+    with op.batch_alter_table('papers', schema=None) as batch_op:
+        batch_op.drop_column('text_error')
+        batch_op.drop_column('text_status')